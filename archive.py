@@ -0,0 +1,184 @@
+# archive.py  (fieldnote-lab-bot)
+# 目的：
+# - 締まった月（今月より前）の predict / result / shadow の JSON を、月ごとに1つの zip（output/archive/{yyyymm}.zip）へまとめる
+#   ・zip の中央ディレクトリ＝オフセット索引なので、1ファイルだけ取り出すのに全体を展開しない
+#   ・まとめたら元のファイルは消す（中身を読み戻して一致を確かめてから）
+#   → 90日で消していた履歴を全部残したまま、ファイル数もバイト数も減らす
+# - 読む側（history / history_store / result_all_today）は exists / read_bytes / list_names を通すだけで
+#   バラのファイルと zip の中を区別しない（パスは元のまま "output/result_20260125_31.json"）
+#
+# 使い方：
+#   python archive.py                          # 今月より前の月をまとめる（ワークフローが毎回呼ぶ）
+#   ARCHIVE_BEFORE=202609 python archive.py    # この月より前をまとめる
+#   ARCHIVE_DRY=1 python archive.py            # 予定だけ表示
+
+import os, re, zipfile
+from datetime import datetime
+from pathlib import Path
+
+OUTPUT_DIR = os.environ.get("OUTPUT_DIR", "output")
+ARCHIVE_SUBDIR = "archive"
+ARCHIVE_BEFORE = os.environ.get("ARCHIVE_BEFORE", "").strip()
+ARCHIVE_DRY = os.environ.get("ARCHIVE_DRY", "").strip() == "1"
+
+NAME_RE = re.compile(r"^(?:predict|result|shadow|shadow_result)_(\d{8})_\d+\.json$")
+
+# zip ごとの中身の索引（プロセス内キャッシュ。zip の mtime が変わったら読み直す）
+_INDEX = {}
+
+
+def archive_dir(out_dir: str = None) -> Path:
+    return Path(out_dir or OUTPUT_DIR) / ARCHIVE_SUBDIR
+
+def bundle_path(yyyymm: str, out_dir: str = None) -> Path:
+    return archive_dir(out_dir) / f"{yyyymm}.zip"
+
+def _index(zp: Path) -> dict:
+    """zip -> {member 名: ZipInfo}"""
+    mt = zp.stat().st_mtime
+    hit = _INDEX.get(zp)
+    if hit and hit[0] == mt:
+        return hit[1]
+    with zipfile.ZipFile(zp) as z:
+        idx = {i.filename: i for i in z.infolist()}
+    _INDEX[zp] = (mt, idx)
+    return idx
+
+def _locate(path):
+    """バラに無いファイル -> (zip, member 名)。どこにも無ければ None"""
+    p = Path(path)
+    m = NAME_RE.match(p.name)
+    if not m:
+        return None
+    zp = p.parent / ARCHIVE_SUBDIR / f"{m.group(1)[:6]}.zip"
+    if zp.is_file() and p.name in _index(zp):
+        return zp, p.name
+    return None
+
+
+# =========================
+# 読む（バラ → zip の順）
+# =========================
+def exists(path) -> bool:
+    return Path(path).is_file() or _locate(path) is not None
+
+def read_bytes(path) -> bytes:
+    p = Path(path)
+    if p.is_file():
+        return p.read_bytes()
+    loc = _locate(p)
+    if loc is None:
+        raise FileNotFoundError(str(path))
+    with zipfile.ZipFile(loc[0]) as z:
+        return z.read(loc[1])
+
+def read_text(path, encoding: str = "utf-8") -> str:
+    return read_bytes(path).decode(encoding)
+
+def stat(path):
+    """return: (mtime, size)。zip の中なら記録された日時とサイズ"""
+    p = Path(path)
+    if p.is_file():
+        st = p.stat()
+        return st.st_mtime, st.st_size
+    loc = _locate(p)
+    if loc is None:
+        raise FileNotFoundError(str(path))
+    i = _index(loc[0])[loc[1]]
+    return datetime(*i.date_time).timestamp(), i.file_size
+
+def list_names(out_dir: str = None, prefix: str = "") -> list:
+    """out_dir のバラ＋ zip の中から prefix で始まる名前（重複なし・名前順）"""
+    out_dir = out_dir or OUTPUT_DIR
+    names = {p.name for p in Path(out_dir).glob(f"{prefix}*.json")}
+    ad = archive_dir(out_dir)
+    if ad.is_dir():
+        for zp in sorted(ad.glob("*.zip")):
+            names.update(n for n in _index(zp) if n.startswith(prefix))
+    return sorted(names)
+
+
+# =========================
+# まとめる
+# =========================
+def plan(out_dir: str = None, before: str = None) -> dict:
+    """return: yyyymm -> [バラのファイル]（before より前の月だけ）"""
+    out_dir = out_dir or OUTPUT_DIR
+    before = before or datetime.now().strftime("%Y%m")
+    months = {}
+    for p in sorted(Path(out_dir).iterdir()):
+        m = NAME_RE.match(p.name)
+        if m and m.group(1)[:6] < before and p.is_file():
+            months.setdefault(m.group(1)[:6], []).append(p)
+    return months
+
+def member_names(zp: Path) -> list:
+    return sorted(_index(Path(zp)))
+
+def read_member(zp: Path, name: str) -> bytes:
+    with zipfile.ZipFile(zp) as z:
+        return z.read(name)
+
+def replace_members(zp: Path, new: dict):
+    """
+    zip の中身を足す / 差し替える（new: 名前 -> Path か bytes。既存の zip の残りは引き継ぐ）
+    一時ファイルに書いて読み戻し、一致を確かめてから置き換える
+    """
+    zp = Path(zp)
+    zp.parent.mkdir(parents=True, exist_ok=True)
+    tmp = zp.with_name(zp.name + ".tmp")
+    data = {n: (v if isinstance(v, bytes) else Path(v).read_bytes()) for n, v in new.items()}
+
+    with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=9) as zt:
+        if zp.is_file():
+            with zipfile.ZipFile(zp) as zo:
+                for i in zo.infolist():
+                    if i.filename not in data:
+                        zt.writestr(i, zo.read(i.filename))
+        for name in sorted(data):
+            v = new[name]
+            if isinstance(v, bytes):
+                zt.writestr(zipfile.ZipInfo(name, datetime.now().timetuple()[:6]), v, compress_type=zipfile.ZIP_DEFLATED)
+            else:
+                zt.write(v, arcname=name)
+
+    with zipfile.ZipFile(tmp) as zt:
+        bad = zt.testzip()
+        if bad is not None:
+            tmp.unlink()
+            raise RuntimeError(f"archive verify failed: {tmp} member={bad}")
+        for name, b in data.items():
+            if zt.read(name) != b:
+                tmp.unlink()
+                raise RuntimeError(f"archive verify failed: {name}")
+
+    os.replace(tmp, zp)
+    _INDEX.pop(zp, None)
+
+def pack_month(yyyymm: str, files, out_dir: str = None) -> int:
+    """
+    1か月分を zip に足す（既存の zip があれば中身を引き継いで作り直す。同名は新しい方）→ バラを消す
+    return: 足したファイル数
+    """
+    new = {p.name: p for p in files}
+    replace_members(bundle_path(yyyymm, out_dir), new)
+    for p in new.values():
+        p.unlink()
+    return len(new)
+
+
+def main():
+    months = plan(before=ARCHIVE_BEFORE or None)
+    if not months:
+        print("[INFO] archive: nothing to pack")
+        return
+    for ym, files in sorted(months.items()):
+        size = sum(p.stat().st_size for p in files)
+        if ARCHIVE_DRY:
+            print(f"  {ym}: files={len(files)} bytes={size:,}")
+            continue
+        n = pack_month(ym, files)
+        print(f"[OK] {bundle_path(ym).as_posix()}: +{n} files ({size:,} -> {bundle_path(ym).stat().st_size:,} bytes)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+# backtest_sweep.py  (fieldnote-lab-bot)
+# 目的：
+# - SP_W / KB_W / JOCKEY_W / NORM_METHOD / SCORE_SCALE / スキップ閾値 / 混戦度パラメータを
+#   output/ の履歴（predict × result）で一括評価する（グリッド or ランダムサーチ、プロセス並列）
+# - 指標：的中率（上位5に1-3着が全部）/ ◎勝率 / 注目レース三連複BOX回収率 / 全レースBOX回収率
+#   → 全体・開催場別・月別
+#
+# データの扱い：
+# - predict に全頭ブロック "field" があるレース → compute_scores_new と同じ計算で全頭を再スコア（exact）
+# - 古いレース（field なし）→ 上位5頭の保存済み z から再合成して上位5の中で並べ替えるだけ（approx）
+#   ・上位5の顔ぶれは変わらない / NORM_METHOD=robust やスキップ閾値は評価できない（対象外）
+#   ・1月の一部ファイルは当時の重み/算式が違うので、現行設定でも保存済み score と完全一致はしない
+# - スキップ閾値は「実際に出力されたレース」を絞る方向にしか効かない（当時スキップしたレースは履歴に無い）
+#
+# 使い方：
+#   python backtest_sweep.py
+#   SWEEP_MODE=random SWEEP_N=5000 SWEEP_SPEC='{"SP_W":[0,2],"KB_W":[0,1.5],"JOCKEY_W":[0,0.6]}' python backtest_sweep.py
+#   SWEEP_SPEC=sweep_spec.json SWEEP_OBJECTIVE=focus_roi python backtest_sweep.py
+
+import os, json, time, random, itertools
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+import predict_all_today as P
+import batch_scoring as B
+import history
+
+SWEEP_MODE = os.environ.get("SWEEP_MODE", "grid").strip().lower()      # grid / random
+SWEEP_SPEC = os.environ.get("SWEEP_SPEC", "").strip()                    # JSON文字列 or JSONファイル
+SWEEP_N = int(os.environ.get("SWEEP_N", "1000"))                         # random の試行数
+SWEEP_SEED = int(os.environ.get("SWEEP_SEED", "42"))
+SWEEP_WORKERS = int(os.environ.get("SWEEP_WORKERS", "0")) or (os.cpu_count() or 1)
+SWEEP_OBJECTIVE = os.environ.get("SWEEP_OBJECTIVE", "hit_rate").strip()  # hit_rate / win_rate / focus_roi / box_roi
+SWEEP_MIN_RACES = int(os.environ.get("SWEEP_MIN_RACES", "200"))          # これ未満の評価レース数は順位付けしない
+SWEEP_DETAIL_TOP = int(os.environ.get("SWEEP_DETAIL_TOP", "20"))         # 開催場別・月別を出す上位件数
+SWEEP_LEGACY = os.environ.get("SWEEP_LEGACY", "1").strip() != "0"       # field なしの古いレースも使う
+SWEEP_OUT = os.environ.get("SWEEP_OUT", "sweep_result.json")
+DATE_FROM = os.environ.get("DATE_FROM", "").strip() or None
+DATE_TO = os.environ.get("DATE_TO", "").strip() or None
+
+BET_UNIT = int(os.environ.get("BET_UNIT", "100"))
+BOX_N = 5
+BOX_POINTS = 10  # 5頭BOX = C(5,3)
+
+# スイープできるパラメータと既定値（= predict の現在値）
+PARAM_DEFAULTS = {
+    "SP_W": P.SCORING.sp_w,
+    "KB_W": P.SCORING.kb_w,
+    "JOCKEY_W": P.SCORING.jockey_w,
+    "NORM_METHOD": P.SCORING.norm_method,
+    "SCORE_SCALE": P.SCORING.score_scale,
+    "KONSEN_GAP12_MID": P.SCORING.konsen_gap12_mid,
+    "KONSEN_GAP15_MID": P.SCORING.konsen_gap15_mid,
+    "KONSEN_FOCUS_TH": P.SCORING.konsen_focus_th,
+    "FLAT_INDEX_RANGE_MAX": P.FLAT_INDEX_RANGE_MAX if P.SKIP_FLAT_INDEX else -1.0,
+    "FLAT_INDEX_MIN_COUNT": P.FLAT_INDEX_MIN_COUNT,
+    "MIN_KB_COUNT": P.MIN_KB_COUNT if P.SKIP_LOW_SIGNAL else 0,
+    "MIN_SP_COUNT": P.MIN_SP_COUNT if P.SKIP_LOW_SIGNAL else 0,
+    "MIN_VALID_RATIO": P.MIN_VALID_RATIO if P.SKIP_LOW_SIGNAL else 0.0,
+    "FLAT_SCORE_RANGE_MAX": P.SCORING.flat_score_range_max,
+}
+
+DEFAULT_GRID = {
+    "SP_W": [0.6, 0.8, 1.0, 1.2, 1.5],
+    "KB_W": [0.25, 0.5, 0.75, 1.0],
+    "JOCKEY_W": [0.0, 0.1, 0.2, 0.3],
+    "NORM_METHOD": ["z", "robust"],
+}
+
+
+# =========================
+# データセット（1回だけ作って各プロセスに配る）
+# =========================
+def build_dataset(races):
+    """
+    races: list[HistRace]
+    return: dict of numpy arrays  （R = レース数, N = 最大頭数）
+    """
+    exact_idx = [i for i, h in enumerate(races) if h.field]
+    legacy_idx = [i for i, h in enumerate(races) if not h.field and len(h.pick_umaban) >= 5]
+    if not SWEEP_LEGACY:
+        legacy_idx = []
+    use = exact_idx + legacy_idx
+    sub = [races[i] for i in use]
+    R = len(sub)
+    n_exact = len(exact_idx)
+
+    field_rows = [P.runners_from_field(races[i].field) for i in exact_idx]
+    # predict が開催場 SP モデルを使っていたレースは同じ係数で再現する
+    pools = [P.SpPool(**races[i].sp_pool) if races[i].sp_pool else None for i in exact_idx]
+    N = max([len(r) for r in field_rows] + [BOX_N])
+
+    uma = np.zeros((R, N), dtype=np.int16)
+    mask = np.zeros((R, N), dtype=bool)
+    sp_f = np.zeros((R, N))
+    kb_f = np.zeros((R, N))
+    z = {m: {k: np.zeros((R, N)) for k in ("sp", "kb", "j")} for m in ("z", "robust")}
+    norm_ok = {"z": np.zeros(R, dtype=bool), "robust": np.zeros(R, dtype=bool)}
+
+    # スキップ判定の材料（exact のみ）
+    n_run = np.zeros(R, dtype=np.int16)
+    kb_valid = np.zeros(R, dtype=np.int16)
+    sp_valid = np.zeros(R, dtype=np.int16)
+    kb_range = np.full(R, np.inf)
+    maiden = np.zeros(R, dtype=bool)
+
+    if n_exact:
+        packed = B.pack_races(field_rows)
+        n0 = packed["mask"].shape[1]
+        for m in ("z", "robust"):
+            feat = B.prepare_batch(packed, norm_method=m, pools=pools)
+            z[m]["sp"][:n_exact, :n0] = feat["z_sp"]
+            z[m]["kb"][:n_exact, :n0] = feat["z_kb"]
+            z[m]["j"][:n_exact, :n0] = feat["z_j"]
+            norm_ok[m][:n_exact] = True
+            sp_f[:n_exact, :n0] = feat["sp_filled"]
+            kb_f[:n_exact, :n0] = feat["kb_filled"]
+        mask[:n_exact, :n0] = packed["mask"]
+        for i, rows in enumerate(field_rows):
+            uma[i, :len(rows)] = [r.umaban for r in rows]
+            kbs = [r.base_index for r in rows if r.base_index is not None]
+            n_run[i] = len(rows)
+            kb_valid[i] = len(kbs)
+            sp_valid[i] = sum(1 for r in rows if r.sp_raw is not None)
+            if len(kbs) >= 1:
+                kb_range[i] = max(kbs) - min(kbs)
+            maiden[i] = P.is_maiden_like(sub[i].race_name)
+
+    for k, h in enumerate(sub[n_exact:]):
+        i = n_exact + k
+        m = "robust" if h.norm_method == "robust" else "z"
+        for j in range(BOX_N):
+            uma[i, j] = h.pick_umaban[j]
+            mask[i, j] = True
+            zs, zk, zj = h.pick_z[j]
+            z[m]["sp"][i, j], z[m]["kb"][i, j], z[m]["j"][i, j] = zs, zk, zj
+            sp_f[i, j] = float(h.pick_sp[j] or 0.0)
+            kb_f[i, j] = float(h.pick_kb[j] or 0.0)
+        norm_ok[m][i] = True
+
+    # 結果
+    top3 = np.zeros((R, 3), dtype=np.int16)
+    for i, h in enumerate(sub):
+        top3[i] = h.top3[:3]
+    K = max([len(h.trio_rows) for h in sub] + [1])
+    trio = np.zeros((R, K, 3), dtype=np.int16)
+    trio_pay = np.zeros((R, K))
+    for i, h in enumerate(sub):
+        for k, (t, pay) in enumerate(h.trio_rows):
+            trio[i, k] = t
+            trio_pay[i, k] = pay
+
+    tracks = sorted({h.place for h in sub})
+    months = sorted({h.month for h in sub})
+    t_id = {t: i for i, t in enumerate(tracks)}
+    m_id = {m: i for i, m in enumerate(months)}
+
+    return {
+        "uma": uma, "mask": mask, "sp_f": sp_f, "kb_f": kb_f,
+        "z": z, "norm_ok": norm_ok,
+        "exact": np.arange(R) < n_exact,
+        "n_run": n_run, "kb_valid": kb_valid, "sp_valid": sp_valid, "kb_range": kb_range, "maiden": maiden,
+        "top3": top3, "trio": trio, "trio_pay": trio_pay,
+        "track": np.array([t_id[h.place] for h in sub], dtype=np.int16),
+        "month": np.array([m_id[h.month] for h in sub], dtype=np.int16),
+        "tracks": tracks, "months": months,
+        "n_exact": n_exact, "n_legacy": R - n_exact,
+    }
+
+
+# =========================
+# 1設定の評価（全レースまとめて）
+# =========================
+def _konsen(top_scores, gap12_mid, gap15_mid):
+    gap12 = np.maximum(0.0, top_scores[:, 0] - top_scores[:, 1])
+    gap15 = np.maximum(0.0, top_scores[:, 0] - top_scores[:, 4])
+    sc12 = 1.0 / (1.0 + gap12 / max(1e-9, gap12_mid))
+    sc15 = 1.0 / (1.0 + gap15 / max(1e-9, gap15_mid))
+    w12, w15 = P.SCORING.konsen_w12, P.SCORING.konsen_w15
+    return np.round(100.0 * np.clip(w12 * sc12 + w15 * sc15, 0.0, 1.0), 1)
+
+def evaluate_config(D, cfg):
+    method = "robust" if cfg["NORM_METHOD"] == "robust" else "z"
+    Z = D["z"][method]
+    w_sp, w_kb, w_j = float(cfg["SP_W"]), float(cfg["KB_W"]), float(cfg["JOCKEY_W"])
+    wsum = abs(w_sp) + abs(w_kb) + abs(w_j)
+    if wsum <= 1e-9:
+        wsum = 1.0
+    comb = (w_sp * Z["sp"] + w_kb * Z["kb"] + w_j * Z["j"]) / wsum
+    score = B._round2(float(P.SCORING.score_base) + float(cfg["SCORE_SCALE"]) * comb)   # predict と同じ丸め（.xx5 の境界）
+    score = np.where(D["mask"], score, -np.inf)
+
+    # 並び：score → SP → KB → 馬番（predict と同じ）
+    order = np.lexsort((D["uma"], -D["kb_f"], -D["sp_f"], -score), axis=-1)
+    top_uma = np.take_along_axis(D["uma"], order[:, :BOX_N], axis=1)
+    top_sc = np.take_along_axis(score, order[:, :BOX_N], axis=1)
+
+    # --- 対象レース（スキップ判定は exact のみ）---
+    valid = D["norm_ok"][method].copy()
+    ex = D["exact"]
+    n = np.maximum(D["n_run"], 1)
+    kb_ratio = D["kb_valid"] / n
+    low = (D["maiden"] & (D["kb_valid"] < cfg["MIN_KB_COUNT"])) \
+        | (D["maiden"] & (D["sp_valid"] < cfg["MIN_SP_COUNT"])) \
+        | ((kb_ratio < cfg["MIN_VALID_RATIO"]) & (D["kb_valid"] < cfg["MIN_KB_COUNT"]))
+    flat_idx = (D["kb_valid"] >= cfg["FLAT_INDEX_MIN_COUNT"]) & (D["kb_range"] <= cfg["FLAT_INDEX_RANGE_MAX"])
+    sc_all = np.where(D["mask"], score, np.nan)
+    flat_sc = (np.nanmax(sc_all, axis=1) - np.nanmin(sc_all, axis=1)) <= cfg["FLAT_SCORE_RANGE_MAX"]
+    skip = ex & (low | (D["n_run"] < 5) | flat_idx | flat_sc)
+    valid &= ~skip
+    valid &= D["mask"].sum(axis=1) >= BOX_N
+
+    # --- 的中 / ◎勝ち / BOX払戻 ---
+    in5 = (D["top3"][:, :, None] == top_uma[:, None, :]).any(axis=2)        # (R,3)
+    hit = in5.all(axis=1)
+    win = top_uma[:, 0] == D["top3"][:, 0]
+    trio_in = (D["trio"][:, :, :, None] == top_uma[:, None, None, :]).any(axis=3).all(axis=2)  # (R,K)
+    payout = (np.where(trio_in, D["trio_pay"], 0.0).sum(axis=1) * (BET_UNIT / 100.0))
+
+    konsen = _konsen(top_sc, cfg["KONSEN_GAP12_MID"], cfg["KONSEN_GAP15_MID"])
+    focus = konsen >= cfg["KONSEN_FOCUS_TH"]
+
+    inv = BOX_POINTS * BET_UNIT
+    cols = {
+        "races": valid,
+        "hits": valid & hit,
+        "wins": valid & win,
+        "focus_races": valid & focus,
+        "focus_hits": valid & focus & (payout > 0),
+        "focus_payout": np.where(valid & focus, payout, 0.0),
+        "box_payout": np.where(valid, payout, 0.0),
+    }
+
+    def summarize(sel=None, groups=None, labels=None):
+        if groups is None:
+            agg = {k: float(v.sum()) for k, v in cols.items()}
+            return _rates(agg, inv)
+        out = {}
+        G = len(labels)
+        sums = {k: np.bincount(groups, weights=v.astype(float), minlength=G) for k, v in cols.items()}
+        for g, lab in enumerate(labels):
+            agg = {k: float(sums[k][g]) for k in cols}
+            if agg["races"] > 0:
+                out[lab] = _rates(agg, inv)
+        return out
+
+    return {
+        "overall": summarize(),
+        "by_track": lambda: summarize(groups=D["track"], labels=D["tracks"]),
+        "by_month": lambda: summarize(groups=D["month"], labels=D["months"]),
+    }
+
+def _rates(agg, inv):
+    r = agg["races"]
+    fr = agg["focus_races"]
+    return {
+        "races": int(r),
+        "hit_rate": round(agg["hits"] / r * 100.0, 2) if r else None,
+        "win_rate": round(agg["wins"] / r * 100.0, 2) if r else None,
+        "box_roi": round(agg["box_payout"] / (r * inv) * 100.0, 1) if r else None,
+        "focus_races": int(fr),
+        "focus_hit_rate": round(agg["focus_hits"] / fr * 100.0, 2) if fr else None,
+        "focus_roi": round(agg["focus_payout"] / (fr * inv) * 100.0, 1) if fr else None,
+        "focus_profit": int(agg["focus_payout"] - fr * inv),
+    }
+
+
+# =========================
+# 並列実行
+# =========================
+_D = None
+
+def _init_worker(D):
+    global _D
+    _D = D
+
+def _eval_chunk(cfgs):
+    out = []
+    for cfg in cfgs:
+        res = evaluate_config(_D, cfg)
+        out.append({"params": cfg, "overall": res["overall"]})
+    return out
+
+def _eval_detail(cfg):
+    res = evaluate_config(_D, cfg)
+    return {"params": cfg, "overall": res["overall"], "by_track": res["by_track"](), "by_month": res["by_month"]()}
+
+
+# =========================
+# パラメータ集合
+# =========================
+def load_spec():
+    if not SWEEP_SPEC:
+        return DEFAULT_GRID
+    txt = SWEEP_SPEC if SWEEP_SPEC.startswith("{") else Path(SWEEP_SPEC).read_text(encoding="utf-8")
+    spec = json.loads(txt)
+    unknown = [k for k in spec if k not in PARAM_DEFAULTS]
+    if unknown:
+        raise SystemExit(f"[FATAL] unknown sweep params: {unknown} (known={list(PARAM_DEFAULTS)})")
+    return spec
+
+def param_sets(spec):
+    keys = list(spec.keys())
+    if SWEEP_MODE == "random":
+        rnd = random.Random(SWEEP_SEED)
+        out = []
+        for _ in range(SWEEP_N):
+            cfg = dict(PARAM_DEFAULTS)
+            for k in keys:
+                v = spec[k]
+                # [lo, hi]（数値2つ）→ 一様 / それ以外 → 候補から選ぶ
+                if len(v) == 2 and all(isinstance(x, (int, float)) for x in v) and not isinstance(PARAM_DEFAULTS[k], int):
+                    cfg[k] = round(rnd.uniform(float(v[0]), float(v[1])), 4)
+                else:
+                    cfg[k] = rnd.choice(v)
+            out.append(cfg)
+        return out
+
+    out = []
+    for combo in itertools.product(*[spec[k] for k in keys]):
+        cfg = dict(PARAM_DEFAULTS)
+        cfg.update(dict(zip(keys, combo)))
+        out.append(cfg)
+    return out
+
+def _objective(row):
+    o = row["overall"]
+    if o["races"] < SWEEP_MIN_RACES:
+        return float("-inf")
+    v = o.get(SWEEP_OBJECTIVE)
+    return float(v) if v is not None else float("-inf")
+
+def main():
+    t0 = time.perf_counter()
+    races = history.load_history(date_from=DATE_FROM, date_to=DATE_TO)
+    D = build_dataset(races)
+    t1 = time.perf_counter()
+    print(f"[INFO] history races={len(races)} exact={D['n_exact']} legacy(top5 approx)={D['n_legacy']} "
+          f"tracks={len(D['tracks'])} months={len(D['months'])} load={t1 - t0:.1f}s")
+
+    cfgs = param_sets(load_spec())
+    print(f"[INFO] sweep mode={SWEEP_MODE} sets={len(cfgs)} workers={SWEEP_WORKERS} objective={SWEEP_OBJECTIVE}")
+
+    chunk = max(1, len(cfgs) // (SWEEP_WORKERS * 8) or 1)
+    chunks = [cfgs[i:i + chunk] for i in range(0, len(cfgs), chunk)]
+    rows = []
+    if SWEEP_WORKERS <= 1:
+        _init_worker(D)
+        for c in chunks:
+            rows += _eval_chunk(c)
+        top = sorted(rows, key=_objective, reverse=True)[:SWEEP_DETAIL_TOP]
+        details = [_eval_detail(r["params"]) for r in top]
+    else:
+        with ProcessPoolExecutor(max_workers=SWEEP_WORKERS, initializer=_init_worker, initargs=(D,)) as ex:
+            for part in ex.map(_eval_chunk, chunks):
+                rows += part
+            top = sorted(rows, key=_objective, reverse=True)[:SWEEP_DETAIL_TOP]
+            details = list(ex.map(_eval_detail, [r["params"] for r in top]))
+    t2 = time.perf_counter()
+
+    rows.sort(key=_objective, reverse=True)
+    base = evaluate_config(D, dict(PARAM_DEFAULTS))["overall"]
+
+    print(f"[INFO] evaluated {len(rows)} sets in {t2 - t1:.1f}s")
+    print(f"[INFO] current  : {base}")
+    for r in rows[:10]:
+        p = {k: v for k, v in r["params"].items() if v != PARAM_DEFAULTS.get(k)}
+        print(f"  {SWEEP_OBJECTIVE}={r['overall'].get(SWEEP_OBJECTIVE)}  {r['overall']}  changed={p}")
+
+    out = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "mode": SWEEP_MODE,
+        "objective": SWEEP_OBJECTIVE,
+        "date_from": DATE_FROM,
+        "date_to": DATE_TO,
+        "races": {"exact": D["n_exact"], "legacy_top5_approx": D["n_legacy"]},
+        "defaults": PARAM_DEFAULTS,
+        "current": base,
+        "results": rows,
+        "top_detail": details,
+        "elapsed_sec": round(t2 - t0, 2),
+    }
+    Path(SWEEP_OUT).write_text(json.dumps(out, ensure_ascii=False, indent=1), encoding="utf-8")
+    print(f"[OK] wrote {SWEEP_OUT}")
+
+if __name__ == "__main__":
+    main()
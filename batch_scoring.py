@@ -0,0 +1,305 @@
+# batch_scoring.py  (fieldnote-lab-bot)
+# 目的：
+# - predict_all_today.compute_scores_new と「完全に同じ結果」を、複数レースまとめて NumPy で出す
+# - 1日分 / バックテスト全期間のレースを (レース数 R × 最大頭数 N) の配列に詰め、欠損はマスクで持つ
+# - 重みスイープ用に「補完＋Z化（重みに依存しない部分）」と「重み付き合成」を分けてある
+#
+# 一致のための注意：
+# - 合計は Python の sum と同じ「左から順に足す」順序で列方向にループする（N<=18 なので軽い）
+#   np.sum のペアワイズ加算だと最終桁がズレて round(…, 2) が変わることがあるため
+# - 二乗は x ** 2（libm の pow）に合わせて np.float_power を使う（x * x とは最終桁が違うことがある）
+# - 小数2桁の丸めは Python の round と同じ結果になるよう、境界付近だけ round で確定させる
+#
+# 使い方（例）：
+#   feat = prepare_batch(races_rows)                      # races_rows: [[Runner, ...], ...]
+#   scores = combine_scores(feat, sp_w=1.0, kb_w=0.5, jockey_w=0.2)   # (R, N) の score（小数2桁）
+#   重み等の既定値は P.SCORING（本番の ScoringConfig）。cfg= で影モデルの設定も渡せる
+
+import math
+
+import numpy as np
+
+import predict_all_today as P
+
+
+# =========================
+# 詰め込み（list[list[Runner]] -> 配列＋マスク）
+# =========================
+def pack_races(races_rows):
+    """
+    races_rows: レースごとの rows（compute_scores_new に渡すのと同じ形）
+    return: dict(kb, kb_mask, sp, sp_mask, sp_prev, prev_mask, jockey, mask, n)  いずれも (R, N)
+    """
+    R = len(races_rows)
+    N = max((len(rows) for rows in races_rows), default=0)
+
+    kb = np.zeros((R, N), dtype=np.float64)
+    sp = np.zeros((R, N), dtype=np.float64)
+    prev = np.zeros((R, N), dtype=np.float64)
+    jk = np.zeros((R, N), dtype=np.float64)
+    kb_mask = np.zeros((R, N), dtype=bool)
+    sp_mask = np.zeros((R, N), dtype=bool)
+    prev_mask = np.zeros((R, N), dtype=bool)
+    mask = np.zeros((R, N), dtype=bool)
+
+    for i, rows in enumerate(races_rows):
+        for j, r in enumerate(rows):
+            mask[i, j] = True
+            v = r.base_index
+            if v is not None and not math.isnan(v):
+                kb[i, j] = float(v)
+                kb_mask[i, j] = True
+            s = r.sp_raw
+            if s is not None and not math.isnan(s):
+                sp[i, j] = float(s)
+                sp_mask[i, j] = True
+            s = r.sp_prev
+            if s is not None and not math.isnan(s):
+                prev[i, j] = float(s)
+                prev_mask[i, j] = True
+            jk[i, j] = float(r.jockey_add)
+
+    return {
+        "kb": kb, "kb_mask": kb_mask,
+        "sp": sp, "sp_mask": sp_mask,
+        "sp_prev": prev, "prev_mask": prev_mask,
+        "jockey": jk, "mask": mask,
+        "n": mask.sum(axis=1),
+    }
+
+
+# =========================
+# マスク付きの統計（行ごと）
+# =========================
+def _seq_sum(x, m):
+    # Python の sum(...) と同じ順序で足す（先頭から）
+    acc = np.zeros(x.shape[0], dtype=np.float64)
+    for j in range(x.shape[1]):
+        acc = np.where(m[:, j], acc + x[:, j], acc)
+    return acc
+
+def _pow2(x):
+    # Python の (v - m) ** 2 と同じ値（np.square / x * x だと最終桁がズレることがある）
+    return np.float_power(x, 2.0)
+
+def _round2(v):
+    # np.round は 100倍してから丸めるので、ちょうど .xx5 付近で Python の round とズレる
+    # → 境界付近の要素だけ Python の round で確定させる
+    out = np.round(v, 2)
+    frac = np.abs(np.abs(v * 100.0) % 1.0 - 0.5)
+    near = np.isfinite(v) & (frac < 1e-6)
+    if near.any():
+        out[near] = [round(float(x), 2) for x in v[near]]
+    return out
+
+def _masked_median(x, m):
+    # 欠損は +inf にして並べる → 行ごとの有効数から中央の位置を取る
+    cnt = m.sum(axis=1)
+    xs = np.sort(np.where(m, x, np.inf), axis=1)
+    R = x.shape[0]
+    rows = np.arange(R)
+    hi = np.clip(cnt // 2, 0, max(0, x.shape[1] - 1))
+    lo = np.clip(cnt // 2 - 1, 0, max(0, x.shape[1] - 1))
+    if x.shape[1] == 0:
+        return np.zeros(R), cnt > 0
+    v_hi = xs[rows, hi]
+    v_lo = xs[rows, lo]
+    med = np.where(cnt % 2 == 1, v_hi, (v_lo + v_hi) / 2.0)
+    return np.where(cnt > 0, med, 0.0), cnt > 0
+
+def _masked_upper_median(x, m):
+    # estimate_sp_factory の sorted(...)[n // 2]（偶数でも上側を取る）
+    cnt = m.sum(axis=1)
+    xs = np.sort(np.where(m, x, np.inf), axis=1)
+    if x.shape[1] == 0:
+        return np.zeros(x.shape[0])
+    idx = np.clip(cnt // 2, 0, x.shape[1] - 1)
+    v = xs[np.arange(x.shape[0]), idx]
+    return np.where(cnt > 0, v, 0.0)
+
+def _masked_min_max(x, m, default_lo, default_hi):
+    has = m.any(axis=1)
+    lo = np.where(has, np.min(np.where(m, x, np.inf), axis=1, initial=np.inf), default_lo)
+    hi = np.where(has, np.max(np.where(m, x, -np.inf), axis=1, initial=-np.inf), default_hi)
+    return lo, hi
+
+
+# =========================
+# 1) 欠損補完（KB中央値 / SP推定器）
+# =========================
+def fill_batch(packed, pool=None):
+    """
+    pool: 開催場 SP モデル（P.SpPool）をレースごとに並べた配列 dict（pool_arrays で作る）。None なら使わない
+    """
+    kb, kb_mask = packed["kb"], packed["kb_mask"]
+    sp, sp_mask = packed["sp"], packed["sp_mask"]
+    mask = packed["mask"]
+
+    kb_med, _ = _masked_median(kb, kb_mask)
+    kb_filled = np.where(kb_mask, kb, kb_med[:, None])
+    kb_filled = np.where(mask, kb_filled, 0.0)
+
+    # --- SP推定器（estimate_sp_factory と同じ分岐）---
+    pair = sp_mask & kb_mask
+    n_pair = pair.sum(axis=1)
+    kb_min, kb_max = _masked_min_max(kb, kb_mask, 0.0, 1.0)
+    sp_min_obs, sp_max_obs = _masked_min_max(sp, pair, 50.0, 75.0)
+
+    # 線形回帰（3点以上）
+    n_safe = np.maximum(n_pair, 1).astype(np.float64)
+    mx = _seq_sum(kb, pair) / n_safe
+    my = _seq_sum(sp, pair) / n_safe
+    dx = kb - mx[:, None]
+    dy = sp - my[:, None]
+    denom = _seq_sum(_pow2(dx), pair)
+    cov = _seq_sum(dx * dy, pair)
+    has_linear = (n_pair >= 3) & (denom != 0)
+    a = np.where(has_linear, cov / np.where(denom != 0, denom, 1.0), 0.0)
+    b = my - a * mx
+
+    x = kb_filled
+    est_lin = np.clip(a[:, None] * x + b[:, None], (sp_min_obs - 2.0)[:, None], (sp_max_obs + 2.0)[:, None])
+
+    # 中央値オフセット（1点以上）
+    sp_med_p = _masked_upper_median(sp, pair)
+    kb_med_p = _masked_upper_median(kb, pair)
+    est_off = np.clip(x + (sp_med_p - kb_med_p)[:, None], 45.0, 78.0)
+
+    # ペアなし：KBの min-max から 55〜70 に割り付け
+    span = kb_max - kb_min
+    t = (x - kb_min[:, None]) / np.where(span != 0, span, 1.0)[:, None]
+    est_ramp = np.where((span == 0)[:, None], 62.0, np.clip(55.0 + t * 15.0, 45.0, 78.0))
+
+    est = np.where(has_linear[:, None], est_lin,
+                   np.where((n_pair >= 1)[:, None], est_off, est_ramp))
+
+    # 開催場モデルとのブレンド（estimate_sp_factory の sp_pool 分岐と同じ式）
+    if pool is not None:
+        pa = pool["a"]
+        off = np.where(n_pair > 0, _seq_sum(sp - pa[:, None] * kb, pair) / n_safe, pool["b"])
+        nk = n_pair + pool["k"]
+        w = np.where(nk > 0, n_pair / np.where(nk > 0, nk, 1.0), 1.0)
+        v_pool = np.maximum(pool["lo"][:, None], np.minimum(pool["hi"][:, None], pa[:, None] * x + off[:, None]))
+        blended = np.where((w <= 0)[:, None], v_pool, w[:, None] * est + (1.0 - w)[:, None] * v_pool)
+        est = np.where(pool["has"][:, None], blended, est)
+
+    # 前走までの SP（horse_index）があれば推定より優先
+    if "prev_mask" in packed:
+        est = np.where(packed["prev_mask"], packed["sp_prev"], est)
+    sp_filled = np.where(sp_mask, sp, est)
+    sp_filled = np.where(mask, sp_filled, 0.0)
+    return kb_filled, sp_filled
+
+
+def pool_arrays(pools):
+    """pools: レースごとの P.SpPool（None 可）のリスト -> fill_batch 用の配列 dict"""
+    R = len(pools)
+    out = {k: np.zeros(R) for k in ("a", "b", "lo", "hi", "k")}
+    out["has"] = np.zeros(R, dtype=bool)
+    for i, sp in enumerate(pools):
+        if sp is None:
+            continue
+        out["has"][i] = True
+        for k in ("a", "b", "lo", "hi", "k"):
+            out[k][i] = float(getattr(sp, k))
+    return out
+
+
+# =========================
+# 2) Z化（z / robust）
+# =========================
+def zscore_batch(x, mask, method="z"):
+    cnt = mask.sum(axis=1)
+    if method == "robust":
+        med, _ = _masked_median(x, mask)
+        dev = np.abs(x - med[:, None])
+        mad, _ = _masked_median(dev, mask)
+        mad = np.where(mad > 1e-9, mad, 1.0)
+        scale = 1.4826 * mad
+        scale = np.where(scale <= 1e-9, 1.0, scale)
+        center = med
+    else:
+        n = np.maximum(cnt, 1).astype(np.float64)
+        mu = _seq_sum(x, mask) / n
+        var = _seq_sum(_pow2(x - mu[:, None]), mask) / np.maximum(1, cnt - 1).astype(np.float64)
+        sd = np.where(var > 0, np.sqrt(np.where(var > 0, var, 1.0)), 1.0)
+        scale = np.where(sd <= 1e-9, 1.0, sd)
+        center = mu
+
+    # 全部欠損のレースは 0 / scale=1（zscore_values と同じ）
+    center = np.where(cnt > 0, center, 0.0)
+    scale = np.where(cnt > 0, scale, 1.0)
+    z = np.where(mask, (x - center[:, None]) / scale[:, None], 0.0)
+    return z
+
+
+# =========================
+# まとめ：重みに依存しない特徴量
+# =========================
+def prepare_batch(races_rows, norm_method=None, pools=None):
+    """
+    races_rows: list[list[Runner]]  （compute_scores_new と同じ row）
+    pools: レースごとの P.SpPool（None 可）のリスト。None なら開催場モデルなし
+    return: dict(z_sp, z_kb, z_j, sp_filled, kb_filled, mask, n)
+    """
+    method = (norm_method or P.SCORING.norm_method)
+    method = "robust" if method == "robust" else "z"
+
+    packed = races_rows if isinstance(races_rows, dict) else pack_races(races_rows)
+    mask = packed["mask"]
+    kb_filled, sp_filled = fill_batch(packed, pool_arrays(pools) if pools is not None else None)
+
+    return {
+        "z_sp": zscore_batch(sp_filled, mask, method),
+        "z_kb": zscore_batch(kb_filled, mask, method),
+        "z_j": zscore_batch(packed["jockey"], mask, method),
+        "sp_filled": sp_filled,
+        "kb_filled": kb_filled,
+        "mask": mask,
+        "n": packed["n"],
+        "norm_method": method,
+    }
+
+def combine_z(feat, sp_w=None, kb_w=None, jockey_w=None, cfg=None):
+    cfg = cfg or P.SCORING
+    sp_w = cfg.sp_w if sp_w is None else float(sp_w)
+    kb_w = cfg.kb_w if kb_w is None else float(kb_w)
+    jockey_w = cfg.jockey_w if jockey_w is None else float(jockey_w)
+
+    wsum = abs(sp_w) + abs(kb_w) + abs(jockey_w)
+    if wsum <= 1e-9:
+        wsum = 1.0
+    return (sp_w * feat["z_sp"] + kb_w * feat["z_kb"] + jockey_w * feat["z_j"]) / wsum
+
+def combine_scores(feat, sp_w=None, kb_w=None, jockey_w=None, score_base=None, score_scale=None, cfg=None):
+    """return: (R, N) の score（小数2桁・パディング部分は NaN）"""
+    cfg = cfg or P.SCORING
+    base = cfg.score_base if score_base is None else float(score_base)
+    scale = cfg.score_scale if score_scale is None else float(score_scale)
+    comb = combine_z(feat, sp_w, kb_w, jockey_w, cfg=cfg)
+    score = _round2(base + scale * comb)
+    return np.where(feat["mask"], score, np.nan)
+
+def compute_scores_batch(races_rows, debug=False, cfg=None, pools=None):
+    """
+    compute_scores_new のバッチ版（cfg: ScoringConfig。None なら本番設定）
+    Runner に base_index_filled / sp_filled / z_* / score を埋めて races_rows をそのまま返す
+    """
+    cfg = cfg or P.SCORING
+    feat = prepare_batch(races_rows, norm_method=cfg.norm_method, pools=pools)
+    comb = combine_z(feat, cfg=cfg)
+    score = combine_scores(feat, cfg=cfg)
+
+    for i, rows in enumerate(races_rows):
+        for j, r in enumerate(rows):
+            r.base_index_filled = float(feat["kb_filled"][i, j])
+            r.sp_filled = float(feat["sp_filled"][i, j])
+            r.z_sp = float(feat["z_sp"][i, j])
+            r.z_kb = float(feat["z_kb"][i, j])
+            r.z_jockey = float(feat["z_j"][i, j])
+            r.z_combined = float(comb[i, j])
+            r.score = float(score[i, j])
+
+    if debug:
+        print(f"[DEBUG] batch scored races={len(races_rows)} max_n={feat['mask'].shape[1]}")
+    return races_rows
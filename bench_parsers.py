@@ -0,0 +1,267 @@
+# bench_parsers.py  (fieldnote-lab-bot)
+# 目的：
+# - 全パーサ（NAR table.html / table.php / 吉馬fp / kaisekisya / RaceMarkTable / RefundMoneyList）を
+#   チェックイン済みの実ページ（bench/corpus/）で回して「ゴールデン出力と一致するか」を確認する
+# - あわせて parser ごとの pages/sec と peak memory を計測し、JSON で書き出す（before/after 比較用）
+#
+# 使い方：
+#   python bench_parsers.py                                  # 検証＋計測（結果は BENCH_OUT へ）
+#   BENCH_RECORD=1 DATE=20260822 TRACKS=佐賀,高知 python bench_parsers.py   # 実ページを取得して corpus に保存
+#   BENCH_UPDATE_GOLDEN=1 python bench_parsers.py            # パーサ仕様を変えた時だけ：golden を作り直す
+#   BENCH_COMPARE=bench_before.json python bench_parsers.py  # 以前の結果JSONと pages/sec を比較（既定は bench/baseline.json）
+#
+# corpus の置き方：bench/corpus/<parser>/<name>.html と、同名の <name>.golden.json
+#   ・実ページ = BENCH_RECORD で取った本番のページ（{date}_{baba}_{R}.html など）。pages/sec と peak memory はこれだけで測る
+#   ・fixture_*.html は手で作った崩れ方の例（見出しの分割・同着・表なし など）。golden の照合だけで、計測には入れない
+#   ・golden を書くのは BENCH_UPDATE_GOLDEN=1 の時だけ。golden の無いページ・実ページの無いパーサは失敗（exit 1）
+#   ・bench/baseline.json = 実ページを取った時の結果 JSON（BENCH_COMPARE の既定の比較先）
+#   実ページの取り直しは Actions の mode=bench（DATE / TRACKS を指定。取得→golden→baseline を書いて bench/ をコミット）
+
+import os, json, time, tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import predict_all_today as P
+import result_all_today as R
+
+CORPUS_DIR = Path(os.environ.get("BENCH_CORPUS", "bench/corpus"))
+BENCH_OUT = os.environ.get("BENCH_OUT", "bench_output.json")
+BENCH_REPEAT = int(os.environ.get("BENCH_REPEAT", "5"))
+BENCH_BASELINE = os.environ.get("BENCH_BASELINE", "bench/baseline.json")
+BENCH_COMPARE = os.environ.get("BENCH_COMPARE", "").strip()
+BENCH_RECORD = os.environ.get("BENCH_RECORD", "").strip() == "1"
+BENCH_UPDATE_GOLDEN = os.environ.get("BENCH_UPDATE_GOLDEN", "").strip() == "1"
+DEBUG = os.environ.get("DEBUG", "").strip() == "1"
+
+
+# =========================
+# パーサ定義（corpus のディレクトリ名 -> 実行関数）
+# 出力は golden 比較のため JSON 化できる形にそろえる
+# =========================
+def _nar_rows_json(rows):
+    return [{"umaban": r.umaban, "name": r.name, "jockey": r.jockey, "avg_index": r.base_index} for r in rows]
+
+def _run_nar_tablehtml(html: str):
+    return {
+        "rows": _nar_rows_json(P.parse_nar_rows_text_fallback(html)),
+        "race_name": P.parse_nar_race_name(html),
+    }
+
+def _run_nar_tablephp(html: str):
+    return {
+        "rows": _nar_rows_json(P.parse_nar_tablephp_rows(html)),
+        "race_name": P.parse_nar_race_name(html),
+    }
+
+def _run_kichiuma_fp(html: str):
+    sp_by, race_name = P.parse_kichiuma_sp(html)
+    return {
+        "sp_by_umaban": {str(k): v for k, v in sorted(sp_by.items())},
+        "race_name": race_name,
+    }
+
+def _run_kaisekisya(html: str):
+    stats = P.parse_kaisekisya_jockey_table(html)
+    return {"stats": {k: list(v) for k, v in stats.items()}}
+
+def _run_racemark(html: str):
+    return {
+        "top3": R.parse_top3_from_racemark(html),
+        "sanrenpuku_dom": R.parse_sanrenpuku_refunds_from_racemark_dom(html),
+    }
+
+def _run_refundmoney(html: str):
+    by_race = R.parse_refundmoney_sanrenpuku_by_race(html)
+    return {"sanrenpuku_by_race": {str(k): v for k, v in sorted(by_race.items())}}
+
+PARSERS = {
+    "nar_tablehtml": _run_nar_tablehtml,
+    "nar_tablephp": _run_nar_tablephp,
+    "kichiuma_fp": _run_kichiuma_fp,
+    "kaisekisya": _run_kaisekisya,
+    "racemark": _run_racemark,
+    "refundmoney": _run_refundmoney,
+}
+
+
+# =========================
+# corpus 収集（BENCH_RECORD=1）
+# =========================
+def _save_page(parser: str, name: str, html: str) -> bool:
+    if not html:
+        print(f"[SKIP] record {parser}/{name}: empty")
+        return False
+    d = CORPUS_DIR / parser
+    d.mkdir(parents=True, exist_ok=True)
+    (d / f"{name}.html").write_text(html, encoding="utf-8")
+    print(f"[OK] record {parser}/{name}.html  bytes={len(html.encode('utf-8'))}")
+    return True
+
+def record_corpus(yyyymmdd: str, tracks, race_nos=(1, 6, 12)):
+    for track in tracks:
+        baba = P.BABA_CODE.get(track)
+        if not baba:
+            print(f"[SKIP] record {track}: unknown track")
+            continue
+
+        url = P.KAISEKISYA_JOCKEY_URL.get(track, "")
+        if url:
+            _save_page("kaisekisya", f"{baba}", P.fetch(url, debug=DEBUG))
+
+        _save_page("refundmoney", f"{yyyymmdd}_{baba}", R.fetch(R.refundmoney_url(baba, yyyymmdd), debug=DEBUG))
+
+        for rno in race_nos:
+            name = f"{yyyymmdd}_{baba}_{rno:02d}"
+            _save_page("nar_tablehtml", name, P.fetch(P.nar_tablehtml_url(yyyymmdd, str(baba), str(rno)), debug=DEBUG))
+            _save_page("nar_tablephp", name, P.nar_tablephp_html(yyyymmdd, str(baba), str(rno), "1", debug=DEBUG))
+            _save_page("kichiuma_fp", name, P.fetch(P.build_kichiuma_fp_url(yyyymmdd, baba, rno), debug=DEBUG))
+            _save_page("racemark", name, R.fetch(R.build_racemark_url(baba, yyyymmdd, rno), debug=DEBUG))
+            time.sleep(0.1)
+
+
+# =========================
+# 検証＋計測
+# =========================
+def _canon(obj):
+    # tuple/list の違いなどを吸収して比較する
+    return json.loads(json.dumps(obj, ensure_ascii=False))
+
+def is_fixture(path: Path) -> bool:
+    return path.name.startswith("fixture_")
+
+def load_corpus():
+    corpus = {}
+    for parser in PARSERS:
+        d = CORPUS_DIR / parser
+        pages = []
+        if d.is_dir():
+            for p in sorted(d.glob("*.html")):
+                pages.append((p, p.read_text(encoding="utf-8")))
+        corpus[parser] = pages
+    return corpus
+
+def check_golden(parser: str, pages):
+    fn = PARSERS[parser]
+    failures = []
+    for path, html in pages:
+        got = _canon(fn(html))
+        gpath = path.with_name(path.name[:-len(".html")] + ".golden.json")
+        if BENCH_UPDATE_GOLDEN:
+            gpath.write_text(json.dumps(got, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+            print(f"[OK] golden written: {gpath}")
+            continue
+        if not gpath.exists():
+            failures.append(path.name)
+            print(f"[FAIL] {parser}/{path.name}: golden missing (BENCH_UPDATE_GOLDEN=1 to create)")
+            continue
+        want = json.loads(gpath.read_text(encoding="utf-8"))
+        if got != want:
+            failures.append(path.name)
+            print(f"[FAIL] {parser}/{path.name}: output differs from golden")
+            if DEBUG:
+                print(f"[DEBUG] want={json.dumps(want, ensure_ascii=False)[:400]}")
+                print(f"[DEBUG] got ={json.dumps(got, ensure_ascii=False)[:400]}")
+    return failures
+
+def measure(parser: str, pages, repeat: int):
+    fn = PARSERS[parser]
+    n_bytes = sum(len(html.encode("utf-8")) for _, html in pages)
+
+    # peak memory（1周だけ tracemalloc 下で回す：計測値が遅くなるので時間計測とは分ける）
+    tracemalloc.start()
+    for _, html in pages:
+        fn(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        for _, html in pages:
+            fn(html)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+
+    pps = (len(pages) / best) if best and best > 0 else None
+    return {
+        "pages": len(pages),
+        "bytes": n_bytes,
+        "best_sec": round(best, 6) if best is not None else None,
+        "pages_per_sec": round(pps, 2) if pps is not None else None,
+        "peak_mem_kb": round(peak / 1024.0, 1),
+    }
+
+def compare(results: dict, before_path: str):
+    try:
+        before = json.loads(Path(before_path).read_text(encoding="utf-8"))
+    except Exception as e:
+        print(f"[WARN] compare file read failed: {before_path} err={e}")
+        return
+    old = before.get("parsers", {})
+    print(f"[INFO] compare with {before_path} (generated_at={before.get('generated_at')})")
+    for parser, cur in results.items():
+        o = old.get(parser) or {}
+        a, b = o.get("pages_per_sec"), cur.get("pages_per_sec")
+        if a and b:
+            note = "" if o.get("pages") == cur.get("pages") else f"  (pages {o.get('pages')} -> {cur.get('pages')})"
+            print(f"  {parser:14s} pages/s {a:>10.1f} -> {b:>10.1f}  ({(b / a - 1.0) * 100.0:+.1f}%)"
+                  f"  peak_kb {o.get('peak_mem_kb')} -> {cur.get('peak_mem_kb')}{note}")
+        else:
+            print(f"  {parser:14s} (no comparable data)")
+
+def main():
+    if BENCH_RECORD:
+        yyyymmdd = os.environ.get("DATE") or datetime.now().strftime("%Y%m%d")
+        tracks = [x.strip() for x in os.environ.get("TRACKS", "").split(",") if x.strip()]
+        if not tracks:
+            raise SystemExit("[FATAL] BENCH_RECORD=1 needs TRACKS=門別,高知,...")
+        record_corpus(yyyymmdd, tracks)
+
+    corpus = load_corpus()
+    total_pages = sum(len(v) for v in corpus.values())
+    print(f"[INFO] corpus={CORPUS_DIR} pages={total_pages} repeat={BENCH_REPEAT}")
+    if total_pages == 0:
+        raise SystemExit(f"[FATAL] empty corpus: {CORPUS_DIR}")
+
+    results = {}
+    failed = {}
+    for parser, pages in corpus.items():
+        real = [x for x in pages if not is_fixture(x[0])]
+        if not pages:
+            failed[parser] = ["(no pages)"]
+            print(f"[FAIL] {parser}: no pages in corpus")
+            continue
+        gfails = check_golden(parser, pages)
+        fails = list(gfails)
+        if not real:
+            # 手作りの fixture だけでは本番ページの速さ・メモリにならない
+            fails.append("(no recorded pages)")
+            print(f"[FAIL] {parser}: no recorded pages (BENCH_RECORD=1 DATE=... TRACKS=... to record)")
+        if fails:
+            failed[parser] = fails
+        m = measure(parser, real, BENCH_REPEAT) if real else {"pages": 0}
+        m["fixtures"] = len(pages) - len(real)
+        m["golden_failures"] = len(gfails)
+        results[parser] = m
+        print(f"[BENCH] {parser:14s} pages={m['pages']:>3d} fixtures={m['fixtures']} pages/s={m.get('pages_per_sec')} "
+              f"peak_kb={m.get('peak_mem_kb')} golden={'NG' if gfails else 'OK'}")
+
+    out = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "corpus": str(CORPUS_DIR),
+        "repeat": BENCH_REPEAT,
+        "parsers": results,
+        "failures": failed,
+    }
+    Path(BENCH_OUT).write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"[OK] wrote {BENCH_OUT}")
+
+    before = BENCH_COMPARE or BENCH_BASELINE
+    if BENCH_COMPARE or (Path(before).is_file() and Path(before).resolve() != Path(BENCH_OUT).resolve()):
+        compare(results, before)
+
+    if failed:
+        raise SystemExit(f"[FATAL] bench check failed: {sum(len(v) for v in failed.values())} failure(s) in {sorted(failed)}")
+
+if __name__ == "__main__":
+    main()
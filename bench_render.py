@@ -0,0 +1,150 @@
+# bench_render.py  (fieldnote-lab-bot)
+# 目的：
+# - 1日分（その日の全開催場の predict / result）の HTML 描画（render.py）を計測する
+#   ・inline / class の両方で：1日あたりの ms、pages/sec、出力バイト数
+#   ・output/ に同じ日の HTML があれば、inline の描画がそれとバイト単位で一致するかも確認する
+# - 結果は JSON で書き出す（before/after 比較用。bench_parsers.py と同じ形）
+#
+# 使い方：
+#   python bench_render.py                                   # output/ で predict と result が両方あり、ページが一番多い日
+#   BENCH_DATE=20260301 python bench_render.py               # 日付を指定
+#   BENCH_COMPARE=bench_render_before.json python bench_render.py
+
+import os, json, time
+from datetime import datetime
+from pathlib import Path
+
+import archive
+import render as R
+import predict_all_today as P
+import result_all_today as RS
+
+OUTPUT_DIR = os.environ.get("OUTPUT_DIR", "output")
+BENCH_DATE = os.environ.get("BENCH_DATE", "").strip()
+BENCH_OUT = os.environ.get("BENCH_RENDER_OUT", "bench_render.json")
+BENCH_REPEAT = int(os.environ.get("BENCH_REPEAT", "20"))
+BENCH_COMPARE = os.environ.get("BENCH_COMPARE", "").strip()
+MODES = ("inline", "class")
+
+
+# =========================
+# 1日分のページ
+# =========================
+def busiest_date(out_dir: str = None) -> str:
+    """predict と result が両方ある日のうち、ページが一番多い日（同数なら新しい方。無ければ空）"""
+    days = {}
+    for name in archive.list_names(out_dir or OUTPUT_DIR):
+        parts = name[:-len(".json")].split("_")
+        if len(parts) == 3 and parts[0] in ("predict", "result"):
+            days.setdefault(parts[1], []).append(parts[0])
+    both = [(len(kinds), d) for d, kinds in days.items() if set(kinds) == {"predict", "result"}]
+    return max(both)[1] if both else ""
+
+def load_day(yyyymmdd: str, out_dir: str = None):
+    """return: [(kind, html のパス, 描画関数の引数)]（開催場ごと）"""
+    out_dir = out_dir or OUTPUT_DIR
+    pages = []
+    for kind in ("predict", "result"):
+        for name in archive.list_names(out_dir, f"{kind}_{yyyymmdd}_"):
+            d = json.loads(archive.read_text(Path(out_dir) / name))
+            html_path = Path(out_dir) / (name[:-len(".json")] + ".html")
+            if kind == "predict":
+                args = (d.get("title", ""), d.get("predictions") or [])
+            else:
+                args = (d.get("title", ""), d.get("races") or [], d.get("pnl_summary") or {})
+            pages.append((kind, html_path, args))
+    return pages
+
+def render_page(kind: str, args, mode: str) -> str:
+    if kind == "predict":
+        return R.render_predict(*args, konsen_enable=P.KONSEN_ENABLE, konsen_name=P.KONSEN_NAME, mode=mode)
+    return R.render_result(*args, konsen_name=RS.KONSEN_NAME, bet_unit=RS.BET_UNIT, box_n=RS.BET_BOX_N,
+                           race_name_fn=RS.clean_race_name, mode=mode)
+
+
+# =========================
+# 検証＋計測
+# =========================
+def check_golden(pages):
+    """inline の描画と output/ の HTML を比べる。return: (比べた数, 違ったファイル)"""
+    checked, failures = 0, []
+    for kind, html_path, args in pages:
+        if not html_path.is_file():
+            continue
+        checked += 1
+        if render_page(kind, args, "inline") != html_path.read_text(encoding="utf-8"):
+            failures.append(html_path.name)
+            print(f"[FAIL] {html_path.name}: render differs from file")
+    return checked, failures
+
+def measure(pages, mode: str, repeat: int):
+    out_bytes = sum(len(render_page(kind, args, mode).encode("utf-8")) for kind, _, args in pages)
+    best = None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        for kind, _, args in pages:
+            render_page(kind, args, mode)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return {
+        "pages": len(pages),
+        "bytes": out_bytes,
+        "best_ms_per_day": round(best * 1000.0, 3),
+        "pages_per_sec": round(len(pages) / best, 1) if best > 0 else None,
+    }
+
+def compare(results: dict, before_path: str, yyyymmdd: str):
+    try:
+        before = json.loads(Path(before_path).read_text(encoding="utf-8"))
+    except Exception as e:
+        print(f"[WARN] compare file read failed: {before_path} err={e}")
+        return
+    if before.get("date") != yyyymmdd:
+        print(f"[WARN] compare skipped: {before_path} is date={before.get('date')} (now {yyyymmdd}; set BENCH_DATE)")
+        return
+    old = before.get("modes", {})
+    print(f"[INFO] compare with {before_path} (generated_at={before.get('generated_at')} date={before.get('date')})")
+    for mode, cur in results.items():
+        o = old.get(mode) or {}
+        a, b = o.get("best_ms_per_day"), cur.get("best_ms_per_day")
+        if a and b:
+            print(f"  {mode:7s} ms/day {a:>9.2f} -> {b:>9.2f}  ({(b / a - 1.0) * 100.0:+.1f}%)"
+                  f"  bytes {o.get('bytes')} -> {cur.get('bytes')}")
+        else:
+            print(f"  {mode:7s} (no comparable data)")
+
+def main():
+    yyyymmdd = BENCH_DATE or busiest_date()
+    if not yyyymmdd:
+        raise SystemExit(f"[FATAL] no day with both predict and result json in {OUTPUT_DIR}")
+    pages = load_day(yyyymmdd)
+    print(f"[INFO] date={yyyymmdd} pages={len(pages)} "
+          f"(predict={sum(k == 'predict' for k, _, _ in pages)} result={sum(k == 'result' for k, _, _ in pages)}) repeat={BENCH_REPEAT}")
+
+    checked, failures = check_golden(pages)
+    print(f"[INFO] golden: checked={checked} failures={len(failures)}")
+
+    results = {}
+    for mode in MODES:
+        results[mode] = m = measure(pages, mode, BENCH_REPEAT)
+        print(f"[BENCH] {mode:7s} ms/day={m['best_ms_per_day']} pages/s={m['pages_per_sec']} bytes={m['bytes']:,}")
+
+    out = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "date": yyyymmdd,
+        "repeat": BENCH_REPEAT,
+        "modes": results,
+        "golden_checked": checked,
+        "golden_failures": failures,
+    }
+    Path(BENCH_OUT).write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"[OK] wrote {BENCH_OUT}")
+
+    if BENCH_COMPARE:
+        compare(results, BENCH_COMPARE, yyyymmdd)
+
+    if failures:
+        raise SystemExit(f"[FATAL] golden mismatch: {len(failures)} page(s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+# bet_simulator.py  (fieldnote-lab-bot)
+# 目的：
+# - output/result_*.json（そのまま）を全部読んで、三連複の買い方（戦略）を何通りでも一括で検証する
+#   ・BOX（上位N頭）/ ◎1頭軸流し（相手は上位M頭）/ ◎〇2頭軸流し（相手は上位M頭）
+#   ・混戦度の下限/上限、注目フラグ、開催場の絞り込み・除外、期間
+# - 指標：回収率 / 的中率 / 収支 / 最大ドローダウン / 資金曲線（日別）→ 戦略ごと（＋開催場別）
+#
+# 仕組み：
+# - 馬番を bit にして、各レースの「印（上位5頭）」と「確定した三連複の組（同着で複数あり）」を uint32 のマスクにする
+# - 戦略は (カバー範囲のマスク, 必須の軸マスク) に落ちる → 当たり = 組 ⊂ カバー かつ 軸 ⊂ 組
+#   （戦略 S × レース R × 払戻行 K をまとめてビット演算するだけなので全履歴でも一瞬）
+#
+# 注意：
+# - result JSON には上位5頭しか無いので、BOX6 など「6頭目以降」が要る戦略は評価できない（WARN を出して除外）
+# - 三連複の払戻行：注目レースは bet_box.sanrenpuku_rows（同着込み）、それ以外は表示用の1行（sanrenpuku）
+# - 結果/払戻が取れていないレースも「買った」扱い（本番の pnl_total と同じ数え方）。SIM_REQUIRE_SETTLED=1 で除外
+#
+# 使い方：
+#   python bet_simulator.py                          # 既定の戦略セット
+#   SIM_SPEC=strategies.json python bet_simulator.py # 戦略を JSON で指定（下の DEFAULT_STRATEGIES と同じ形）
+#   SIM_SPEC='[{"name":"axis1_m5_k40","type":"axis1","m":5,"konsen_min":40}]' python bet_simulator.py
+
+import os, json
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+import history
+
+SIM_SPEC = os.environ.get("SIM_SPEC", "").strip()
+SIM_OUT = os.environ.get("SIM_OUT", "sim_result.json")
+SIM_REQUIRE_SETTLED = os.environ.get("SIM_REQUIRE_SETTLED", "").strip() == "1"
+SIM_CURVE = os.environ.get("SIM_CURVE", "1").strip() != "0"        # 資金曲線（日別）を JSON に入れる
+SIM_BY_PLACE = os.environ.get("SIM_BY_PLACE", "1").strip() != "0"
+BANKROLL = int(os.environ.get("BANKROLL", "100000"))                # 資金曲線の初期資金（円）
+BET_UNIT = int(os.environ.get("BET_UNIT", "100"))
+DATE_FROM = os.environ.get("DATE_FROM", "").strip() or None
+DATE_TO = os.environ.get("DATE_TO", "").strip() or None
+
+MAX_PICKS = 5
+
+# 戦略の形：
+#   type: box（n 頭BOX）/ axis1（◎軸・相手は上位 m 頭）/ axis2（◎〇軸・相手は上位 m 頭）
+#   focus: true/false/null（注目フラグで絞る。null は絞らない）
+#   konsen_min / konsen_max: 混戦度の範囲（null は無制限）
+#   tracks / exclude_tracks: 開催場名のリスト
+DEFAULT_STRATEGIES = [
+    {"name": "box5_focus", "type": "box", "n": 5, "focus": True},
+    {"name": "box5_all", "type": "box", "n": 5},
+    {"name": "box4_all", "type": "box", "n": 4},
+    {"name": "box3_all", "type": "box", "n": 3},
+    {"name": "box4_focus", "type": "box", "n": 4, "focus": True},
+    {"name": "axis1_m5_all", "type": "axis1", "m": 5},
+    {"name": "axis1_m4_all", "type": "axis1", "m": 4},
+    {"name": "axis1_m5_focus", "type": "axis1", "m": 5, "focus": True},
+    {"name": "axis2_m5_all", "type": "axis2", "m": 5},
+    {"name": "box5_k20", "type": "box", "n": 5, "konsen_min": 20},
+    {"name": "box5_k40", "type": "box", "n": 5, "konsen_min": 40},
+    {"name": "box5_k50", "type": "box", "n": 5, "konsen_min": 50},
+    {"name": "box5_k_lt20", "type": "box", "n": 5, "konsen_max": 20},
+]
+
+
+# =========================
+# result 履歴 → マスク配列
+# =========================
+def _bit(u: int) -> int:
+    return 1 << int(u)  # 馬番 1〜18 → bit 1〜18（uint32 に収まる）
+
+def build_arrays(races):
+    R = len(races)
+    K = max([len(h.trio_rows) for h in races] + [1])
+
+    prefix = np.zeros((R, MAX_PICKS + 1), dtype=np.uint32)  # prefix[:, n] = 上位 n 頭のマスク
+    n_picks = np.zeros(R, dtype=np.int8)
+    trio = np.zeros((R, K), dtype=np.uint32)
+    pay = np.zeros((R, K), dtype=np.int64)
+    konsen = np.full(R, np.nan)
+    focus = np.zeros(R, dtype=bool)
+    settled = np.zeros(R, dtype=bool)
+
+    for i, h in enumerate(races):
+        m = 0
+        for j, u in enumerate(h.pick_umaban[:MAX_PICKS]):
+            m |= _bit(u)
+            prefix[i, j + 1] = m
+        n_picks[i] = min(MAX_PICKS, len(h.pick_umaban))
+        for k, (t, p) in enumerate(h.trio_rows):
+            trio[i, k] = _bit(t[0]) | _bit(t[1]) | _bit(t[2])
+            pay[i, k] = p
+        v = (h.konsen or {}).get("value")
+        if isinstance(v, (int, float)):
+            konsen[i] = float(v)
+        focus[i] = bool((h.konsen or {}).get("is_focus", False))
+        settled[i] = bool(h.trio_rows) and h.has_result
+
+    places = sorted({h.place for h in races})
+    p_id = {p: i for i, p in enumerate(places)}
+    dates = sorted({h.date for h in races})
+    d_id = {d: i for i, d in enumerate(dates)}
+    return {
+        "prefix": prefix, "n_picks": n_picks, "trio": trio, "pay": pay,
+        "konsen": konsen, "focus": focus, "settled": settled,
+        "place": np.array([p_id[h.place] for h in races], dtype=np.int16),
+        "date": np.array([d_id[h.date] for h in races], dtype=np.int32),
+        "places": places, "dates": dates,
+    }
+
+
+# =========================
+# 戦略 → (カバー, 軸, 点数, 対象レース)
+# =========================
+def _points(st) -> int:
+    t = st["type"]
+    if t == "box":
+        n = int(st["n"])
+        return n * (n - 1) * (n - 2) // 6
+    m = int(st["m"])
+    if t == "axis1":
+        return (m - 1) * (m - 2) // 2
+    if t == "axis2":
+        return m - 2
+    raise ValueError(f"unknown strategy type: {t}")
+
+def _need(st) -> int:
+    return int(st["n"]) if st["type"] == "box" else int(st["m"])
+
+def validate(strategies):
+    ok = []
+    for st in strategies:
+        try:
+            need = _need(st)
+            pts = _points(st)
+        except (KeyError, ValueError, TypeError) as e:
+            print(f"[WARN] strategy skipped: {st.get('name')} ({e})")
+            continue
+        if need > MAX_PICKS:
+            print(f"[WARN] strategy skipped: {st.get('name')} needs top{need} (result JSON has top{MAX_PICKS} only)")
+            continue
+        if pts <= 0:
+            print(f"[WARN] strategy skipped: {st.get('name')} has no tickets")
+            continue
+        ok.append(st)
+    return ok
+
+def strategy_masks(D, strategies):
+    """return: cover (S,R) / axis (S,R) / eligible (S,R) / points (S,)"""
+    S, R = len(strategies), len(D["focus"])
+    cover = np.zeros((S, R), dtype=np.uint32)
+    axis = np.zeros((S, R), dtype=np.uint32)
+    elig = np.ones((S, R), dtype=bool)
+    points = np.zeros(S, dtype=np.int64)
+    places = D["places"]
+
+    for s, st in enumerate(strategies):
+        need = _need(st)
+        cover[s] = D["prefix"][:, need]
+        if st["type"] == "axis1":
+            axis[s] = D["prefix"][:, 1]
+        elif st["type"] == "axis2":
+            axis[s] = D["prefix"][:, 2]
+        points[s] = _points(st)
+
+        e = D["n_picks"] >= need
+        if st.get("focus") is not None:
+            e &= D["focus"] == bool(st["focus"])
+        if st.get("konsen_min") is not None:
+            e &= D["konsen"] >= float(st["konsen_min"])
+        if st.get("konsen_max") is not None:
+            e &= D["konsen"] < float(st["konsen_max"])
+        if st.get("tracks"):
+            e &= np.isin(D["place"], [places.index(p) for p in st["tracks"] if p in places])
+        if st.get("exclude_tracks"):
+            e &= ~np.isin(D["place"], [places.index(p) for p in st["exclude_tracks"] if p in places])
+        if SIM_REQUIRE_SETTLED:
+            e &= D["settled"]
+        elig[s] = e
+    return cover, axis, elig, points
+
+
+# =========================
+# 一括評価
+# =========================
+def simulate(D, strategies, bet_unit=BET_UNIT):
+    cover, axis, elig, points = strategy_masks(D, strategies)
+    trio, pay = D["trio"], D["pay"]
+
+    # (S, R, K)：組がカバーに収まり、軸を全部含む行が当たり
+    t = trio[None, :, :]
+    row_hit = (t != 0) & ((t & ~cover[:, :, None]) == 0) & ((t & axis[:, :, None]) == axis[:, :, None])
+    payout = (row_hit * pay[None, :, :]).sum(axis=2) * bet_unit // 100         # (S, R)
+    payout = np.where(elig, payout, 0)
+    invest = np.where(elig, points[:, None] * bet_unit, 0)                      # (S, R)
+    hit = elig & row_hit.any(axis=2)
+    profit = payout - invest
+
+    # 時系列（result_files は日付順 → レース順もそのまま）
+    cum = np.cumsum(profit, axis=1)
+    peak = np.maximum.accumulate(np.maximum(cum, 0), axis=1)
+    max_dd = (peak - cum).max(axis=1) if cum.shape[1] else np.zeros(len(strategies))
+
+    n_days = len(D["dates"])
+    out = []
+    for s, st in enumerate(strategies):
+        races = int(elig[s].sum())
+        inv = int(invest[s].sum())
+        pay_s = int(payout[s].sum())
+        rec = {
+            "name": st.get("name") or f"s{s}",
+            "strategy": st,
+            "points": int(points[s]),
+            "races": races,
+            "hits": int(hit[s].sum()),
+            "hit_rate": round(hit[s].sum() / races * 100.0, 2) if races else None,
+            "invest": inv,
+            "payout": pay_s,
+            "profit": pay_s - inv,
+            "roi": round(pay_s / inv * 100.0, 1) if inv else None,
+            "max_drawdown": int(max_dd[s]),
+            "min_bankroll": int(BANKROLL + min(0, int(cum[s].min()))) if cum.shape[1] else BANKROLL,
+        }
+        if SIM_CURVE:
+            daily = np.bincount(D["date"], weights=profit[s], minlength=n_days)
+            curve = BANKROLL + np.cumsum(daily)
+            rec["bankroll_curve"] = [[d, int(v)] for d, v in zip(D["dates"], curve)]
+        if SIM_BY_PLACE:
+            P = len(D["places"])
+            r_p = np.bincount(D["place"], weights=elig[s], minlength=P)
+            h_p = np.bincount(D["place"], weights=hit[s], minlength=P)
+            i_p = np.bincount(D["place"], weights=invest[s], minlength=P)
+            p_p = np.bincount(D["place"], weights=payout[s], minlength=P)
+            rec["by_place"] = {
+                D["places"][p]: {
+                    "races": int(r_p[p]),
+                    "hit_rate": round(h_p[p] / r_p[p] * 100.0, 1) if r_p[p] else None,
+                    "roi": round(p_p[p] / i_p[p] * 100.0, 1) if i_p[p] else None,
+                    "profit": int(p_p[p] - i_p[p]),
+                }
+                for p in range(P) if r_p[p]
+            }
+        out.append(rec)
+    return out
+
+def load_spec():
+    if not SIM_SPEC:
+        return DEFAULT_STRATEGIES
+    txt = SIM_SPEC if SIM_SPEC.startswith("[") else Path(SIM_SPEC).read_text(encoding="utf-8")
+    spec = json.loads(txt)
+    if not isinstance(spec, list):
+        raise SystemExit("[FATAL] SIM_SPEC must be a JSON list of strategies")
+    return spec
+
+
+def main():
+    t0 = datetime.now()
+    races = history.load_result_races(date_from=DATE_FROM, date_to=DATE_TO)
+    if not races:
+        raise SystemExit("[FATAL] no result history")
+    D = build_arrays(races)
+    strategies = validate(load_spec())
+    print(f"[INFO] races={len(races)} settled={int(D['settled'].sum())} days={len(D['dates'])} "
+          f"strategies={len(strategies)} bet_unit={BET_UNIT}")
+
+    res = simulate(D, strategies)
+    for r in res:
+        print(f"  {r['name']:16s} pts={r['points']:>2d} races={r['races']:>5d} hit={r['hit_rate']}% "
+              f"roi={r['roi']}% profit={r['profit']:+,} maxDD={r['max_drawdown']:,}")
+
+    out = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "date_from": DATE_FROM or (D["dates"][0] if D["dates"] else None),
+        "date_to": DATE_TO or (D["dates"][-1] if D["dates"] else None),
+        "races": len(races),
+        "bet_unit": BET_UNIT,
+        "bankroll": BANKROLL,
+        "require_settled": SIM_REQUIRE_SETTLED,
+        "results": res,
+    }
+    Path(SIM_OUT).write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"[OK] wrote {SIM_OUT}  ({(datetime.now() - t0).total_seconds():.1f}s)")
+
+if __name__ == "__main__":
+    main()
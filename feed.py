@@ -0,0 +1,204 @@
+# feed.py  (fieldnote-lab-bot)
+# 目的：
+# - その日の全開催場の predict / result を1つにまとめた output/feed_{yyyymmdd}.json を書く
+#   ・サイト / アプリ / ダッシュボードは1回取りに来れば1日分（開催場ごとの JSON を最大14個＋結果を回らない）
+#   ・中身は表示に要るものだけ（印・馬番・馬名・指数・騎手、混戦度、1〜3着、三連複、注目BOX、収支）
+#     出典URL・z・出走表（field）・重みの設定などは入れない。空白なしの1行 JSON
+#   ・etag = generated_at を除いた中身のハッシュ（outwrite.content_sha1）。中身が同じ間は変わらない
+#     → クライアントは etag を覚えておけば取り直すか決められる（latest_local_*.json とマニフェストにも載せる）
+#   ・FEED_GZIP=1 なら同じ中身の feed_{yyyymmdd}.json.gz も書く（mtime=0 なので中身が同じならバイトも同じ）
+# - predict / result の最後に write_day() を呼ぶ（どちらが先でも、その時点で出せている分をまとめ直す）
+#   開催場の一覧はマニフェストの ok の開催場（マニフェストが無い古い日は output/ とアーカイブの zip）
+#
+# 形：
+#   {"type": "fieldnote_feed", "schema_version", "date", "etag", "generated_at",
+#    "pnl": {その日の注目レース収支の合計}?,
+#    "tracks": [{"place", "baba", "place_code", "title", "races": [race], "pnl"?}]}
+#   race = {"race_no", "race_name", "konsen": {"name", "value", "is_focus"}, "prob"?,
+#           "picks": [{"mark", "umaban", "name", "score", "jockey", "prob"?, "form"?}],
+#           "result"?: {"top3": [{"rank", "umaban", "name"}], "pred_hit", "sanrenpuku"?, "bet_box"?}}
+#
+# 使い方：
+#   python feed.py 20260301     # その日の feed を作り直す（過去の日の作り直し用）
+
+import os, sys, json, gzip
+from datetime import datetime
+from pathlib import Path
+
+import archive
+import manifest as MF
+import outwrite as OW
+import schema as SC
+import tracks as T
+
+OUTPUT_DIR = os.environ.get("OUTPUT_DIR", "output")
+FEED_ENABLE = os.environ.get("FEED", "1").strip() != "0"
+FEED_GZIP = os.environ.get("FEED_GZIP", "0").strip() == "1"
+FEED_VERSION = 1
+
+PICK_KEYS = ("mark", "umaban", "name", "score", "jockey", "prob", "form")
+KONSEN_KEYS = ("name", "value", "is_focus")
+RESULT_KEYS = (("result_top3", "top3"), ("pred_hit", "pred_hit"), ("sanrenpuku", "sanrenpuku"), ("bet_box", "bet_box"))
+PNL_KEYS = ("focus_races", "hits", "invest", "payout", "profit")
+
+
+def feed_path(yyyymmdd: str, out_dir: str = None) -> Path:
+    return Path(out_dir or OUTPUT_DIR) / f"feed_{yyyymmdd}.json"
+
+def gz_path(yyyymmdd: str, out_dir: str = None) -> Path:
+    p = feed_path(yyyymmdd, out_dir)
+    return p.with_name(p.name + ".gz")
+
+
+# =========================
+# 集める
+# =========================
+def _sources(yyyymmdd: str, kind: str, out_dir: str) -> list:
+    """その日の kind の JSON パス（マニフェストの ok の開催場。マニフェストが無ければ output/ とアーカイブ）"""
+    if MF.load(yyyymmdd, out_dir) is not None:
+        return [t["json"] for t in MF.ok_tracks(yyyymmdd, kind, out_dir)]
+    return [(Path(out_dir) / n).as_posix() for n in archive.list_names(out_dir, f"{kind}_{yyyymmdd}_")]
+
+def _load(kind: str, path):
+    try:
+        d = json.loads(archive.read_text(path))
+    except Exception as e:
+        print(f"[WARN] feed: {kind} json read failed: {path} err={e}")
+        return None
+    return SC.upgrade(kind, d) if isinstance(d, dict) else None
+
+def _pick(p: dict) -> dict:
+    return {k: p[k] for k in PICK_KEYS if p.get(k) is not None}
+
+def _race(r: dict, picks_key: str) -> dict:
+    out = {
+        "race_no": int(r["race_no"]),
+        "race_name": r.get("race_name") or "",
+        "konsen": {k: v for k, v in (r.get("konsen") or {}).items() if k in KONSEN_KEYS},
+        "picks": [_pick(p) for p in r.get(picks_key) or []],
+    }
+    if r.get("prob"):
+        out["prob"] = r["prob"]
+    return out
+
+def _track(d: dict) -> dict:
+    t = T.get(d.get("place", ""))
+    return {
+        "place": d.get("place", ""),
+        "baba": t.baba if t else None,
+        "place_code": str(d.get("place_code", "")),
+        "title": d.get("title", ""),
+        "races": [],
+    }
+
+def build(yyyymmdd: str, out_dir: str = None):
+    """return: feed（predict も result も無ければ None）。etag / generated_at はまだ入れない"""
+    out_dir = out_dir or OUTPUT_DIR
+    by_place = {}
+
+    for path in _sources(yyyymmdd, "predict", out_dir):
+        d = _load("predict", path)
+        if not d:
+            continue
+        tr = by_place.setdefault(d.get("place", ""), _track(d))
+        tr["races"] = [_race(r, "picks") for r in d.get("predictions") or []]
+
+    pnl = {k: 0 for k in PNL_KEYS}
+    has_pnl = False
+    for path in _sources(yyyymmdd, "result", out_dir):
+        d = _load("result", path)
+        if not d:
+            continue
+        tr = by_place.get(d.get("place", ""))
+        if tr is None:
+            # predict が見つからない日（古いデータ）は result の予想上位5頭を使う
+            tr = by_place.setdefault(d.get("place", ""), _track(d))
+            tr["races"] = [_race(r, "pred_top5") for r in d.get("races") or []]
+        races = {r["race_no"]: r for r in tr["races"]}
+        for r in d.get("races") or []:
+            race = races.get(int(r["race_no"]))
+            if race is not None:
+                race["result"] = {dst: r[src] for src, dst in RESULT_KEYS if src in r}
+        if d.get("pnl_summary"):
+            tr["pnl"] = d["pnl_summary"]
+            has_pnl = True
+            for k in PNL_KEYS:
+                pnl[k] += int(d["pnl_summary"].get(k, 0) or 0)
+
+    if not by_place:
+        return None
+    tracks = sorted(by_place.values(), key=lambda x: (x["baba"] is None, x["baba"] or 0, x["place"]))
+    for tr in tracks:
+        tr["races"].sort(key=lambda r: r["race_no"])
+
+    feed = {"type": "fieldnote_feed", "schema_version": FEED_VERSION, "date": str(yyyymmdd)}
+    if has_pnl:
+        feed["pnl"] = pnl
+    feed["tracks"] = tracks
+    return feed
+
+
+# =========================
+# 書く（predict / result から）
+# =========================
+def dumps(feed: dict) -> str:
+    return json.dumps(feed, ensure_ascii=False, separators=(",", ":"))
+
+def write_day(yyyymmdd: str, out_dir: str = None, gz: bool = None):
+    """
+    feed_{yyyymmdd}.json（と .gz）を書く。中身が前回と同じなら書かない
+    return: {"json", "gz"?, "etag", "bytes", "changed"}（まとめるものが無ければ None）
+    """
+    gz = FEED_GZIP if gz is None else gz
+    feed = build(yyyymmdd, out_dir)
+    if feed is None:
+        return None
+
+    etag = OW.content_sha1(dumps(feed), ".json")
+    body = {"type": feed.pop("type"), "schema_version": feed.pop("schema_version"), "date": feed.pop("date"),
+            "etag": etag, "generated_at": datetime.now().isoformat(timespec="seconds")}
+    body.update(feed)
+    text = dumps(body)
+
+    path = feed_path(yyyymmdd, out_dir)
+    changed = OW.write_text(path, text)
+    info = {"json": path.as_posix(), "etag": etag, "bytes": len(text.encode("utf-8")), "changed": changed}
+    if gz:
+        gp = gz_path(yyyymmdd, out_dir)
+        data = path.read_bytes()
+        if not gp.is_file() or gzip.decompress(gp.read_bytes()) != data:
+            OW.write_atomic_bytes(gp, gzip.compress(data, compresslevel=9, mtime=0))
+        info["gz"] = gp.as_posix()
+    return info
+
+def update(yyyymmdd: str):
+    """
+    predict / result の最後に呼ぶ（FEED=0 なら何もしない。失敗しても本体の実行は止めない）
+    return: マニフェストに載せる {"json", "gz"?, "etag", "bytes"}（書けなければ None）
+    """
+    if not FEED_ENABLE:
+        return None
+    try:
+        info = write_day(yyyymmdd)
+    except Exception as e:
+        print(f"[WARN] feed failed: date={yyyymmdd} err={e}")
+        return None
+    if info is None:
+        return None
+    note = "" if info.pop("changed") else "  unchanged"
+    print(f"[OK] wrote {info['json']} (bytes={info['bytes']:,} etag={info['etag'][:12]}){note}")
+    return info
+
+
+def main():
+    args = sys.argv[1:]
+    if len(args) != 1 or not args[0].isdigit():
+        raise SystemExit("usage: python feed.py YYYYMMDD")
+    info = write_day(args[0])
+    if info is None:
+        raise SystemExit(f"[FATAL] nothing to feed for {args[0]} in {OUTPUT_DIR}")
+    note = "" if info["changed"] else "  unchanged"
+    print(f"[OK] wrote {info['json']} (bytes={info['bytes']:,} etag={info['etag'][:12]}){note}")
+
+if __name__ == "__main__":
+    main()
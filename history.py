@@ -0,0 +1,217 @@
+# history.py  (fieldnote-lab-bot)
+# 目的：
+# - output/ に溜まっている predict_*.json と result_*.json を「レース単位」で突き合わせて読む
+# - バックテスト / キャリブレーション / 学習など、オフライン分析の共通入口
+#
+# 1レース = HistRace（__slots__）
+# - predict 側：上位5頭（umaban / score / z）、全頭ブロック field（あれば）、混戦度
+# - result 側 ：1〜3着の馬番、三連複の払戻（同着で複数行あり得る）
+#
+# 読み先（HISTORY_SOURCE）
+# - db   ：history_store.py の SQLite に差分取り込みしてから引く（既定。期間・開催場で絞ると ms で返る）
+#         output/ が前回から変わっていなければ取り込みは stat だけ（CI は history.db を actions/cache で持ち回る）
+# - files：従来どおり JSON を全部読む（DB が使えない時もこちらに落ちる）
+
+import os, re, json
+from dataclasses import dataclass, field as dc_field
+from typing import Optional
+
+import archive
+import tracks
+
+OUTPUT_DIR = os.environ.get("OUTPUT_DIR", "output")
+HISTORY_SOURCE = os.environ.get("HISTORY_SOURCE", "db").strip().lower()
+
+
+@dataclass(slots=True)
+class HistRace:
+    date: str
+    place: str
+    race_no: int
+    race_name: str = ""
+    # predict（上位5頭：印順）
+    pick_umaban: list = dc_field(default_factory=list)
+    pick_score: list = dc_field(default_factory=list)
+    pick_z: list = dc_field(default_factory=list)      # [(z_sp, z_kb, z_jockey), ...]
+    pick_sp: list = dc_field(default_factory=list)
+    pick_kb: list = dc_field(default_factory=list)
+    norm_method: str = "z"
+    field: Optional[dict] = None                       # predict の "field"（全頭の入力）
+    sp_pool: Optional[dict] = None                     # predict の scoring.sp_model（使っていれば）
+    konsen: dict = dc_field(default_factory=dict)
+    # result
+    top3: list = dc_field(default_factory=list)        # 1〜3着の馬番（着順）
+    trio_rows: list = dc_field(default_factory=list)   # [((a,b,c), payout100), ...]
+
+    @property
+    def month(self) -> str:
+        return self.date[:6]
+
+    @property
+    def has_result(self) -> bool:
+        return len(self.top3) >= 3
+
+
+def _combo_tuple(combo: str):
+    nums = [int(x) for x in re.split(r"[-－―—]", str(combo or "")) if x.strip().isdigit()]
+    return tuple(sorted(nums)) if len(nums) == 3 else None
+
+def _trio_rows(race: dict):
+    rows = []
+    bet = race.get("bet_box") or {}
+    src = bet.get("sanrenpuku_rows") or []
+    if not src and isinstance(race.get("sanrenpuku"), dict):
+        src = [race["sanrenpuku"]]
+    seen = set()
+    for r in src:
+        t = _combo_tuple(r.get("combo"))
+        try:
+            pay = int(r.get("payout", 0) or 0)
+        except Exception:
+            continue
+        if t and t not in seen and pay > 0:
+            seen.add(t)
+            rows.append((t, pay))
+    return rows
+
+def _read_json(path):
+    try:
+        return json.loads(archive.read_text(path))
+    except Exception as e:
+        print(f"[WARN] history: read failed {path} err={e}")
+        return None
+
+def _in_range(date: str, date_from, date_to) -> bool:
+    if date_from and date < str(date_from):
+        return False
+    if date_to and date > str(date_to):
+        return False
+    return True
+
+def result_files(out_dir=OUTPUT_DIR, date_from=None, date_to=None):
+    out = []
+    for name in archive.list_names(out_dir, "result_"):
+        m = re.search(r"result_(\d{8})_", name)
+        if m and _in_range(m.group(1), date_from, date_to):
+            out.append(os.path.join(out_dir, name))
+    return out
+
+def predict_files(out_dir=OUTPUT_DIR, date_from=None, date_to=None):
+    out = []
+    for name in archive.list_names(out_dir, "predict_"):
+        m = re.search(r"predict_(\d{8})_", name)
+        if m and _in_range(m.group(1), date_from, date_to):
+            out.append(os.path.join(out_dir, name))
+    return out
+
+def _predict_path_for(res: dict, out_dir: str):
+    p = (res.get("source") or {}).get("predict_json")
+    if p and archive.exists(p):
+        return p
+    date, baba = res.get("date"), res.get("baba_code")
+    if date and baba:
+        try:
+            p = tracks.output_path("predict", date, baba, out_dir=out_dir)
+        except KeyError:
+            return None
+        if archive.exists(p):
+            return str(p)
+    return None
+
+def races_from_pair(pred: dict, res: dict):
+    """predict JSON と result JSON（同じ日・同じ開催場）から HistRace を作る"""
+    date = str(res.get("date") or pred.get("date") or "")
+    place = str(res.get("place") or pred.get("place") or "")
+
+    pred_by_rno = {}
+    for r in (pred or {}).get("predictions") or []:
+        try:
+            pred_by_rno[int(r.get("race_no"))] = r
+        except Exception:
+            continue
+
+    out = []
+    for rr in res.get("races") or []:
+        try:
+            rno = int(rr.get("race_no"))
+        except Exception:
+            continue
+        pr = pred_by_rno.get(rno) or {}
+        picks = pr.get("picks") or rr.get("pred_top5") or []
+
+        h = HistRace(date=date, place=place, race_no=rno, race_name=str(rr.get("race_name") or ""))
+        for p in picks[:5]:
+            try:
+                h.pick_umaban.append(int(p["umaban"]))
+                h.pick_score.append(float(p["score"]))
+            except Exception:
+                continue
+            z = p.get("z") or {}
+            h.pick_z.append((float(z.get("sp", 0.0)), float(z.get("kb", 0.0)), float(z.get("jockey", 0.0))))
+            h.pick_sp.append(p.get("sp"))
+            h.pick_kb.append(p.get("base_index"))
+            h.norm_method = str(z.get("norm_method") or h.norm_method)
+        h.field = pr.get("field") if isinstance(pr.get("field"), dict) else None
+        h.sp_pool = ((pred or {}).get("scoring") or {}).get("sp_model")
+        h.konsen = rr.get("konsen") or pr.get("konsen") or {}
+
+        for x in (rr.get("result_top3") or [])[:3]:
+            try:
+                h.top3.append(int(x["umaban"]))
+            except Exception:
+                break
+        h.trio_rows = _trio_rows(rr)
+        out.append(h)
+    return out
+
+def _from_db(out_dir, **kw):
+    """HISTORY_SOURCE=db なら DB から引く（使えなければ None → ファイル直読み）"""
+    if HISTORY_SOURCE != "db" or os.path.normpath(out_dir) != os.path.normpath(OUTPUT_DIR):
+        return None
+    try:
+        import history_store
+        conn = history_store.connect()
+        try:
+            history_store.ingest(conn, out_dir)
+            return history_store.load_history(conn, **kw)
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"[WARN] history: db unavailable, reading files err={e}")
+        return None
+
+def load_result_races(out_dir=OUTPUT_DIR, date_from=None, date_to=None):
+    """result JSON だけから HistRace を作る（picks は result の pred_top5。predict は読まない）"""
+    races = _from_db(out_dir, date_from=date_from, date_to=date_to, need_result=False, use_predict=False)
+    if races is not None:
+        return races
+    races = []
+    for path in result_files(out_dir, date_from, date_to):
+        res = _read_json(path)
+        if isinstance(res, dict):
+            races += races_from_pair({}, res)
+    return races
+
+def load_history(out_dir=OUTPUT_DIR, date_from=None, date_to=None, tracks=None, need_result=True):
+    """
+    return: list[HistRace]（日付→開催場→R 順）
+    tracks: 開催場名のリスト（None なら全部）
+    """
+    races = _from_db(out_dir, date_from=date_from, date_to=date_to, tracks=tracks, need_result=need_result)
+    if races is not None:
+        return races
+    tracks = set(tracks) if tracks else None
+    races = []
+    for rp in result_files(out_dir, date_from, date_to):
+        res = _read_json(rp)
+        if not isinstance(res, dict):
+            continue
+        if tracks and res.get("place") not in tracks:
+            continue
+        pp = _predict_path_for(res, out_dir)
+        pred = _read_json(pp) if pp else {}
+        for h in races_from_pair(pred or {}, res):
+            if need_result and not h.has_result:
+                continue
+            races.append(h)
+    return races
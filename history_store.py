@@ -0,0 +1,436 @@
+# history_store.py  (fieldnote-lab-bot)
+# 目的：
+# - output/ の predict_*.json / result_*.json を SQLite（WAL）に取り込んで、履歴の問い合わせを数ミリ秒にする
+#   （「7月の高知の的中率」のために何百ファイルも開いて JSON を読まなくて済むように）
+# - 取り込みは差分だけ：ファイルの mtime / size が同じなら読まない。変わっていても中身のハッシュが同じなら読まない
+# - history.load_history / load_result_races の裏側（HISTORY_SOURCE=db）。ファイル直読みと同じ HistRace を返す
+# - output/ 全体の取り込みは、前回と output/ の様子（ファイル数・最大 mtime・合計サイズ・zip）が同じなら丸ごと飛ばす
+#   （CI では actions/cache で history.db を持ち回る。キャッシュが無い初回だけ全部読む）
+#
+# テーブル：
+#   meta    (key, value)                                        output/ の様子（key = "sig:{out_dir}"）
+#   files   (path, kind, date, place, mtime, size, sha1)        取り込み済みのファイル
+#   races   (date, place, race_no, …)                           predict 側・result 側の列を1行に
+#   picks   (date, place, race_no, src, seq, …)                 上位5頭（src = predict / result の pred_top5）
+#   results (date, place, race_no, seq, rank, umaban, name)     1-3着（result_top3 の順）
+#   refunds (date, place, race_no, seq, a, b, c, payout)        三連複（history._trio_rows と同じ整形済み）
+#
+# 使い方：
+#   python history_store.py                                     # 差分取り込み＋件数表示
+#   PLACE=高知 DATE_FROM=20260701 DATE_TO=20260731 python history_store.py   # 期間・開催場の的中率
+#   HISTORY_DB=/tmp/h.db python history_store.py                # DB の場所（既定 history.db。git には入れない）
+
+import os, json, sqlite3, hashlib
+from datetime import datetime
+from pathlib import Path
+
+import archive
+import history
+
+HISTORY_DB = os.environ.get("HISTORY_DB", "history.db")
+PLACE = os.environ.get("PLACE", "").strip()
+DATE_FROM = os.environ.get("DATE_FROM", "").strip() or None
+DATE_TO = os.environ.get("DATE_TO", "").strip() or None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+  path TEXT PRIMARY KEY, kind TEXT NOT NULL, date TEXT, place TEXT,
+  mtime REAL, size INTEGER, sha1 TEXT, ingested_at TEXT
+);
+CREATE TABLE IF NOT EXISTS races (
+  date TEXT NOT NULL, place TEXT NOT NULL, race_no INTEGER NOT NULL,
+  -- predict 側
+  pred_file TEXT, pred_race_name TEXT, pred_konsen TEXT, field TEXT, sp_pool TEXT,
+  -- result 側
+  result_file TEXT, result_seq INTEGER, race_name TEXT, konsen TEXT,
+  konsen_value REAL, is_focus INTEGER, pred_hit INTEGER,
+  bet_invest INTEGER, bet_payout INTEGER, bet_hit INTEGER,
+  PRIMARY KEY (date, place, race_no)
+);
+CREATE INDEX IF NOT EXISTS races_place_date ON races (place, date);
+CREATE INDEX IF NOT EXISTS races_result ON races (result_file, result_seq);
+CREATE TABLE IF NOT EXISTS picks (
+  date TEXT NOT NULL, place TEXT NOT NULL, race_no INTEGER NOT NULL, src TEXT NOT NULL, seq INTEGER NOT NULL,
+  umaban INTEGER, name TEXT, score REAL, sp REAL, base_index REAL, jockey TEXT,
+  z_sp REAL, z_kb REAL, z_jockey REAL, norm_method TEXT,
+  PRIMARY KEY (date, place, race_no, src, seq)
+);
+CREATE TABLE IF NOT EXISTS results (
+  date TEXT NOT NULL, place TEXT NOT NULL, race_no INTEGER NOT NULL, seq INTEGER NOT NULL,
+  rank INTEGER, umaban INTEGER, name TEXT,
+  PRIMARY KEY (date, place, race_no, seq)
+);
+CREATE TABLE IF NOT EXISTS refunds (
+  date TEXT NOT NULL, place TEXT NOT NULL, race_no INTEGER NOT NULL, seq INTEGER NOT NULL,
+  a INTEGER, b INTEGER, c INTEGER, payout INTEGER,
+  PRIMARY KEY (date, place, race_no, seq)
+);
+"""
+
+PRED_COLS = ("pred_file", "pred_race_name", "pred_konsen", "field", "sp_pool")
+RESULT_COLS = ("result_file", "result_seq", "race_name", "konsen", "konsen_value", "is_focus", "pred_hit",
+               "bet_invest", "bet_payout", "bet_hit")
+
+
+def connect(path: str = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(path or HISTORY_DB)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def _dumps(v):
+    return None if v is None else json.dumps(v, ensure_ascii=False, separators=(",", ":"))
+
+def _loads(s):
+    return None if s is None else json.loads(s)
+
+def _num(v):
+    return float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else None
+
+
+# =========================
+# 取り込み
+# =========================
+def _kind(path: str):
+    b = os.path.basename(path)
+    if b.startswith("predict_") and b.endswith(".json"):
+        return "predict"
+    if b.startswith("result_") and b.endswith(".json"):
+        return "result"
+    return None
+
+def _pick_row(date, place, rno, src, seq, p):
+    z = p.get("z") or {}
+    return (date, place, rno, src, seq, int(p["umaban"]), p.get("name"), float(p["score"]),
+            p.get("sp"), p.get("base_index"), p.get("jockey"),
+            float(z.get("sp", 0.0)), float(z.get("kb", 0.0)), float(z.get("jockey", 0.0)),
+            z.get("norm_method"))
+
+def _insert_picks(conn, date, place, rno, src, picks):
+    rows = []
+    for p in (picks or [])[:5]:
+        try:
+            rows.append(_pick_row(date, place, rno, src, len(rows), p))
+        except Exception:
+            continue   # history.races_from_pair と同じ：umaban / score が無い印は飛ばす
+    conn.executemany("INSERT OR REPLACE INTO picks VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+
+def _upsert_race(conn, date, place, rno, cols: dict):
+    names = ", ".join(cols)
+    marks = ", ".join("?" for _ in cols)
+    sets = ", ".join(f"{c}=excluded.{c}" for c in cols)
+    conn.execute(
+        f"INSERT INTO races (date, place, race_no, {names}) VALUES (?, ?, ?, {marks}) "
+        f"ON CONFLICT(date, place, race_no) DO UPDATE SET {sets}",
+        (date, place, rno, *cols.values()),
+    )
+
+def _clear(conn, kind, date, place, path):
+    if kind == "predict":
+        conn.execute("DELETE FROM picks WHERE date=? AND place=? AND src='predict'", (date, place))
+        conn.execute(f"UPDATE races SET {', '.join(c + '=NULL' for c in PRED_COLS)} WHERE pred_file=?", (path,))
+    else:
+        for t in ("results", "refunds"):
+            conn.execute(f"DELETE FROM {t} WHERE date=? AND place=?", (date, place))
+        conn.execute("DELETE FROM picks WHERE date=? AND place=? AND src='result'", (date, place))
+        conn.execute(f"UPDATE races SET {', '.join(c + '=NULL' for c in RESULT_COLS)} WHERE result_file=?", (path,))
+
+def _ingest_predict(conn, path, d):
+    date, place = str(d.get("date") or ""), str(d.get("place") or "")
+    sp_pool = _dumps((d.get("scoring") or {}).get("sp_model"))
+    for r in d.get("predictions") or []:
+        try:
+            rno = int(r.get("race_no"))
+        except Exception:
+            continue
+        f = r.get("field") if isinstance(r.get("field"), dict) else None
+        _upsert_race(conn, date, place, rno, {
+            "pred_file": path,
+            "pred_race_name": str(r.get("race_name") or ""),
+            "pred_konsen": _dumps(r.get("konsen")),
+            "field": _dumps(f),
+            "sp_pool": sp_pool,
+        })
+        _insert_picks(conn, date, place, rno, "predict", r.get("picks"))
+    return date, place
+
+def _ingest_result(conn, path, d):
+    date, place = str(d.get("date") or ""), str(d.get("place") or "")
+    for seq, rr in enumerate(d.get("races") or []):
+        try:
+            rno = int(rr.get("race_no"))
+        except Exception:
+            continue
+        k = rr.get("konsen") or {}
+        bet = rr.get("bet_box") or {}
+        _upsert_race(conn, date, place, rno, {
+            "result_file": path,
+            "result_seq": seq,
+            "race_name": str(rr.get("race_name") or ""),
+            "konsen": _dumps(rr.get("konsen")),
+            "konsen_value": _num(k.get("value")),
+            "is_focus": int(bool(k.get("is_focus", False))),
+            "pred_hit": int(bool(rr.get("pred_hit", False))),
+            "bet_invest": int(bet.get("invest", 0) or 0) if bet.get("is_focus") else None,
+            "bet_payout": int(bet.get("payout", 0) or 0) if bet.get("is_focus") else None,
+            "bet_hit": int(bool(bet.get("hit"))) if bet.get("is_focus") else None,
+        })
+        _insert_picks(conn, date, place, rno, "result", rr.get("pred_top5"))
+
+        top = []
+        for x in (rr.get("result_top3") or [])[:3]:
+            try:
+                top.append((date, place, rno, len(top), int(x.get("rank") or 0), int(x["umaban"]), x.get("name")))
+            except Exception:
+                break   # history.races_from_pair と同じ：崩れた所で打ち切り
+        conn.executemany("INSERT OR REPLACE INTO results VALUES (?,?,?,?,?,?,?)", top)
+        conn.executemany(
+            "INSERT OR REPLACE INTO refunds VALUES (?,?,?,?,?,?,?,?)",
+            [(date, place, rno, i, t[0], t[1], t[2], pay) for i, (t, pay) in enumerate(history._trio_rows(rr))],
+        )
+    return date, place
+
+def _ingest_one(conn, path: str, force: bool = False) -> bool:
+    """ingest_file の中身（トランザクションは呼び出し側）"""
+    kind = _kind(path)
+    if not kind or not archive.exists(path):
+        return False
+    path = Path(path).as_posix()
+    mtime, size = archive.stat(path)
+    row = conn.execute("SELECT mtime, size, sha1 FROM files WHERE path=?", (path,)).fetchone()
+    if row and not force and row["mtime"] == mtime and row["size"] == size:
+        return False
+    raw = archive.read_bytes(path)
+    sha1 = hashlib.sha1(raw).hexdigest()
+    if row and not force and row["sha1"] == sha1:
+        conn.execute("UPDATE files SET mtime=?, size=? WHERE path=?", (mtime, size, path))
+        return False
+    try:
+        d = json.loads(raw.decode("utf-8"))
+    except Exception as e:
+        print(f"[WARN] history_store: read failed {path} err={e}")
+        return False
+    if not isinstance(d, dict):
+        return False
+
+    date, place = str(d.get("date") or ""), str(d.get("place") or "")
+    _clear(conn, kind, date, place, path)
+    if kind == "predict":
+        _ingest_predict(conn, path, d)
+    else:
+        _ingest_result(conn, path, d)
+    conn.execute(
+        "INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?,?,?)",
+        (path, kind, date, place, mtime, size, sha1, datetime.now().isoformat(timespec="seconds")),
+    )
+    return True
+
+def ingest_file(conn, path: str, force: bool = False) -> bool:
+    """1ファイルを取り込む（変わっていなければ何もしない）。return: 取り込んだか"""
+    with conn:
+        return _ingest_one(conn, path, force)
+
+def _drop_vanished(conn, out_dir: str) -> int:
+    """out_dir から消えた（付け替えられた）ファイルの行を消す。同じ日・開催場の残りのファイルは読み直させる"""
+    prefix = Path(out_dir).as_posix().rstrip("/") + "/"
+    gone = [r for r in conn.execute("SELECT path, kind, date, place FROM files").fetchall()
+            if r["path"].startswith(prefix) and not archive.exists(r["path"])]
+    with conn:
+        for r in gone:
+            _clear(conn, r["kind"], r["date"], r["place"], r["path"])
+            conn.execute("DELETE FROM files WHERE path=?", (r["path"],))
+            conn.execute("DELETE FROM files WHERE kind=? AND date=? AND place=?", (r["kind"], r["date"], r["place"]))
+    return len(gone)
+
+def _signature(out_dir: str) -> str:
+    """output/ の様子（predict / result のバラの数・mtime・サイズの合計と zip の mtime・サイズ）。stat だけで読まない"""
+    n = mt = sz = 0
+    with os.scandir(out_dir) as it:
+        for e in it:
+            if _kind(e.name) and e.is_file():
+                st = e.stat()
+                n, mt, sz = n + 1, mt + st.st_mtime_ns, sz + st.st_size
+    zips = []
+    ad = archive.archive_dir(out_dir)
+    if ad.is_dir():
+        for zp in sorted(ad.glob("*.zip")):
+            st = zp.stat()
+            zips.append(f"{zp.name}:{st.st_mtime_ns}:{st.st_size}")
+    return f"{n}:{mt}:{sz}|" + ",".join(zips)
+
+def ingest(conn, out_dir: str = history.OUTPUT_DIR, paths=None) -> dict:
+    """
+    output/ を差分取り込み（paths を渡せばそのファイルだけ）
+    output/ 全体のときは、前回の全体取り込みから output/ が変わっていなければ何も見ない（current=True）
+    """
+    stats = {"seen": 0, "ingested": 0, "removed": 0, "current": False}
+    if paths is not None:
+        for p in paths:
+            stats["seen"] += 1
+            stats["ingested"] += int(ingest_file(conn, p))
+        return stats
+
+    key = "sig:" + Path(out_dir).as_posix().rstrip("/")
+    sig = _signature(out_dir)
+    row = conn.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+    if row and row["value"] == sig:
+        stats["current"] = True
+        return stats
+    stats["removed"] = _drop_vanished(conn, out_dir)
+    paths = history.predict_files(out_dir) + history.result_files(out_dir)
+    with conn:   # 全体は1トランザクション（ファイルごとにコミットしない）
+        for p in paths:
+            stats["seen"] += 1
+            stats["ingested"] += int(_ingest_one(conn, p))
+        conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, sig))
+    return stats
+
+def update_after_write(paths, db: str = None):
+    """predict / result が JSON を書いた直後に呼ぶ（DB が壊れていても本体は止めない）"""
+    try:
+        conn = connect(db)
+        try:
+            ingest(conn, paths=[str(p) for p in paths])
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"[WARN] history_store update failed: {e}")
+
+
+# =========================
+# 問い合わせ
+# =========================
+def _where(date_from=None, date_to=None, places=None, race_from=None, race_to=None, alias="r"):
+    cond, args = [], []
+    if date_from:
+        cond.append(f"{alias}.date >= ?"); args.append(str(date_from))
+    if date_to:
+        cond.append(f"{alias}.date <= ?"); args.append(str(date_to))
+    if places:
+        places = list(places)
+        cond.append(f"{alias}.place IN ({','.join('?' for _ in places)})"); args += places
+    if race_from:
+        cond.append(f"{alias}.race_no >= ?"); args.append(int(race_from))
+    if race_to:
+        cond.append(f"{alias}.race_no <= ?"); args.append(int(race_to))
+    return (" AND ".join(cond) or "1=1"), args
+
+def query_races(conn, date_from=None, date_to=None, places=None, race_from=None, race_to=None):
+    """return: races の行（dict）のリスト（日付→開催場→R 順）"""
+    w, args = _where(date_from, date_to, places, race_from, race_to)
+    rows = conn.execute(f"SELECT * FROM races r WHERE {w} ORDER BY r.date, r.place, r.race_no", args).fetchall()
+    return [dict(x) for x in rows]
+
+def summary(conn, date_from=None, date_to=None, places=None, race_from=None, race_to=None, by_place=False):
+    """結果が出ているレースの的中率（上位5頭に1-3着）と注目レースの BOX 収支"""
+    w, args = _where(date_from, date_to, places, race_from, race_to)
+    key = "r.place" if by_place else "'*'"
+    sql = f"""
+      SELECT {key} AS place,
+             COUNT(*) AS races,
+             SUM(r.pred_hit) AS pred_hits,
+             SUM(CASE WHEN r.bet_invest IS NOT NULL THEN 1 ELSE 0 END) AS focus_races,
+             SUM(COALESCE(r.bet_hit, 0)) AS focus_hits,
+             SUM(COALESCE(r.bet_invest, 0)) AS invest,
+             SUM(COALESCE(r.bet_payout, 0)) AS payout
+      FROM races r
+      WHERE r.result_file IS NOT NULL
+        AND (SELECT COUNT(*) FROM results x WHERE x.date=r.date AND x.place=r.place AND x.race_no=r.race_no) >= 3
+        AND {w}
+      GROUP BY {key} ORDER BY {key}
+    """
+    out = []
+    for x in conn.execute(sql, args).fetchall():
+        d = dict(x)
+        d["pred_hit_rate"] = round(100.0 * d["pred_hits"] / d["races"], 1) if d["races"] else None
+        d["roi"] = round(100.0 * d["payout"] / d["invest"], 1) if d["invest"] else None
+        d["profit"] = int(d["payout"] - d["invest"])
+        out.append(d)
+    return out
+
+
+# =========================
+# HistRace（history.py と同じ形で返す）
+# =========================
+def _group(cur, sql, args, width):
+    """(date, place, race_no, *cols) の行 -> {(date, place, race_no): [cols, ...]}（行は SQL の並びのまま）"""
+    g = {}
+    for x in cur.execute(sql, args):
+        g.setdefault(x[:3], []).append(x[3:width])
+    return g
+
+def load_history(conn, date_from=None, date_to=None, tracks=None, need_result=True, use_predict=True):
+    """
+    history.load_history（use_predict=False なら load_result_races）と同じ HistRace のリストを返す
+    並びもファイル直読みと同じ（result ファイル名順 → ファイル内のレース順）
+    """
+    w, args = _where(date_from, date_to, tracks)
+    cur = conn.cursor()
+    cur.row_factory = None   # 何万行も読むので sqlite3.Row は使わない（列は下の SELECT の順）
+    races = cur.execute(
+        "SELECT r.date, r.place, r.race_no, r.race_name, r.konsen, r.pred_file, r.pred_konsen, r.field, r.sp_pool "
+        f"FROM races r WHERE r.result_file IS NOT NULL AND {w} ORDER BY r.result_file, r.result_seq", args).fetchall()
+    # 子テーブルは主キー順に races を引く（並べ替えなし）
+    join = (" JOIN races r ON r.date=x.date AND r.place=x.place AND r.race_no=x.race_no"
+            f" WHERE r.result_file IS NOT NULL AND {w}")
+    src = "" if use_predict else " AND x.src='result'"
+    picks = _group(cur, "SELECT x.date, x.place, x.race_no, x.src, x.umaban, x.score, x.z_sp, x.z_kb, x.z_jockey, "
+                        f"x.sp, x.base_index, x.norm_method FROM picks x{join}{src} "
+                        "ORDER BY x.date, x.place, x.race_no, x.src, x.seq", args, 12)
+    top = _group(cur, f"SELECT x.date, x.place, x.race_no, x.umaban FROM results x{join} "
+                      "ORDER BY x.date, x.place, x.race_no, x.seq", args, 4)
+    refunds = _group(cur, f"SELECT x.date, x.place, x.race_no, x.a, x.b, x.c, x.payout FROM refunds x{join} "
+                          "ORDER BY x.date, x.place, x.race_no, x.seq", args, 7)
+
+    pools = {}   # 同じファイルの sp_pool は1回だけ読む
+    out = []
+    for date, place, rno, race_name, konsen, pred_file, pred_konsen, field, sp_pool in races:
+        key = (date, place, rno)
+        has_pred = use_predict and pred_file is not None
+        ps = picks.get(key) or ()
+        pp = [p for p in ps if p[0] == "predict"] if has_pred else []
+        if not pp:
+            pp = [p for p in ps if p[0] == "result"]
+
+        h = history.HistRace(date=date, place=place, race_no=rno, race_name=race_name or "")
+        for _, umaban, score, z_sp, z_kb, z_jockey, sp, kb, norm in pp:
+            h.pick_umaban.append(int(umaban))
+            h.pick_score.append(float(score))
+            h.pick_z.append((z_sp, z_kb, z_jockey))
+            h.pick_sp.append(sp)
+            h.pick_kb.append(kb)
+            h.norm_method = str(norm or h.norm_method)
+        if has_pred:
+            h.field = _loads(field)
+            if sp_pool not in pools:
+                pools[sp_pool] = _loads(sp_pool)
+            h.sp_pool = pools[sp_pool]
+        h.konsen = _loads(konsen) or (_loads(pred_konsen) if has_pred else None) or {}
+        h.top3 = [x[0] for x in top.get(key) or ()]
+        h.trio_rows = [((a, b, c), pay) for a, b, c, pay in refunds.get(key) or ()]
+        if need_result and not h.has_result:
+            continue
+        out.append(h)
+    return out
+
+
+def main():
+    t0 = datetime.now()
+    conn = connect()
+    st = ingest(conn)
+    n = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ("files", "races", "picks", "results", "refunds")}
+    print(f"[OK] {HISTORY_DB}: seen={st['seen']} ingested={st['ingested']} removed={st['removed']} current={st['current']} {n}  ({(datetime.now() - t0).total_seconds():.2f}s)")
+
+    t1 = datetime.now()
+    rows = summary(conn, DATE_FROM, DATE_TO, [PLACE] if PLACE else None, by_place=True)
+    for d in rows:
+        print(f"  {d['place']:4s} races={d['races']:5d} hit={d['pred_hit_rate']}%  focus={d['focus_races']:4d} "
+              f"roi={d['roi']}% profit={d['profit']:+,}")
+    print(f"[INFO] query {(datetime.now() - t1).total_seconds() * 1000:.1f}ms")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
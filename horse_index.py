@@ -0,0 +1,231 @@
+# horse_index.py  (fieldnote-lab-bot)
+# 目的：
+# - 馬ごとの出走履歴（日付 / 開催場 / R / 馬番 / SP / KB / 着順）を output/horse_index.json に持つ
+#   ・predict：吉馬に SP が無い馬は、前走までに記録した SP（最新）で埋める（推定より優先。O(1) で引ける）
+#   ・predict：上位5頭に近走の着順（form）を付けて、サイトに出せるようにする（追加の取得なし）
+# - result_all_today がその日の predict（field）＋ result（着順）を読んだついでに畳み込む
+#
+# ストア：
+#   horses -> 正規化した馬名 -> runs（新しい順、最大 HORSE_MAX_RUNS 件）
+#   run = [日付, 開催場, R, 馬番, SP（観測値のみ。無ければ null）, KB（null 可）, 着順（null 可）]
+# - SP は field の sp_raw（吉馬の観測値）だけ。field の無い古い predict の picks の sp は推定で埋まっているかもしれない
+#   （推定値の clamp 端 45.0 / 78.0 などは小数1桁なので見分けられない）→ 着順だけ入れて SP は null
+# - version 1 のストア（picks の sp を入れていた頃）は読むときに KB なしの run の SP を落とす
+# - (日付, 開催場, R) が同じ run は置き換える → 同じ日を何度流しても二重にならない（冪等）
+# - キーは馬名だけ（南関東などは開催場をまたいで走るので）。開催場は run 側に持つ
+# - 最終出走が HORSE_KEEP_DAYS より古い馬は保存時に捨てる
+#
+# 使い方：
+#   python horse_index.py                           # output/ の predict / result から作り直す
+#   HORSE_REPORT=ノブノリオウ python horse_index.py  # 作り直した後、その馬の履歴を表示
+
+import os, re, json, unicodedata
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import outwrite as OW
+
+HORSE_INDEX_FILE = os.environ.get("HORSE_INDEX_FILE", "output/horse_index.json")
+HORSE_MAX_RUNS = int(os.environ.get("HORSE_MAX_RUNS", "10"))
+HORSE_KEEP_DAYS = int(os.environ.get("HORSE_KEEP_DAYS", "400"))
+HORSE_SP_MAX_AGE = int(os.environ.get("HORSE_SP_MAX_AGE", "180"))   # これより古い SP は埋めに使わない（日）
+HORSE_FORM_N = int(os.environ.get("HORSE_FORM_N", "5"))
+HORSE_REPORT = os.environ.get("HORSE_REPORT", "").strip()
+STORE_VERSION = 2
+
+# run の列
+R_DATE, R_PLACE, R_RNO, R_UMABAN, R_SP, R_KB, R_RANK = range(7)
+
+
+def norm_horse_name(s: str) -> str:
+    s = unicodedata.normalize("NFKC", str(s or ""))
+    s = re.sub(r"\s+", "", s)
+    s = re.sub(r"\d+(?:ヶ月前|か月前|日前|時間前)$", "", s)
+    s = re.sub(r"(?:想定|取消|除外)$", "", s)
+    return s
+
+def _shift(yyyymmdd: str, days: int) -> str:
+    return (datetime.strptime(yyyymmdd, "%Y%m%d") + timedelta(days=days)).strftime("%Y%m%d")
+
+
+# =========================
+# ストア
+# =========================
+def empty_store() -> dict:
+    return {"type": "fieldnote_horse_index", "version": STORE_VERSION, "horses": {}}
+
+def load_store(path: str = None):
+    """return: store（ファイルが無ければ None）"""
+    path = path or HORSE_INDEX_FILE
+    if not Path(path).is_file():
+        return None
+    try:
+        d = json.loads(Path(path).read_text(encoding="utf-8"))
+    except Exception as e:
+        print(f"[WARN] horse_index read failed: {path} err={e}")
+        return None
+    if not isinstance(d, dict) or not isinstance(d.get("horses"), dict):
+        return None
+    if int(d.get("version") or 1) < 2:
+        # picks 由来の run（KB なし）の SP は推定値かもしれないので捨てる
+        for h in d["horses"].values():
+            for r in h.get("runs") or []:
+                if r[R_KB] is None:
+                    r[R_SP] = None
+        d["version"] = STORE_VERSION
+    return d
+
+def save_store(store: dict, path: str = None, keep_days: int = None):
+    path = path or HORSE_INDEX_FILE
+    keep_days = HORSE_KEEP_DAYS if keep_days is None else keep_days
+    horses = store["horses"]
+    if horses and keep_days > 0:
+        latest = max(h["runs"][0][R_DATE] for h in horses.values() if h.get("runs"))
+        cut = _shift(latest, -keep_days)
+        for k in [k for k, h in horses.items() if not h.get("runs") or h["runs"][0][R_DATE] < cut]:
+            del horses[k]
+    store["updated_at"] = datetime.now().isoformat(timespec="seconds")
+    OW.write_text(path, json.dumps(store, ensure_ascii=False, separators=(",", ":")))
+
+def upsert_run(store: dict, name: str, run: list):
+    key = norm_horse_name(name)
+    if not key:
+        return
+    h = store["horses"].setdefault(key, {"runs": []})
+    runs = [r for r in h["runs"] if (r[R_DATE], r[R_PLACE], r[R_RNO]) != (run[R_DATE], run[R_PLACE], run[R_RNO])]
+    runs.append(run)
+    runs.sort(key=lambda r: (r[R_DATE], r[R_RNO]), reverse=True)
+    h["runs"] = runs[:HORSE_MAX_RUNS]
+
+
+# =========================
+# 取り込み（predict JSON ＋ result JSON）
+# =========================
+def _ranks_by_race(res: dict):
+    """result JSON -> {race_no: {umaban: rank}}（全着順があれば全頭、無ければ 1-3着）"""
+    out = {}
+    for rr in (res or {}).get("races") or []:
+        try:
+            rno = int(rr.get("race_no"))
+        except Exception:
+            continue
+        src = rr.get("result_finishers") or rr.get("result_top3") or []
+        m = {}
+        for f in src:
+            try:
+                m[int(f["umaban"])] = int(f["rank"])
+            except Exception:
+                continue
+        out[rno] = m
+    return out
+
+def ingest_day(store: dict, pred: dict, res: dict = None) -> int:
+    """
+    1開催場1日分を取り込む（res が無ければ着順なし）
+    - field（全頭：name / sp_raw / base_index）があればそれを使う
+    - 古い predict は上位5頭の picks だけ（着順のみ。SP / KB は推定・補完済みかもしれないので入れない）
+    return: 取り込んだ頭数
+    """
+    date = str((pred or {}).get("date") or (res or {}).get("date") or "")
+    place = str((pred or {}).get("place") or (res or {}).get("place") or "")
+    if not date or not place:
+        return 0
+    ranks = _ranks_by_race(res)
+
+    n = 0
+    for r in (pred or {}).get("predictions") or []:
+        try:
+            rno = int(r.get("race_no"))
+        except Exception:
+            continue
+        rk = ranks.get(rno) or {}
+        f = r.get("field")
+        if isinstance(f, dict) and f.get("name"):
+            for u, name, sp, kb in zip(f.get("umaban") or [], f.get("name") or [], f.get("sp_raw") or [], f.get("base_index") or []):
+                upsert_run(store, name, [date, place, rno, int(u), sp, kb, rk.get(int(u))])
+                n += 1
+            continue
+        for p in r.get("picks") or []:
+            try:
+                u = int(p["umaban"])
+            except Exception:
+                continue
+            upsert_run(store, p.get("name"), [date, place, rno, u, None, None, rk.get(u)])
+            n += 1
+    return n
+
+
+# =========================
+# 引く（predict 用）
+# =========================
+def last_sp(store: dict, name: str, before: str, max_age: int = None):
+    """before より前の最新の観測 SP（max_age 日以内）。無ければ None"""
+    if not store:
+        return None
+    h = store["horses"].get(norm_horse_name(name))
+    if not h:
+        return None
+    max_age = HORSE_SP_MAX_AGE if max_age is None else max_age
+    lo = _shift(before, -max_age) if max_age > 0 else ""
+    for r in h["runs"]:
+        if r[R_DATE] >= before:
+            continue
+        if r[R_DATE] < lo:
+            break
+        if r[R_SP] is not None:
+            return float(r[R_SP])
+    return None
+
+def form(store: dict, name: str, before: str, n: int = None):
+    """before より前の近走の着順（新しい順。着順不明は None）"""
+    if not store:
+        return []
+    h = store["horses"].get(norm_horse_name(name))
+    if not h:
+        return []
+    n = HORSE_FORM_N if n is None else n
+    return [r[R_RANK] for r in h["runs"] if r[R_DATE] < before][:n]
+
+def form_line(ranks) -> str:
+    """[3, 1, None, 5] -> '3-1-?-5'"""
+    return "-".join(str(x) if x is not None else "?" for x in ranks)
+
+
+# =========================
+# 履歴から作り直す
+# =========================
+def rebuild(out_dir: str = "output") -> dict:
+    import history
+
+    store = empty_store()
+    res_by_key = {}
+    for path in history.result_files(out_dir):
+        res = history._read_json(path)
+        if isinstance(res, dict) and res.get("date") and res.get("place"):
+            res_by_key[(str(res["date"]), res["place"])] = res
+
+    n_files = n_runs = 0
+    for path in history.predict_files(out_dir):
+        pred = history._read_json(path)
+        if not isinstance(pred, dict):
+            continue
+        res = res_by_key.get((str(pred.get("date") or ""), pred.get("place")))
+        n_runs += ingest_day(store, pred, res)
+        n_files += 1
+    print(f"[INFO] rebuild: predict files={n_files} runs={n_runs} horses={len(store['horses'])}")
+    return store
+
+
+def main():
+    store = rebuild()
+    save_store(store)
+    with_sp = sum(1 for h in store["horses"].values() if any(r[R_SP] is not None for r in h["runs"]))
+    print(f"[OK] wrote {HORSE_INDEX_FILE}  horses={len(store['horses'])} with_sp={with_sp}")
+
+    if HORSE_REPORT:
+        h = store["horses"].get(norm_horse_name(HORSE_REPORT))
+        for r in (h or {}).get("runs") or []:
+            print(f"  {r[R_DATE]} {r[R_PLACE]} {r[R_RNO]:2d}R #{r[R_UMABAN]:<2d} sp={r[R_SP]} kb={r[R_KB]} rank={r[R_RANK]}")
+
+if __name__ == "__main__":
+    main()
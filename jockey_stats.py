@@ -0,0 +1,165 @@
+# jockey_stats.py  (fieldnote-lab-bot)
+# 目的：
+# - 騎手成績（勝率 / 連対率 / 三連対率）を自前の result 履歴から作る（kaisekisya を取りに行かなくて済むように）
+#   ・result_all_today が RaceMarkTable（全着順＋騎手）を読んだついでに、その日の分を畳み込む
+#   ・predict は JOCKEY_SOURCE=own / blend でこれを使う（kaisekisya と同じ (win, quin, tri) の % 形式）
+#
+# ストア（output/jockey_stats.json）：
+#   tracks -> 開催場名 -> days -> yyyymmdd -> 騎手名 -> [騎乗, 1着, 2着内, 3着内]
+# - 開催場×日付のバケツを丸ごと置き換えるので、同じ日を何度流しても二重に数えない（冪等）
+# - 更新は O(その日のレース数)。読む時に直近 JOCKEY_WINDOW_DAYS 日のバケツだけ足す（ローリング窓）
+# - JOCKEY_KEEP_DAYS より古いバケツは保存時に捨てる
+#
+# 使い方：
+#   python jockey_stats.py                    # output/result_*.json の result_finishers から作り直す
+#   JOCKEY_REPORT=佐賀 python jockey_stats.py  # 作り直した後、その開催場の上位騎手を表示
+
+import os, re, json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import outwrite as OW
+
+JOCKEY_STATS_FILE = os.environ.get("JOCKEY_STATS_FILE", "output/jockey_stats.json")
+JOCKEY_WINDOW_DAYS = int(os.environ.get("JOCKEY_WINDOW_DAYS", "365"))
+JOCKEY_KEEP_DAYS = int(os.environ.get("JOCKEY_KEEP_DAYS", "730"))
+JOCKEY_MIN_RIDES = int(os.environ.get("JOCKEY_MIN_RIDES", "20"))   # これ未満の騎手は成績なし扱い（率がぶれるので）
+JOCKEY_REPORT = os.environ.get("JOCKEY_REPORT", "").strip()
+
+
+def clean_jockey_name(s: str) -> str:
+    """RaceMarkTable の騎手欄 → 氏名だけ（減量記号・斤量・空白・括弧を落とす）"""
+    s = re.sub(r"\s+", "", str(s or ""))
+    s = re.sub(r"[◀◁▶▷▲△☆★◇◆*＊]+", "", s)
+    s = re.sub(r"[(（][^)）]*[)）]", "", s)
+    s = re.sub(r"[\d.]+$", "", s)
+    return s
+
+
+# =========================
+# ストア
+# =========================
+def empty_store() -> dict:
+    return {"type": "fieldnote_jockey_stats", "version": 1, "tracks": {}}
+
+def load_store(path: str = None) -> dict:
+    path = path or JOCKEY_STATS_FILE
+    if not Path(path).is_file():
+        return empty_store()
+    try:
+        d = json.loads(Path(path).read_text(encoding="utf-8"))
+    except Exception as e:
+        print(f"[WARN] jockey_stats read failed: {path} err={e}")
+        return empty_store()
+    if not isinstance(d, dict) or not isinstance(d.get("tracks"), dict):
+        return empty_store()
+    return d
+
+def save_store(store: dict, path: str = None, keep_days: int = None):
+    path = path or JOCKEY_STATS_FILE
+    keep_days = JOCKEY_KEEP_DAYS if keep_days is None else keep_days
+    for rec in store["tracks"].values():
+        days = rec.get("days") or {}
+        if days and keep_days > 0:
+            cut = _shift(max(days), -keep_days)
+            for d in [d for d in days if d < cut]:
+                del days[d]
+    store["updated_at"] = datetime.now().isoformat(timespec="seconds")
+    OW.write_text(path, json.dumps(store, ensure_ascii=False, separators=(",", ":")))
+
+def _shift(yyyymmdd: str, days: int) -> str:
+    return (datetime.strptime(yyyymmdd, "%Y%m%d") + timedelta(days=days)).strftime("%Y%m%d")
+
+def day_bucket(races_finishers) -> dict:
+    """
+    races_finishers: list[list[{"rank", "jockey", ...}]]（1レース = 1 list）
+    return: 騎手名 -> [騎乗, 1着, 2着内, 3着内]
+    """
+    b = {}
+    for fins in races_finishers:
+        for f in fins or []:
+            name = clean_jockey_name(f.get("jockey"))
+            try:
+                rank = int(f.get("rank"))
+            except Exception:
+                continue
+            if not name:
+                continue
+            c = b.setdefault(name, [0, 0, 0, 0])
+            c[0] += 1
+            c[1] += rank <= 1
+            c[2] += rank <= 2
+            c[3] += rank <= 3
+    return b
+
+def update_day(store: dict, place: str, yyyymmdd: str, races_finishers) -> int:
+    """開催場×日付のバケツを置き換える（冪等）。return: 数えた騎乗数"""
+    b = day_bucket(races_finishers)
+    rec = store["tracks"].setdefault(place, {"days": {}})
+    if b:
+        rec["days"][str(yyyymmdd)] = b
+    else:
+        rec["days"].pop(str(yyyymmdd), None)
+    return sum(c[0] for c in b.values())
+
+def rates_for(store: dict, place: str, as_of: str, window_days: int = None, min_rides: int = None) -> dict:
+    """
+    as_of より前（当日は含めない）の直近 window_days 日で集計
+    return: 騎手名 -> (勝率%, 連対率%, 三連対率%)（kaisekisya と同じ形。騎乗数の多い順）
+    """
+    window_days = JOCKEY_WINDOW_DAYS if window_days is None else window_days
+    min_rides = JOCKEY_MIN_RIDES if min_rides is None else min_rides
+    days = ((store.get("tracks") or {}).get(place) or {}).get("days") or {}
+    lo = _shift(as_of, -window_days) if window_days > 0 else ""
+    tot = {}
+    for d, b in days.items():
+        if not (lo <= d < as_of):
+            continue
+        for name, c in b.items():
+            t = tot.setdefault(name, [0, 0, 0, 0])
+            for i in range(4):
+                t[i] += int(c[i])
+    out = {}
+    for name, (n, w, q, t3) in sorted(tot.items(), key=lambda kv: -kv[1][0]):
+        if n < max(1, min_rides):
+            continue
+        out[name] = (round(100.0 * w / n, 1), round(100.0 * q / n, 1), round(100.0 * t3 / n, 1))
+    return out
+
+
+# =========================
+# result 履歴から作り直す
+# =========================
+def rebuild(out_dir: str = "output") -> dict:
+    import history
+
+    store = empty_store()
+    n_files = n_rides = 0
+    for path in history.result_files(out_dir):
+        res = history._read_json(path)
+        if not isinstance(res, dict) or not res.get("place") or not res.get("date"):
+            continue
+        fins = [r.get("result_finishers") for r in res.get("races") or [] if r.get("result_finishers")]
+        if not fins:
+            continue
+        n_rides += update_day(store, res["place"], str(res["date"]), fins)
+        n_files += 1
+    print(f"[INFO] rebuild: result files with finishers={n_files} rides={n_rides}")
+    return store
+
+
+def main():
+    store = rebuild()
+    save_store(store)
+    for place, rec in sorted(store["tracks"].items()):
+        days = sorted(rec.get("days") or {})
+        print(f"[OK] {place:4s} days={len(days)} {days[0] if days else '-'}..{days[-1] if days else '-'}")
+    print(f"[OK] wrote {JOCKEY_STATS_FILE}")
+
+    if JOCKEY_REPORT:
+        as_of = _shift(datetime.now().strftime("%Y%m%d"), 1)
+        for name, r in list(rates_for(store, JOCKEY_REPORT, as_of).items())[:20]:
+            print(f"  {name:8s} win={r[0]:5.1f}% quin={r[1]:5.1f}% tri={r[2]:5.1f}%")
+
+if __name__ == "__main__":
+    main()
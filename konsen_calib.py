@@ -0,0 +1,283 @@
+# konsen_calib.py  (fieldnote-lab-bot)
+# 目的：
+# - 混戦度（konsen）が本当に「当たりやすさ / 回収率」と関係しているかを履歴で確かめる
+#   ・konsen の値で区切った帯ごとに：レース数 / 5頭BOX の的中率 / BOX 回収率（全体・開催場別）
+# - calc_konsen_gap のパラメータ（gap12_mid / gap15_mid / w12・w15 / focus_th）を履歴に合わせる
+#   ・result JSON に残っている gap12 / gap15 をそのまま使う（再スコア不要）
+#   ・候補設定 G 個 × しきい値 T 個 × レース R をまとめて numpy で評価（ループは G のチャンクだけ）
+#
+# 注意：
+# - 印（上位5頭）は konsen に関係なく同じ → 変わるのは「どのレースを注目（買う）にするか」だけ
+# - 対象は結果（1-3着）が取れているレースのみ。払戻は bet_box.sanrenpuku_rows、無ければ表示用の1行
+# - 日付で前後に分け、前側（学習）で選んだ設定を後ろ側（検証）でも表示する（当てはめすぎの確認用）
+#
+# 使い方：
+#   python konsen_calib.py                             # 既定（目的 = 注目レースの回収率）
+#   KONSEN_OBJECTIVE=profit python konsen_calib.py     # focus_roi / hit_rate / profit
+#   DATE_FROM=20260401 python konsen_calib.py
+
+import os, json
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+import predict_all_today as P
+import history
+
+KONSEN_CALIB_OUT = os.environ.get("KONSEN_CALIB_OUT", "konsen_calib.json")
+KONSEN_OBJECTIVE = os.environ.get("KONSEN_OBJECTIVE", "focus_roi").strip()
+KONSEN_MIN_FOCUS = int(os.environ.get("KONSEN_MIN_FOCUS", "200"))      # 学習側で注目がこれ未満の設定は採らない
+KONSEN_HOLDOUT = float(os.environ.get("KONSEN_HOLDOUT", "0.3"))        # 後ろ何割の日付を検証に回すか
+KONSEN_BINS = [float(x) for x in os.environ.get("KONSEN_BINS", "0,10,20,30,40,50,60,100").split(",") if x.strip()]
+KONSEN_MIN_BIN = int(os.environ.get("KONSEN_MIN_BIN", "30"))           # 開催場別の帯はこれ未満なら出さない
+DATE_FROM = os.environ.get("DATE_FROM", "").strip() or None
+DATE_TO = os.environ.get("DATE_TO", "").strip() or None
+
+def _grid(name, default):
+    return [float(x) for x in os.environ.get(name, default).split(",") if x.strip()]
+
+GRID_GAP12_MID = _grid("GRID_GAP12_MID", "0.3,0.5,0.8,1.0,1.5,2.0,3.0")
+GRID_GAP15_MID = _grid("GRID_GAP15_MID", "1.0,2.0,3.0,4.0,5.0,7.0")
+GRID_W12 = _grid("GRID_W12", "0,0.2,0.35,0.5,0.65,0.8,1")
+GRID_FOCUS_TH = _grid("GRID_FOCUS_TH", ",".join(str(x) for x in range(10, 72, 2)))
+
+BOX_POINTS = 10   # 5頭BOX = C(5,3)
+BET_UNIT = 100
+CHUNK = 64
+
+
+# =========================
+# 履歴 → 配列
+# =========================
+def load_arrays(races):
+    """
+    return: dict（R 本の配列）
+      gap12 / gap15 / value / is_focus：result に残っている konsen
+      hit：1-3着が上位5頭に全部いる / payout：5頭BOX の払戻（100円あたり）
+    """
+    use = []
+    for h in races:
+        k = h.konsen or {}
+        if not h.has_result or len(h.pick_umaban) < 5:
+            continue
+        if not isinstance(k.get("gap12"), (int, float)) or not isinstance(k.get("gap15"), (int, float)):
+            continue
+        use.append(h)
+
+    R = len(use)
+    D = {
+        "gap12": np.zeros(R), "gap15": np.zeros(R), "value": np.zeros(R),
+        "is_focus": np.zeros(R, dtype=bool), "hit": np.zeros(R, dtype=bool),
+        "payout": np.zeros(R, dtype=np.int64),
+    }
+    for i, h in enumerate(use):
+        k = h.konsen
+        box = set(h.pick_umaban[:5])
+        D["gap12"][i] = float(k["gap12"])
+        D["gap15"][i] = float(k["gap15"])
+        D["value"][i] = float(k.get("value") or 0.0)
+        D["is_focus"][i] = bool(k.get("is_focus", False))
+        D["hit"][i] = set(h.top3[:3]) <= box
+        D["payout"][i] = sum(p for t, p in h.trio_rows if set(t) <= box)
+
+    D["place"] = np.asarray([h.place for h in use])
+    D["date"] = np.asarray([h.date for h in use])
+    return D
+
+def _subset(D, sel):
+    return {k: v[sel] for k, v in D.items()}
+
+def split_by_date(D, frac):
+    dates = sorted(set(D["date"].tolist()))
+    if len(dates) < 2 or frac <= 0:
+        return D, None, None
+    cut = dates[min(len(dates) - 1, max(1, int(len(dates) * (1.0 - frac))))]
+    return _subset(D, D["date"] < cut), _subset(D, D["date"] >= cut), cut
+
+
+# =========================
+# konsen（calc_konsen_gap と同じ式をベクトルで）
+# =========================
+def konsen_values(gap12, gap15, mid12, mid15, w12, w15):
+    """gap: (R,)  mid/w: (G,) -> (G, R)"""
+    sc12 = 1.0 / (1.0 + gap12[None, :] / np.maximum(1e-9, mid12)[:, None])
+    sc15 = 1.0 / (1.0 + gap15[None, :] / np.maximum(1e-9, mid15)[:, None])
+    k01 = w12[:, None] * sc12 + w15[:, None] * sc15
+    return np.round(100.0 * np.clip(k01, 0.0, 1.0), 1)
+
+def _stats(n, hits, payout):
+    invest = n * BOX_POINTS * BET_UNIT
+    return {
+        "races": int(n),
+        "hits": int(hits),
+        "hit_rate": round(100.0 * hits / n, 1) if n else None,
+        "invest": int(invest),
+        "payout": int(payout),
+        "profit": int(payout - invest),
+        "roi": round(100.0 * payout / invest, 1) if invest else None,
+    }
+
+
+# =========================
+# 帯ごとの表
+# =========================
+def bin_report(value, hit, payout, bins=KONSEN_BINS, min_n=0):
+    out = []
+    for lo, hi in zip(bins[:-1], bins[1:]):
+        sel = (value >= lo) & ((value < hi) if hi < bins[-1] else (value <= hi))
+        n = int(sel.sum())
+        if n < max(1, min_n):
+            continue
+        s = _stats(n, int(hit[sel].sum()), int(payout[sel].sum()) * BET_UNIT // 100)
+        s["bin"] = f"{lo:g}-{hi:g}"
+        out.append(s)
+    return out
+
+def _print_bins(title, rows):
+    print(f"[INFO] {title}")
+    for r in rows:
+        print(f"  {r['bin']:>7s}  n={r['races']:5d}  hit={r['hit_rate']:5.1f}%  roi={r['roi']:6.1f}%  profit={r['profit']:+,}")
+
+
+# =========================
+# グリッド評価
+# =========================
+def build_grid():
+    g = np.array([(m12, m15, w) for m12 in GRID_GAP12_MID for m15 in GRID_GAP15_MID for w in GRID_W12])
+    w12 = g[:, 2]
+    w15 = np.round(1.0 - w12, 6)   # 0.65 → 0.35 のように丸めて浮動小数の誤差を残さない
+    return g[:, 0], g[:, 1], w12, w15
+
+def evaluate_grid(D, mid12, mid15, w12, w15, th):
+    """
+    return: (G, T) の配列 dict（focus 数 / 的中数 / 払戻）
+    """
+    G, T = len(mid12), len(th)
+    n = np.zeros((G, T), dtype=np.int64)
+    hits = np.zeros((G, T), dtype=np.int64)
+    pay = np.zeros((G, T), dtype=np.int64)
+    hit = D["hit"].astype(np.int64)
+    payout = D["payout"] * BET_UNIT // 100
+    for s in range(0, G, CHUNK):
+        sl = slice(s, s + CHUNK)
+        K = konsen_values(D["gap12"], D["gap15"], mid12[sl], mid15[sl], w12[sl], w15[sl])  # (g, R)
+        F = K[:, None, :] >= th[None, :, None]                                              # (g, T, R)
+        n[sl] = F.sum(axis=2)
+        hits[sl] = F @ hit
+        pay[sl] = F @ payout
+    return {"n": n, "hits": hits, "payout": pay}
+
+def objective(ev, name=KONSEN_OBJECTIVE, min_focus=KONSEN_MIN_FOCUS):
+    n = ev["n"].astype(np.float64)
+    invest = n * BOX_POINTS * BET_UNIT
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if name == "focus_roi":
+            v = ev["payout"] / invest
+        elif name == "hit_rate":
+            v = ev["hits"] / n
+        elif name == "profit":
+            v = (ev["payout"] - invest).astype(np.float64)
+        else:
+            raise SystemExit(f"[FATAL] unknown KONSEN_OBJECTIVE: {name}")
+    return np.where(n >= min_focus, v, -np.inf)
+
+def eval_one(D, p):
+    """1設定（dict）を評価 → stats"""
+    K = konsen_values(D["gap12"], D["gap15"], np.array([p["gap12_mid"]]), np.array([p["gap15_mid"]]),
+                      np.array([p["w12"]]), np.array([p["w15"]]))[0]
+    F = K >= p["focus_th"]
+    return _stats(int(F.sum()), int(D["hit"][F].sum()), int(D["payout"][F].sum()) * BET_UNIT // 100)
+
+
+def main():
+    t0 = datetime.now()
+    races = history.load_result_races(date_from=DATE_FROM, date_to=DATE_TO)
+    D = load_arrays(races)
+    R = len(D["hit"])
+    print(f"[INFO] races={len(races)} usable={R} (result + gap12/gap15 + top5)")
+    if R == 0:
+        raise SystemExit("[FATAL] no usable history")
+
+    cur = {
+        "gap12_mid": P.SCORING.konsen_gap12_mid,
+        "gap15_mid": P.SCORING.konsen_gap15_mid,
+        "w12": P.SCORING.konsen_w12,
+        "w15": P.SCORING.konsen_w15,
+        "focus_th": P.SCORING.konsen_focus_th,
+    }
+
+    # 保存値の再現チェック（gap は小数2桁で保存されているので値は ±0.1 ずれ得る。
+    # 古い日付は別の mid で出しているので、そこはずれて当然）
+    K0 = konsen_values(D["gap12"], D["gap15"], np.array([cur["gap12_mid"]]), np.array([cur["gap15_mid"]]),
+                       np.array([cur["w12"]]), np.array([cur["w15"]]))[0]
+    same_val = float(np.mean(np.abs(K0 - D["value"]) <= 0.1 + 1e-9))
+    same_focus = float(np.mean((K0 >= cur["focus_th"]) == D["is_focus"]))
+    print(f"[INFO] recompute check: value(±0.1)={100 * same_val:.1f}%  is_focus={100 * same_focus:.1f}%")
+
+    # 帯ごとの表（保存されている konsen そのまま）
+    bins_all = bin_report(D["value"], D["hit"], D["payout"])
+    _print_bins("konsen bins (all)", bins_all)
+    bins_place = {}
+    for place in sorted(set(D["place"].tolist())):
+        sel = D["place"] == place
+        rows = bin_report(D["value"][sel], D["hit"][sel], D["payout"][sel], min_n=KONSEN_MIN_BIN)
+        if rows:
+            bins_place[place] = rows
+            _print_bins(f"konsen bins ({place})", rows)
+
+    # グリッド（学習＝前側の日付）
+    train, test, cut = split_by_date(D, KONSEN_HOLDOUT)
+    mid12, mid15, w12, w15 = build_grid()
+    th = np.asarray(GRID_FOCUS_TH, dtype=np.float64)
+    print(f"[INFO] grid configs={len(mid12)} x th={len(th)}  train={len(train['hit'])} test={len(test['hit']) if test else 0} cut={cut}")
+
+    ev = evaluate_grid(train, mid12, mid15, w12, w15, th)
+    obj = objective(ev)
+    if not np.isfinite(obj).any():
+        raise SystemExit(f"[FATAL] no config has >= {KONSEN_MIN_FOCUS} focus races (KONSEN_MIN_FOCUS)")
+    gi, ti = np.unravel_index(int(np.argmax(obj)), obj.shape)
+    best = {
+        "gap12_mid": float(mid12[gi]),
+        "gap15_mid": float(mid15[gi]),
+        "w12": float(w12[gi]),
+        "w15": float(w15[gi]),
+        "focus_th": float(th[ti]),
+    }
+
+    report = {}
+    for name, p in (("current", cur), ("best", best)):
+        report[name] = {"params": p, "train": eval_one(train, p), "all": eval_one(D, p)}
+        if test:
+            report[name]["test"] = eval_one(test, p)
+        for part in ("train", "test", "all"):
+            s = report[name].get(part)
+            if s:
+                print(f"[OK] {name:7s} {part:5s} focus={s['races']:5d} hit={s['hit_rate']}% roi={s['roi']}% profit={s['profit']:+,}")
+
+    print(f"[INFO] objective={KONSEN_OBJECTIVE}  suggested env:")
+    print(f"  KONSEN_GAP12_MID={best['gap12_mid']:g}")
+    print(f"  KONSEN_GAP15_MID={best['gap15_mid']:g}")
+    print(f"  KONSEN_W12={best['w12']:g}")
+    print(f"  KONSEN_W15={best['w15']:g}")
+    print(f"  KONSEN_FOCUS_TH={best['focus_th']:g}")
+
+    out = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "date_from": DATE_FROM,
+        "date_to": DATE_TO,
+        "objective": KONSEN_OBJECTIVE,
+        "min_focus": KONSEN_MIN_FOCUS,
+        "holdout_from": cut,
+        "races": R,
+        "recompute": {"value_match": round(same_val, 4), "focus_match": round(same_focus, 4)},
+        "bins": bins_all,
+        "bins_by_place": bins_place,
+        "current": report["current"],
+        "best": report["best"],
+    }
+    Path(KONSEN_CALIB_OUT).write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"[OK] wrote {KONSEN_CALIB_OUT}  ({(datetime.now() - t0).total_seconds():.1f}s)")
+
+if __name__ == "__main__":
+    main()
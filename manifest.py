@@ -0,0 +1,143 @@
+# manifest.py  (fieldnote-lab-bot)
+# 目的：
+# - 日付ごとの実行記録 output/manifest_{yyyymmdd}.json を predict / result が書く
+#   ・開催場ごとに：出したファイル（json / html）、中身のハッシュ、レース数、スキップの内訳、状態
+#   ・出せなかった開催場も理由つきで残す（status=skipped）
+# - wp_post とワークフローの「投稿するか」判定はこれだけを読む（output/ を glob しない、JSON 本体も開かない）
+# - 書き込みは一時ファイル → os.replace（途中で落ちても壊れたマニフェストが残らない）
+#   開催場を1つ出すたびに書き直すので、途中で落ちてもそこまでの分は投稿できる
+#
+# 形：
+#   {"type": "fieldnote_manifest", "date": ..., "predict": {section}, "result": {section}}
+#   section = {"status": "running" | "done", "updated_at": ..., "tracks": [entry, ...], "summary": {...}}
+#   entry   = {"place", "baba", "place_code", "status": "ok" | "skipped", "reason"?, "races",
+#              "json"?, "html"?, "sha1": {"json", "html"}?, "content_sha1": {"json", "html"}?,
+#              "changed": {"json": bool, "html": bool}?, "skips"?, ...}
+#   sha1 = ファイルのバイト列 / content_sha1 = generated_at を除いた中身（outwrite.content_sha1）
+#   changed = その実行でファイルを書き直したか（False = 中身が前回と同じ。投稿し直す必要は無い）
+#   summary.feed = その日の feed_{yyyymmdd}.json（feed.py）の {"json", "gz"?, "etag", "bytes"}
+#   section の中身が前回の実行と同じなら前回の section をそのまま残す（updated_at / changed も前のまま。
+#   マニフェスト自体も差分を出さない）
+#
+# 使い方（ワークフローから）：
+#   python manifest.py has predict 20260301    # その日の predict に出せた開催場があれば exit 0（HAS=1 を表示）
+#   python manifest.py show 20260301           # 中身を表示
+
+import os, sys, json, hashlib
+from datetime import datetime
+from pathlib import Path
+
+import outwrite as OW
+
+MANIFEST_DIR = os.environ.get("MANIFEST_DIR", "output")
+KINDS = ("predict", "result")
+
+
+def manifest_path(yyyymmdd: str, out_dir: str = None) -> Path:
+    return Path(out_dir or MANIFEST_DIR) / f"manifest_{yyyymmdd}.json"
+
+def sha1_file(path) -> str:
+    return hashlib.sha1(Path(path).read_bytes()).hexdigest()
+
+def load(yyyymmdd: str, out_dir: str = None):
+    """return: manifest（無い / 読めなければ None）"""
+    p = manifest_path(yyyymmdd, out_dir)
+    if not p.is_file():
+        return None
+    try:
+        d = json.loads(p.read_text(encoding="utf-8"))
+    except Exception as e:
+        print(f"[WARN] manifest read failed: {p} err={e}")
+        return None
+    return d if isinstance(d, dict) else None
+
+
+# =========================
+# 書く（predict / result から）
+# =========================
+def track_entry(track, status: str = "ok", json_path=None, html_path=None, **extra) -> dict:
+    """track: tracks.Track。json / html を渡せばパスとハッシュを入れる"""
+    e = {"place": track.name, "baba": track.baba, "place_code": str(extra.pop("place_code", track.code)), "status": status}
+    if json_path is not None:
+        e["json"] = Path(json_path).as_posix()
+        e["html"] = Path(html_path).as_posix() if html_path is not None else None
+        e["sha1"] = {"json": sha1_file(json_path), "html": sha1_file(html_path) if html_path is not None else None}
+        e["content_sha1"] = {"json": OW.content_sha1_file(json_path),
+                             "html": OW.content_sha1_file(html_path) if html_path is not None else None}
+    e.update(extra)
+    return e
+
+def _same_content(a: dict, b: dict) -> bool:
+    """changed（今回書いたか）と時刻を除いて同じか"""
+    def strip(sec):
+        sec = json.loads(json.dumps(sec, ensure_ascii=False))
+        for t in sec.get("tracks") or []:
+            t.pop("changed", None)
+        return OW.content_sha1(json.dumps(sec, ensure_ascii=False), ".json")
+    return strip(a) == strip(b)
+
+class Section:
+    """1回の predict / result 実行ぶん。add() のたびにマニフェストを書き直す"""
+
+    def __init__(self, yyyymmdd: str, kind: str, out_dir: str = None):
+        assert kind in KINDS
+        self.date, self.kind, self.out_dir = str(yyyymmdd), kind, out_dir
+        self.tracks = []
+        self.summary = {}
+        # 前回の実行ぶん（中身が同じなら最後にこれへ戻す）
+        self._prev = ((load(self.date, self.out_dir) or {}).get(kind) or None)
+
+    def add(self, entry: dict):
+        self.tracks = [t for t in self.tracks if t["place"] != entry["place"]] + [entry]
+        self._save("running")
+
+    def done(self, **summary):
+        self.summary.update(summary)
+        self._save("done")
+
+    def _save(self, status: str):
+        d = load(self.date, self.out_dir) or {"type": "fieldnote_manifest", "date": self.date}
+        sec = {
+            "status": status,
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+            "tracks": self.tracks,
+            "summary": self.summary,
+        }
+        if status == "done" and self._prev and _same_content(sec, self._prev):
+            sec = self._prev
+        d[self.kind] = sec
+        OW.write_text(manifest_path(self.date, self.out_dir), json.dumps(d, ensure_ascii=False, indent=2))
+
+
+# =========================
+# 読む（wp_post / ワークフローから）
+# =========================
+def ok_tracks(yyyymmdd: str, kind: str, out_dir: str = None):
+    """その日の kind で出せた開催場のエントリ（マニフェストが無ければ空）"""
+    d = load(yyyymmdd, out_dir) or {}
+    return [t for t in (d.get(kind) or {}).get("tracks") or [] if t.get("status") == "ok" and t.get("json")]
+
+
+def main():
+    args = sys.argv[1:]
+    if len(args) == 3 and args[0] == "has" and args[1] in KINDS:
+        n = len(ok_tracks(args[2], args[1]))
+        print(f"HAS={1 if n else 0}")
+        print(f"[INFO] manifest {args[1]} {args[2]}: ok tracks={n}")
+        raise SystemExit(0 if n else 1)
+    if len(args) == 2 and args[0] == "show":
+        d = load(args[1])
+        if not d:
+            raise SystemExit(f"[FATAL] manifest not found: {manifest_path(args[1])}")
+        for kind in KINDS:
+            sec = d.get(kind)
+            if not sec:
+                continue
+            print(f"[{kind}] status={sec.get('status')} updated_at={sec.get('updated_at')} summary={sec.get('summary')}")
+            for t in sec.get("tracks") or []:
+                print(f"  {t['place']:4s} {t['status']:7s} races={t.get('races')} {t.get('json') or t.get('reason')}")
+        return
+    raise SystemExit("usage: python manifest.py has predict|result YYYYMMDD | show YYYYMMDD")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# migrate_filenames.py  (fieldnote-lab-bot)
+# 目的：
+# - output/ の旧ファイル名を tracks.py の規則（{kind}_{yyyymmdd}_{baba}.{ext}）に一度だけ付け替える
+#   ・以前の result / shadow_result は keibablood コード（例：高知 54）だった → baba（高知 31）へ
+#   ・水沢(keibablood 36) と 門別(baba 36) がぶつかるので、コードからは決めない。JSON の "place" で決める
+#     （html は同じ名前の json の place に従う）
+# - 付け替えは2段階（一旦 .migrating に逃がしてから本来の名前へ）なので、入れ替わりでも上書きしない
+# - 何度流しても同じ（付け替え済みのファイルはそのまま）
+#
+# 使い方：
+#   python migrate_filenames.py                  # 予定だけ表示（dry run）
+#   MIGRATE_APPLY=1 python migrate_filenames.py  # 実行
+
+import os, re, json
+from pathlib import Path
+
+import tracks as T
+
+OUTPUT_DIR = os.environ.get("OUTPUT_DIR", "output")
+MIGRATE_APPLY = os.environ.get("MIGRATE_APPLY", "").strip() == "1"
+
+NAME_RE = re.compile(r"^(predict|result|shadow|shadow_result)_(\d{8})_(\d+)\.(json|html)$")
+
+
+def _place_of(json_path: Path):
+    try:
+        d = json.loads(json_path.read_text(encoding="utf-8"))
+    except Exception as e:
+        print(f"[WARN] read failed: {json_path} err={e}")
+        return None
+    return d.get("place") if isinstance(d, dict) else None
+
+def plan(out_dir: str = OUTPUT_DIR):
+    """return: [(src, dst)]（付け替えが要るものだけ）, 警告の数"""
+    moves, warns = [], 0
+    for p in sorted(Path(out_dir).iterdir()):
+        m = NAME_RE.match(p.name)
+        if not m:
+            continue
+        kind, date, _code, ext = m.groups()
+        place = _place_of(p.with_suffix(".json"))
+        t = T.get(place)
+        if t is None:
+            print(f"[WARN] {p.name}: place unknown ({place!r}) -> skip")
+            warns += 1
+            continue
+        dst = T.output_path(kind, date, t, ext, out_dir=out_dir)
+        if dst.name != p.name:
+            moves.append((p, dst))
+
+    srcs = {s for s, _ in moves}
+    ok = []
+    for s, d in moves:
+        if d.exists() and d not in srcs:
+            print(f"[WARN] {s.name} -> {d.name}: target exists -> skip")
+            warns += 1
+            continue
+        ok.append((s, d))
+    dsts = [d for _, d in ok]
+    if len(set(dsts)) != len(dsts):
+        raise SystemExit("[FATAL] two files map to the same name (check place fields)")
+    return ok, warns
+
+def apply(moves):
+    tmp = []
+    for s, d in moves:
+        t = s.with_name(s.name + ".migrating")
+        os.replace(s, t)
+        tmp.append((t, d))
+    for t, d in tmp:
+        os.replace(t, d)
+
+
+def main():
+    moves, warns = plan()
+    for s, d in moves[:20]:
+        print(f"  {s.name} -> {d.name}")
+    if len(moves) > 20:
+        print(f"  ... (+{len(moves) - 20})")
+    if not MIGRATE_APPLY:
+        print(f"[INFO] dry run: {len(moves)} files to rename, warnings={warns} (MIGRATE_APPLY=1 to apply)")
+        return
+    apply(moves)
+    print(f"[OK] renamed {len(moves)} files, warnings={warns}")
+
+if __name__ == "__main__":
+    main()
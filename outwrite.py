@@ -0,0 +1,62 @@
+# outwrite.py  (fieldnote-lab-bot)
+# 目的：
+# - output/ への書き込みを「中身が変わった時だけ」にする
+#   ・JSON は generated_at などの時刻キーを除いた中身でハッシュを取る（キー順・空白も無視）
+#     → 同じ DATE を流し直しても、中身が同じならファイルはそのまま（git に差分が出ない）
+#   ・HTML はそのままのテキストでハッシュ
+# - 書く時は一時ファイル → os.replace（途中で落ちても半端なファイルが残らない）
+# - 中身のハッシュ（content_sha1）はマニフェストに載せる（wp_post などは本体を開かずに変化を知れる）
+#
+# 使い方（predict / result から）：
+#   changed = outwrite.write_text(path, text)   # True = 書いた / False = 中身が同じなので書かなかった
+
+import os, json, hashlib
+from pathlib import Path
+
+# 実行のたびに変わるだけのキー（どの深さにあっても中身の比較から外す）
+VOLATILE_KEYS = ("generated_at", "updated_at", "last_updated")
+
+
+def _strip_volatile(x):
+    if isinstance(x, dict):
+        return {k: _strip_volatile(v) for k, v in x.items() if k not in VOLATILE_KEYS}
+    if isinstance(x, list):
+        return [_strip_volatile(v) for v in x]
+    return x
+
+def content_sha1(text: str, name: str = "") -> str:
+    """中身のハッシュ。.json は時刻キーを除いて正規化してから（読めなければテキストのまま）"""
+    if str(name).endswith(".json"):
+        try:
+            text = json.dumps(_strip_volatile(json.loads(text)), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        except ValueError:
+            pass
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def content_sha1_file(path):
+    """ファイルの中身のハッシュ（無ければ None）"""
+    p = Path(path)
+    if not p.is_file():
+        return None
+    return content_sha1(p.read_text(encoding="utf-8"), p.name)
+
+def write_atomic_bytes(path, data: bytes):
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(p.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, p)
+
+def write_atomic(path, text: str):
+    write_atomic_bytes(path, text.encode("utf-8"))
+
+def write_text(path, text: str) -> bool:
+    """
+    中身が今のファイルと違う時だけ書く（原子的に）
+    return: 書いたら True
+    """
+    p = Path(path)
+    if p.is_file() and content_sha1_file(p) == content_sha1(text, p.name):
+        return False
+    write_atomic(p, text)
+    return True
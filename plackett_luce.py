@@ -0,0 +1,261 @@
+# plackett_luce.py  (fieldnote-lab-bot)
+# 目的：
+# - レースの score から着順確率を出す（Plackett–Luce：強さ w_i = exp(score_i / T)）
+#   ・単勝（1着）/ 2着内 / 3着内 / 馬単（1着→2着）/ 三連複（全 C(n,3) 組）
+#   ・モンテカルロではなく解析解：P(i→j→k) = p_i · p_j/(1-p_i) · p_k/(1-p_i-p_j) を (N,N,N) で一度に計算
+#     （N<=18 なら 5832 要素なので 1レース 1ms 未満。複数レースは (R,N,N,N) でまとめて）
+# - 温度 T は result 履歴の着順から最尤推定して output/pl_calib.json に保存（python plackett_luce.py）
+#
+# 校正データ：
+# - predict に全頭ブロック field があるレース → 全頭を現在の設定で再スコアして、1-3着の順序の尤度
+# - field が無い古いレース → 上位5頭（picks）だけの尤度。PL は「一部の馬だけの相対順位もまた同じ強さの PL」
+#   になるので、5頭中で 1-3着に入った馬の順序（入らなかった馬はその後ろ）はそのまま尤度に使える
+#
+# 使い方：
+#   python plackett_luce.py                   # 温度を推定して PL_CALIB_FILE へ
+#   DATE_TO=20260630 python plackett_luce.py  # 期間を区切る
+
+import os, json, math, itertools
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+PL_CALIB_FILE = os.environ.get("PL_CALIB_FILE", "output/pl_calib.json")
+PL_MIN_RACES = int(os.environ.get("PL_MIN_RACES", "200"))   # 開催場別の温度を作る最低レース数
+DATE_FROM = os.environ.get("DATE_FROM", "").strip() or None
+DATE_TO = os.environ.get("DATE_TO", "").strip() or None
+
+_COMB3 = {}  # N -> (C,3) の組合せ index
+
+
+def comb3_index(n: int):
+    idx = _COMB3.get(n)
+    if idx is None:
+        idx = np.array(list(itertools.combinations(range(n), 3)), dtype=np.int16).reshape(-1, 3)
+        _COMB3[n] = idx
+    return idx
+
+
+# =========================
+# 強さ → 着順確率
+# =========================
+def win_probs(scores, mask=None, temp=10.0):
+    """
+    scores: (R, N)  mask: (R, N)（None なら全部有効）
+    return: (R, N) の単勝確率（softmax(score / T)。無効枠は 0）
+    """
+    s = np.asarray(scores, dtype=np.float64)
+    m = np.ones(s.shape, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+    x = np.where(m, s / float(temp), -np.inf)
+    mx = np.max(x, axis=1, keepdims=True, initial=-np.inf)
+    e = np.where(m, np.exp(x - np.where(np.isfinite(mx), mx, 0.0)), 0.0)
+    tot = e.sum(axis=1, keepdims=True)
+    return e / np.where(tot > 0, tot, 1.0)
+
+def ordered_top3(p):
+    """
+    p: (R, N) 単勝確率
+    return: (R, N, N, N)  P(i が1着, j が2着, k が3着)（i,j,k が重なる所は 0）
+    """
+    R, N = p.shape
+    pi = p[:, :, None, None]
+    pj = p[:, None, :, None]
+    pk = p[:, None, None, :]
+    d1 = 1.0 - pi
+    d2 = 1.0 - pi - pj
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = pi * np.where(d1 > 1e-12, pj / d1, 0.0) * np.where(d2 > 1e-12, pk / d2, 0.0)
+    eye = np.eye(N, dtype=bool)
+    distinct = ~(eye[:, :, None] | eye[:, None, :] | eye[None, :, :])
+    return np.where(distinct[None], out, 0.0)
+
+def race_probs(p, ordered=None):
+    """
+    p: (R, N) 単勝確率
+    return: dict
+      win (R,N) / top2 (R,N) / top3 (R,N) / exacta (R,N,N)=P(i→j) / trio (R,C)（comb3_index(N) の順）
+    """
+    R, N = p.shape
+    o = ordered_top3(p) if ordered is None else ordered
+    exacta = o.sum(axis=3)                      # P(1着 i, 2着 j)
+    second = exacta.sum(axis=1)                 # P(2着 = j)
+    third = o.sum(axis=(1, 2))                  # P(3着 = k)
+    out = {
+        "win": p,
+        "top2": p + second,
+        "top3": p + second + third,
+        "exacta": exacta,
+    }
+    if N >= 3:
+        c = comb3_index(N)
+        a, b, d = c[:, 0], c[:, 1], c[:, 2]
+        # 三連複 = 6通りの着順の和
+        out["trio"] = (o[:, a, b, d] + o[:, a, d, b] + o[:, b, a, d] +
+                       o[:, b, d, a] + o[:, d, a, b] + o[:, d, b, a])
+    else:
+        out["trio"] = np.zeros((R, 0))
+    return out
+
+def box_trio_prob(trio, n: int, box_idx):
+    """trio: (C,) 1レース分 / box_idx: BOX に入れる馬の位置（0始まり）-> 三連複BOXが当たる確率"""
+    if n < 3:
+        return 0.0
+    c = comb3_index(n)
+    inbox = np.zeros(n, dtype=bool)
+    inbox[list(box_idx)] = True
+    sel = inbox[c].all(axis=1)
+    return float(trio[sel].sum())
+
+def single_race(scores, temp=10.0, top_trios=10):
+    """
+    1レース分（predict 用）：scores は表示順どおりの list
+    return: dict(win, top2, top3 は list / trio_top は確率上位の三連複 [(i,j,k 位置), p])
+    """
+    s = np.asarray([scores], dtype=np.float64)
+    p = win_probs(s, temp=temp)
+    rp = race_probs(p)
+    n = s.shape[1]
+    out = {
+        "win": rp["win"][0].tolist(),
+        "top2": rp["top2"][0].tolist(),
+        "top3": rp["top3"][0].tolist(),
+        "trio": rp["trio"][0],
+        "trio_top": [],
+    }
+    if n >= 3:
+        c = comb3_index(n)
+        order = np.argsort(-rp["trio"][0], kind="stable")[:top_trios]
+        out["trio_top"] = [(tuple(int(x) for x in c[i]), float(rp["trio"][0][i])) for i in order]
+    return out
+
+
+# =========================
+# 温度の推定（最尤）
+# =========================
+def neg_loglik(temp, S, M, O):
+    """
+    S: (R, N) score / M: (R, N) 有効枠 / O: (R, 3) 観測された順序（位置 index。-1 は観測なし）
+    return: 1レースあたりの負の対数尤度
+    """
+    x = np.where(M, S / float(temp), -np.inf)
+    x = x - np.max(x, axis=1, keepdims=True)
+    w = np.where(M, np.exp(x), 0.0)
+    rows = np.arange(S.shape[0])
+    remain = w.sum(axis=1)
+    ll = np.zeros(S.shape[0])
+    for t in range(O.shape[1]):
+        o = O[:, t]
+        ok = o >= 0
+        wo = w[rows, np.where(ok, o, 0)]
+        ll += np.where(ok, np.log(np.where(ok, wo, 1.0)) - np.log(np.where(remain > 0, remain, 1.0)), 0.0)
+        remain = remain - np.where(ok, wo, 0.0)
+    return float(-ll.mean()) if len(ll) else 0.0
+
+def fit_temperature(S, M, O, lo=0.5, hi=200.0, iters=60):
+    """log T 上の黄金分割（尤度は T について単峰）"""
+    a, b = math.log(lo), math.log(hi)
+    g = (math.sqrt(5.0) - 1.0) / 2.0
+    c, d = b - g * (b - a), a + g * (b - a)
+    fc, fd = neg_loglik(math.exp(c), S, M, O), neg_loglik(math.exp(d), S, M, O)
+    for _ in range(iters):
+        if fc < fd:
+            b, d, fd = d, c, fc
+            c = b - g * (b - a)
+            fc = neg_loglik(math.exp(c), S, M, O)
+        else:
+            a, c, fc = c, d, fd
+            d = a + g * (b - a)
+            fd = neg_loglik(math.exp(d), S, M, O)
+    t = math.exp((a + b) / 2.0)
+    return t, neg_loglik(t, S, M, O)
+
+def build_calib_data(races):
+    """
+    races: list[HistRace]
+    return: (S, M, O, places, exact) numpy 配列
+    """
+    import predict_all_today as P
+    import batch_scoring as B
+
+    exact = [h for h in races if h.field]
+    legacy = [h for h in races if not h.field and len(h.pick_umaban) >= 5]
+    N = max([len(h.field.get("umaban") or []) for h in exact] + [5])
+    R = len(exact) + len(legacy)
+    S = np.zeros((R, N))
+    M = np.zeros((R, N), dtype=bool)
+    O = np.full((R, 3), -1, dtype=np.int16)
+
+    if exact:
+        rows = [P.runners_from_field(h.field) for h in exact]
+        pools = [P.SpPool(**h.sp_pool) if h.sp_pool else None for h in exact]
+        feat = B.prepare_batch(rows, norm_method=P.SCORING.norm_method, pools=pools)
+        sc = B.combine_scores(feat)
+        n0 = sc.shape[1]
+        S[:len(exact), :n0] = np.nan_to_num(sc)
+        M[:len(exact), :n0] = feat["mask"]
+    for i, h in enumerate(exact):
+        pos = {int(u): j for j, u in enumerate(h.field.get("umaban") or [])}
+        for t, u in enumerate(h.top3[:3]):
+            if int(u) not in pos:
+                break
+            O[i, t] = pos[int(u)]
+
+    for k, h in enumerate(legacy):
+        i = len(exact) + k
+        S[i, :5] = h.pick_score[:5]
+        M[i, :5] = True
+        pos = {int(u): j for j, u in enumerate(h.pick_umaban[:5])}
+        t = 0
+        for u in h.top3[:3]:
+            if int(u) in pos:
+                O[i, t] = pos[int(u)]
+                t += 1
+
+    places = [h.place for h in exact + legacy]
+    is_exact = np.arange(R) < len(exact)
+    return S, M, O, places, is_exact
+
+
+def main():
+    import history
+
+    t0 = datetime.now()
+    races = history.load_history(date_from=DATE_FROM, date_to=DATE_TO)
+    S, M, O, places, is_exact = build_calib_data(races)
+    print(f"[INFO] races={len(places)} exact={int(is_exact.sum())} legacy(top5)={int((~is_exact).sum())}")
+    if not places:
+        raise SystemExit("[FATAL] no history")
+
+    temp, nll = fit_temperature(S, M, O)
+    nll_flat = neg_loglik(1e9, S, M, O)  # T→∞ = 全馬同じ強さ
+    print(f"[OK] temp={temp:.3f}  nll/race={nll:.4f}  (uniform={nll_flat:.4f})")
+
+    tracks = {}
+    pl = np.asarray(places)
+    for place in sorted(set(places)):
+        sel = pl == place
+        if sel.sum() < PL_MIN_RACES:
+            print(f"[SKIP] {place}: races={int(sel.sum())} < {PL_MIN_RACES}")
+            continue
+        t, v = fit_temperature(S[sel], M[sel], O[sel])
+        tracks[place] = {"temp": round(t, 4), "n": int(sel.sum()), "nll": round(v, 4)}
+        print(f"[OK] {place:4s} temp={t:.3f} n={int(sel.sum())} nll/race={v:.4f}")
+
+    out = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "date_from": DATE_FROM,
+        "date_to": DATE_TO,
+        "temp": round(temp, 4),
+        "n": len(places),
+        "n_exact": int(is_exact.sum()),
+        "nll": round(nll, 4),
+        "nll_uniform": round(nll_flat, 4),
+        "tracks": tracks,
+    }
+    Path(PL_CALIB_FILE).parent.mkdir(parents=True, exist_ok=True)
+    Path(PL_CALIB_FILE).write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"[OK] wrote {PL_CALIB_FILE}  ({(datetime.now() - t0).total_seconds():.1f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+# pnl_ledger.py  (fieldnote-lab-bot)
+# 目的：
+# - 収支の台帳（output/pnl_ledger.jsonl）を追記だけで持つ。キーは (日付, 開催場, R)
+#   ・同じレースをもう一度書くと「後の行が勝ち」（upsert）。中身が同じなら何も書かない
+#     → result_all_today を同じ DATE で何度流しても二重に数えない
+# - output/pnl_total.json は台帳から作る集計（公開用：累計 / 開催場別 / 月別 / 直近 7・30・90 日だけ）
+#   ・更新は差分だけ：そのレースの旧レコードを引いて新レコードを足す（全件の再集計はしない）
+#   ・直近 N 日は足し込み済みのベクトル（rolling）を持つ。新しい日が来たら、窓から外れた日のバケツを引くだけ
+#   ・差分更新に要る中間状態（直近 max(ROLLING_DAYS) 日の日別バケツ、rolling、台帳サイズ）は
+#     output/pnl_state.json に別に持つ（日数で頭打ち。公開ファイルは日が増えても大きくならない）
+#   ・台帳のサイズが状態ファイルの記録と違う（手で直した等）時だけ台帳から作り直す
+#
+# 台帳の1行：
+#   {"date","place","race_no","settled"(1-3着が取れた),"pred_hit","focus","hit","invest","payout","at"}
+#
+# 使い方：
+#   python pnl_ledger.py        # 台帳から集計を作り直す（台帳が無ければ output/result_*.json から台帳を起こす）
+
+import os, json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import outwrite as OW
+
+LEDGER_FILE = os.environ.get("PNL_LEDGER", "output/pnl_ledger.jsonl")
+PNL_FILE = os.environ.get("PNL_FILE", "output/pnl_total.json")
+PNL_STATE = os.environ.get("PNL_STATE", "output/pnl_state.json")
+ROLLING_DAYS = (7, 30, 90)
+KEEP_DAYS = max(ROLLING_DAYS)
+
+# バケツ：[結果ありレース, 予想的中(上位5に1-3着), 注目レース, 注目的中, 投資, 払戻]
+B_PRED, B_PRED_HIT, B_FOCUS, B_HIT, B_INVEST, B_PAYOUT = range(6)
+
+
+def race_record(date: str, place: str, race_no: int, settled: bool, pred_hit: bool, bet_box: dict) -> dict:
+    bet = bet_box or {}
+    focus = bool(bet.get("is_focus"))
+    return {
+        "date": str(date),
+        "place": str(place),
+        "race_no": int(race_no),
+        "settled": int(bool(settled)),
+        "pred_hit": int(bool(settled and pred_hit)),
+        "focus": int(focus),
+        "hit": int(bool(focus and bet.get("hit"))),
+        "invest": int(bet.get("invest", 0) or 0) if focus else 0,
+        "payout": int(bet.get("payout", 0) or 0) if focus else 0,
+    }
+
+def _vec(rec):
+    if not rec:
+        return [0] * 6
+    return [rec["settled"], rec["pred_hit"], rec["focus"], rec["hit"], rec["invest"], rec["payout"]]
+
+def _same(a, b) -> bool:
+    return bool(a) and bool(b) and all(a.get(k) == b.get(k) for k in b if k != "at")
+
+
+# =========================
+# 台帳（jsonl）
+# =========================
+def read_ledger(path: str = None, date: str = None, place: str = None) -> dict:
+    """return: (date, place, race_no) -> 最新の行（date / place を渡せばその分だけ）"""
+    path = path or LEDGER_FILE
+    if not Path(path).is_file():
+        return {}
+    # 先に文字列で絞ってから JSON にする（1日分を引くのに全行パースしない）
+    needle = f'"date":"{date}"' if date else None
+    out = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if needle and needle not in line:
+                continue
+            try:
+                r = json.loads(line)
+            except Exception:
+                continue
+            if place and r.get("place") != place:
+                continue
+            out[(r["date"], r["place"], int(r["race_no"]))] = r
+    return out
+
+def _append(path: str, recs):
+    if not recs:
+        return
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for r in recs:
+            f.write(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
+# =========================
+# 集計（スナップショット）
+# =========================
+def empty_snapshot() -> dict:
+    return {"type": "fieldnote_pnl_state", "total": [0] * 6, "by_place": {}, "by_month": {},
+            "as_of": None, "days": {}, "rolling": {f"{n}d": [0] * 6 for n in ROLLING_DAYS}}
+
+def _add(vec, d, sign=1):
+    for i in range(6):
+        vec[i] += sign * d[i]
+
+def _shift(yyyymmdd: str, days: int) -> str:
+    return (datetime.strptime(yyyymmdd, "%Y%m%d") + timedelta(days=days)).strftime("%Y%m%d")
+
+def _advance(snap: dict, date: str):
+    """as_of を date まで進める：窓から外れた日のバケツを rolling から引き、KEEP_DAYS より前のバケツは捨てる"""
+    old = snap["as_of"]
+    snap["as_of"] = date
+    if old is None:
+        return
+    gap = (datetime.strptime(date, "%Y%m%d") - datetime.strptime(old, "%Y%m%d")).days
+    days = snap["days"]
+    for n in ROLLING_DAYS:
+        v = snap["rolling"][f"{n}d"]
+        if gap >= n:
+            v[:] = [0] * 6
+            continue
+        for i in range(gap):
+            b = days.get(_shift(old, -(n - 1) + i))
+            if b:
+                _add(v, b, -1)
+    for i in range(min(gap, KEEP_DAYS)):
+        days.pop(_shift(old, -(KEEP_DAYS - 1) + i), None)
+
+def _roll(snap: dict, date: str, delta):
+    if snap["as_of"] is None or date > snap["as_of"]:
+        _advance(snap, date)
+    as_of = snap["as_of"]
+    if date < _shift(as_of, -(KEEP_DAYS - 1)):
+        return
+    _add(snap["days"].setdefault(date, [0] * 6), delta)
+    for n in ROLLING_DAYS:
+        if date >= _shift(as_of, -(n - 1)):
+            _add(snap["rolling"][f"{n}d"], delta)
+
+def _apply(snap: dict, date: str, place: str, delta):
+    if not any(delta):
+        return
+    _add(snap["by_place"].setdefault(place, [0] * 6), delta)
+    _add(snap["by_month"].setdefault(date[:6], [0] * 6), delta)
+    _add(snap["total"], delta)
+    _roll(snap, date, delta)
+
+def _rates(v) -> dict:
+    pred, pred_hit, focus, hit, invest, payout = v
+    return {
+        "races": focus, "hits": hit, "invest": invest, "payout": payout, "profit": payout - invest,
+        "roi": round(payout / invest * 100.0, 1) if invest > 0 else None,
+        "hit_rate": round(hit / focus * 100.0, 1) if focus > 0 else None,
+        "pred_races": pred, "pred_hits": pred_hit,
+        "pred_hit_rate": round(pred_hit / pred * 100.0, 1) if pred > 0 else None,
+    }
+
+def render_snapshot(snap: dict) -> dict:
+    """pnl_total.json の中身（従来のキー＋開催場別 / 月別 / 直近 N 日）"""
+    tot = _rates(snap["total"])
+    out = {k: tot[k] for k in ("invest", "payout", "profit", "races", "hits", "roi", "hit_rate",
+                               "pred_races", "pred_hits", "pred_hit_rate")}
+    out["last_updated"] = datetime.now().isoformat(timespec="seconds")
+    out["pred_by_place"] = {
+        p: {"races": v[B_PRED], "hits": v[B_PRED_HIT], "hit_rate": _rates(v)["pred_hit_rate"]}
+        for p, v in snap["by_place"].items() if v[B_PRED] > 0
+    }
+    out["by_place"] = {p: _rates(v) for p, v in sorted(snap["by_place"].items())}
+    out["by_month"] = {m: _rates(v) for m, v in sorted(snap["by_month"].items())}
+    out["as_of"] = snap["as_of"]
+    out["rolling"] = {f"{n}d": _rates(snap["rolling"][f"{n}d"]) for n in ROLLING_DAYS} if snap["as_of"] else {}
+    return out
+
+def snapshot_from_ledger(path: str = None) -> dict:
+    snap = empty_snapshot()
+    for (date, place, _rno), r in read_ledger(path).items():
+        _apply(snap, date, place, _vec(r))
+    return snap
+
+def _ledger_bytes(ledger_path: str) -> int:
+    return Path(ledger_path).stat().st_size if Path(ledger_path).is_file() else 0
+
+def load_snapshot(state_path: str = None, ledger_path: str = None) -> dict:
+    """pnl_state.json を読む。無い / 台帳と食い違っていれば台帳から作り直す"""
+    state_path, ledger_path = state_path or PNL_STATE, ledger_path or LEDGER_FILE
+    size = _ledger_bytes(ledger_path)
+    try:
+        d = json.loads(Path(state_path).read_text(encoding="utf-8"))
+    except Exception:
+        d = None
+    if isinstance(d, dict) and d.get("type") == "fieldnote_pnl_state" and d.pop("ledger_bytes", None) == size:
+        return d
+    if size:
+        print(f"[INFO] pnl state out of date -> rebuild from {ledger_path}")
+    return snapshot_from_ledger(ledger_path)
+
+def save_snapshot(snap: dict, path: str = None, state_path: str = None, ledger_path: str = None):
+    """公開の集計（pnl_total.json）と中間状態（pnl_state.json）を書く。中身が同じなら（last_updated だけ違うなら）書かない"""
+    path, state_path, ledger_path = path or PNL_FILE, state_path or PNL_STATE, ledger_path or LEDGER_FILE
+    OW.write_text(path, json.dumps(render_snapshot(snap), ensure_ascii=False, indent=2))
+    state = {**snap, "ledger_bytes": _ledger_bytes(ledger_path)}
+    OW.write_text(state_path, json.dumps(state, ensure_ascii=False, separators=(",", ":")))
+
+
+# =========================
+# 更新（result_all_today から）
+# =========================
+def upsert_day(snap: dict, date: str, place: str, recs, ledger_path: str = None) -> int:
+    """
+    1開催場1日分のレースを台帳に upsert して、集計に差分だけ反映する
+    return: 台帳に書いた行数（中身が変わっていないレースは書かない）
+    """
+    ledger_path = ledger_path or LEDGER_FILE
+    old = read_ledger(ledger_path, date=str(date), place=str(place))
+    at = datetime.now().isoformat(timespec="seconds")
+    new = []
+    for r in recs:
+        prev = old.get((r["date"], r["place"], r["race_no"]))
+        if _same(prev, r):
+            continue
+        delta = [a - b for a, b in zip(_vec(r), _vec(prev))]
+        _apply(snap, r["date"], r["place"], delta)
+        new.append({**r, "at": at})
+    _append(ledger_path, new)
+    return len(new)
+
+
+# =========================
+# 台帳を result JSON から起こす
+# =========================
+def backfill(out_dir: str = "output", ledger_path: str = None) -> int:
+    import history
+
+    ledger_path = ledger_path or LEDGER_FILE
+    recs = []
+    for p in history.result_files(out_dir):
+        res = history._read_json(p)
+        if not isinstance(res, dict) or not res.get("date") or not res.get("place"):
+            continue
+        for rr in res.get("races") or []:
+            try:
+                rno = int(rr.get("race_no"))
+            except Exception:
+                continue
+            settled = len(rr.get("result_top3") or []) >= 3
+            recs.append(race_record(res["date"], res["place"], rno, settled, rr.get("pred_hit"), rr.get("bet_box")))
+    at = datetime.now().isoformat(timespec="seconds")
+    _append(ledger_path, [{**r, "at": at} for r in recs])
+    return len(recs)
+
+
+def main():
+    if not Path(LEDGER_FILE).is_file():
+        n = backfill()
+        print(f"[OK] backfilled {LEDGER_FILE} from result json: races={n}")
+    snap = snapshot_from_ledger()
+    save_snapshot(snap)
+    d = render_snapshot(snap)
+    print(f"[OK] wrote {PNL_FILE}  focus={d['races']} hits={d['hits']} roi={d['roi']}% profit={d['profit']:+,} "
+          f"pred={d['pred_hits']}/{d['pred_races']} ({d['pred_hit_rate']}%)")
+    for k, v in d["rolling"].items():
+        print(f"  {k:>4s} focus={v['races']} roi={v['roi']}% pred_hit_rate={v['pred_hit_rate']}%")
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,29 @@
 # 次は PART 2 / 4 を貼ってください（解析系：kaisekisya/NAR/吉馬/混戦度/スキップ関数追加）
 
 import os, re, json, time, math
+from dataclasses import dataclass, asdict, fields, replace as dc_replace
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
 import requests
 from bs4 import BeautifulSoup
 
+try:
+    import plackett_luce as PL  # NumPy が無い環境では確率列なしで動かす
+except ImportError:
+    PL = None
+
+import jockey_stats as JS
+import horse_index as HI
+import history_store as HS
+import tracks as T
+import manifest as MF
+import schema as SC
+import outwrite as OW
+import render as R
+import feed as FD
+
 UA = {"User-Agent": "Mozilla/5.0", "Accept-Language": "ja,en;q=0.8"}
 MARKS5 = ["◎", "〇", "▲", "△", "☆"]
 
@@ -34,6 +51,9 @@ KONSEN_NAME = os.environ.get("KONSEN_NAME", "混戦度")
 KONSEN_GAP12_MID = float(os.environ.get("KONSEN_GAP12_MID", "0.8"))
 KONSEN_GAP15_MID = float(os.environ.get("KONSEN_GAP15_MID", "3.0"))
 KONSEN_FOCUS_TH = float(os.environ.get("KONSEN_FOCUS_TH", "30"))
+# konsen = W12 × sig(gap12) + W15 × sig(gap15)（konsen_calib.py で履歴から合わせられる）
+KONSEN_W12 = float(os.environ.get("KONSEN_W12", "0.65"))
+KONSEN_W15 = float(os.environ.get("KONSEN_W15", "0.35"))
 KONSEN_DEBUG = os.environ.get("KONSEN_DEBUG", "").strip() == "1"
 
 # ===== 新馬戦っぽいレースをスキップ（指数が横並び等） =====
@@ -54,42 +74,192 @@ MIN_VALID_RATIO = float(os.environ.get("MIN_VALID_RATIO", "0.6"))
 # “全部同点っぽい” の判定（スコア最大-最小がこれ以下ならスキップ）
 FLAT_SCORE_RANGE_MAX = float(os.environ.get("FLAT_SCORE_RANGE_MAX", "0.2"))
 
-# ===== NAR（nar.k-ba.net）track code（= keiba.go.jp k_babaCode）※帯広(3)除外 =====
-BABA_CODE = {
-  "門別": 36,
-  "盛岡": 10,
-  "水沢": 11,
-  "浦和": 18,
-  "船橋": 19,
-  "大井": 20,
-  "川崎": 21,
-  "金沢": 22,
-  "笠松": 23,
-  "名古屋": 24,
-  "園田": 27,
-  "姫路": 28,
-  "高知": 31,
-  "佐賀": 32,
-}
-EXCLUDE_BABA = {3}  # 帯広ばんえい
-
-# ===== kaisekisya（開催場別）騎手成績 =====
-KAISEKISYA_JOCKEY_URL = {
-  "門別": "https://www.kaisekisya.net/local/jockey/monbetsu.html",
-  "盛岡": "https://www.kaisekisya.net/local/jockey/morioka.html",
-  "水沢": "https://www.kaisekisya.net/local/jockey/mizusawa.html",
-  "浦和": "https://www.kaisekisya.net/local/jockey/urawa.html",
-  "船橋": "https://www.kaisekisya.net/local/jockey/funabashi.html",
-  "大井": "https://www.kaisekisya.net/local/jockey/ooi.html",
-  "川崎": "https://www.kaisekisya.net/local/jockey/kawasaki.html",
-  "金沢": "https://www.kaisekisya.net/local/jockey/kanazawa.html",
-  "笠松": "https://www.kaisekisya.net/local/jockey/kasamatsu.html",
-  "名古屋": "https://www.kaisekisya.net/local/jockey/nagoya.html",
-  "園田": "https://www.kaisekisya.net/local/jockey/sonoda.html",
-  "姫路": "https://www.kaisekisya.net/local/jockey/himeji.html",
-  "高知": "https://www.kaisekisya.net/local/jockey/kochi.html",
-  "佐賀": "https://www.kaisekisya.net/local/jockey/saga.html",
-}
+# ===== スコア設定（不変オブジェクト）=====
+# - 上の環境変数（本番設定）をまとめたもの。スコア計算はグローバルではなくこれを受け取る
+# - SHADOW_VARIANTS で別設定（影モデル）を同じ取得・解析結果から同時に計算できる
+#   例: SHADOW_VARIANTS='{"sp_heavy":{"SP_W":1.5,"KB_W":0.3},"robust":{"NORM_METHOD":"robust"}}'
+#       （JSON文字列 or JSONファイルのパス。キーは環境変数名 or フィールド名）
+#   影モデルは公開せず output/shadow_{date}_{code}.json にだけ書く → result 側で採点
+SHADOW_VARIANTS = os.environ.get("SHADOW_VARIANTS", "").strip()
+
+@dataclass(frozen=True, slots=True)
+class ScoringConfig:
+    name: str = "prod"
+    sp_w: float = 1.0
+    kb_w: float = 0.5
+    jockey_w: float = 0.2
+    norm_method: str = "z"
+    score_base: float = 50.0
+    score_scale: float = 10.0
+    konsen_gap12_mid: float = 0.8
+    konsen_gap15_mid: float = 3.0
+    konsen_focus_th: float = 30.0
+    konsen_w12: float = 0.65
+    konsen_w15: float = 0.35
+    flat_score_range_max: float = 0.2
+
+    def with_overrides(self, name: str, overrides: dict):
+        """overrides のキーは "SP_W" / "sp_w" どちらでも可。未知のキーは ValueError"""
+        known = {f.name: f.type for f in fields(self)}
+        kw = {"name": str(name)}
+        for k, v in (overrides or {}).items():
+            key = str(k).strip().lower()
+            if key not in known or key == "name":
+                raise ValueError(f"unknown scoring key: {k}")
+            kw[key] = str(v).strip().lower() if key == "norm_method" else float(v)
+        return dc_replace(self, **kw)
+
+    def weights(self) -> dict:
+        return {"SP_W": self.sp_w, "KB_W": self.kb_w, "JOCKEY_W": self.jockey_w}
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+SCORING = ScoringConfig(
+    name="prod",
+    sp_w=SP_W,
+    kb_w=KB_W,
+    jockey_w=JOCKEY_W,
+    norm_method=NORM_METHOD,
+    score_base=SCORE_BASE,
+    score_scale=SCORE_SCALE,
+    konsen_gap12_mid=KONSEN_GAP12_MID,
+    konsen_gap15_mid=KONSEN_GAP15_MID,
+    konsen_focus_th=KONSEN_FOCUS_TH,
+    konsen_w12=KONSEN_W12,
+    konsen_w15=KONSEN_W15,
+    flat_score_range_max=FLAT_SCORE_RANGE_MAX,
+)
+
+# ===== SP推定：開催場ごとのプール済みモデル（sp_model.py が output/ の履歴から作る）=====
+# - レース内の回帰（ペア3点以上）とブレンド：レース内の重み = pairs_n / (pairs_n + K)
+# - ペアが無いレースも 55〜70 の固定ランプではなく、開催場の係数で推定する
+SP_MODEL_ENABLE = os.environ.get("SP_MODEL", "1").strip() != "0"
+SP_MODEL_FILE = os.environ.get("SP_MODEL_FILE", "output/sp_model.json")
+SP_MODEL_K = os.environ.get("SP_MODEL_K", "").strip()  # 空ならモデルファイルの k
+
+@dataclass(frozen=True, slots=True)
+class SpPool:
+    a: float          # SP = a * KB + b（レース内にペアがあれば b はレースのオフセットに置き換え）
+    b: float
+    lo: float         # 推定値のクランプ範囲（履歴の SP 分位点）
+    hi: float
+    k: float          # 事前の強さ（ペア何点分か）
+    n_pairs: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+def load_sp_model(path: str = None) -> dict:
+    """return: 開催場名 -> SpPool（無効化 / ファイルなしなら {}）"""
+    path = path or SP_MODEL_FILE
+    if not SP_MODEL_ENABLE or not Path(path).is_file():
+        return {}
+    try:
+        d = json.loads(Path(path).read_text(encoding="utf-8"))
+    except Exception as e:
+        print(f"[WARN] sp_model read failed: {path} err={e}")
+        return {}
+    out = {}
+    for place, m in (d.get("tracks") or {}).items():
+        try:
+            k = float(SP_MODEL_K) if SP_MODEL_K else float(m.get("k", d.get("k", 5.0)))
+            out[place] = SpPool(a=float(m["a"]), b=float(m["b"]), lo=float(m["lo"]), hi=float(m["hi"]),
+                                k=k, n_pairs=int(m.get("n_pairs", 0)))
+        except Exception as e:
+            print(f"[WARN] sp_model {place}: bad entry ({e})")
+    return out
+
+# ===== 着順確率（Plackett–Luce：plackett_luce.py）=====
+# 温度 T：PL_TEMP 指定 > 校正ファイル（開催場別 > 全体）> 10.0
+PL_ENABLE = os.environ.get("PL_ENABLE", "1").strip() != "0"
+PL_TEMP = os.environ.get("PL_TEMP", "").strip()
+PL_CALIB_FILE = os.environ.get("PL_CALIB_FILE", "output/pl_calib.json")
+PL_TOP_TRIOS = int(os.environ.get("PL_TOP_TRIOS", "10"))
+
+def load_pl_temps(path: str = None):
+    """return: (全体の T, 開催場名 -> T)"""
+    if PL_TEMP:
+        return float(PL_TEMP), {}
+    path = path or PL_CALIB_FILE
+    if not Path(path).is_file():
+        return 10.0, {}
+    try:
+        d = json.loads(Path(path).read_text(encoding="utf-8"))
+        return float(d.get("temp", 10.0)), {k: float(v["temp"]) for k, v in (d.get("tracks") or {}).items()}
+    except Exception as e:
+        print(f"[WARN] pl calib read failed: {path} err={e}")
+        return 10.0, {}
+
+# ===== 重みプロファイル（train_weights.py が履歴から学習）=====
+# 空なら使わない（本番の重みは SP_W / KB_W / JOCKEY_W のまま）。"*" は全開催場の既定、開催場名のキーはそれを上書き
+WEIGHTS_PROFILE = os.environ.get("WEIGHTS_PROFILE", "").strip()
+
+def load_weight_profiles(path: str = None, base: ScoringConfig = None) -> dict:
+    """return: 開催場名（"*" = 既定）-> ScoringConfig（重みだけ差し替え）"""
+    path = WEIGHTS_PROFILE if path is None else path
+    base = base or SCORING
+    if not path:
+        return {}
+    try:
+        d = json.loads(Path(path).read_text(encoding="utf-8"))
+    except Exception as e:
+        print(f"[WARN] weights profile read failed: {path} err={e}")
+        return {}
+    out = {}
+    for place, rec in (d.get("profiles") or {}).items():
+        try:
+            out[place] = base.with_overrides(f"profile:{place}", rec["weights"])
+        except (KeyError, ValueError, TypeError) as e:
+            print(f"[WARN] weights profile {place}: bad entry ({e})")
+    return out
+
+def load_shadow_variants(spec: str = None, base: ScoringConfig = None):
+    """
+    spec: JSON文字列 or JSONファイルのパス（{"name": {"SP_W": 1.5, ...}, ...}）
+    return: list[ScoringConfig]（壊れた定義は WARN を出して捨てる）
+    """
+    spec = SHADOW_VARIANTS if spec is None else spec
+    base = base or SCORING
+    if not spec:
+        return []
+    try:
+        text = spec if spec.startswith("{") else Path(spec).read_text(encoding="utf-8")
+        obj = json.loads(text)
+    except Exception as e:
+        print(f"[WARN] SHADOW_VARIANTS parse failed: {e}")
+        return []
+    if not isinstance(obj, dict):
+        print("[WARN] SHADOW_VARIANTS must be an object: {name: {KEY: value}}")
+        return []
+
+    out = []
+    for name, ov in obj.items():
+        if name == base.name or not isinstance(ov, dict):
+            print(f"[WARN] shadow variant skipped: {name}")
+            continue
+        try:
+            out.append(base.with_overrides(name, ov))
+        except (ValueError, TypeError) as e:
+            print(f"[WARN] shadow variant skipped: {name} ({e})")
+    return out
+
+# ===== 馬ごとの履歴（horse_index.py）=====
+# 吉馬に SP が無い馬は、前走までに記録した SP（HORSE_SP_MAX_AGE 日以内の最新）で埋める（推定より優先）
+HORSE_SP_FALLBACK = os.environ.get("HORSE_SP_FALLBACK", "1").strip() != "0"
+
+# ===== 履歴 DB（history_store.py）：書いた predict JSON をその場で取り込む =====
+HISTORY_STORE_ENABLE = os.environ.get("HISTORY_STORE", "1").strip() != "0"
+
+# ===== 騎手成績の出どころ =====
+# kaisekisya（従来：開催場ごとに取得）/ own（jockey_stats.py：自前の result 履歴）/ blend（両方を重み付き平均）
+JOCKEY_SOURCE = os.environ.get("JOCKEY_SOURCE", "kaisekisya").strip().lower()
+JOCKEY_BLEND_W = float(os.environ.get("JOCKEY_BLEND_W", "0.5"))  # blend の own 側の重み
+
+# ===== 開催場の台帳（tracks.py）：NAR track code（= keiba.go.jp k_babaCode）/ kaisekisya 騎手成績 ※帯広(3)除外 =====
+BABA_CODE = T.BABA_CODE
+EXCLUDE_BABA = T.EXCLUDE_BABA
+KAISEKISYA_JOCKEY_URL = T.KAISEKISYA_JOCKEY_URL
 
 # =========================
 # 余計な文字を消す（馬名/レース名）
@@ -122,6 +292,78 @@ def clean_race_name(raw: str) -> str:
     s = re.sub(r"\s*-\s*", "-", s).strip()
     return s
 
+# =========================
+# 出走馬（parse → スコア計算 → 出力まで同じオブジェクトを使い回す）
+# - dict を作り直さない（各段で base_index_filled / sp_filled / z / score を埋めていく）
+# =========================
+@dataclass(slots=True)
+class Runner:
+    umaban: int
+    name: str
+    jockey: str = ""
+    jockey_match: str = ""               # JockeyIndex.match の結果（ok / ambiguous / miss）
+    base_index: Optional[float] = None   # NAR 平均指数（欠損は None）
+    sp_raw: Optional[float] = None       # 吉馬 SP能力値（欠損は None）
+    sp_prev: Optional[float] = None      # 前走までの最新 SP（horse_index。sp_raw 欠損時だけ使う）
+    jockey_add: float = 0.0
+    # ↓ compute_scores_new が埋める
+    base_index_filled: float = 0.0
+    sp_filled: float = 0.0
+    z_sp: float = 0.0
+    z_kb: float = 0.0
+    z_jockey: float = 0.0
+    z_combined: float = 0.0
+    score: float = 0.0
+
+    def to_pick(self, mark: str, norm_method: str, source: dict) -> dict:
+        return {
+            "mark": mark,
+            "umaban": int(self.umaban),
+            "name": self.name,
+            "score": float(self.score),               # ★小数2桁
+            "sp": float(self.sp_filled),
+            "base_index": float(self.base_index_filled),
+            "jockey": self.jockey,
+            "jockey_add": float(self.jockey_add),
+            "z": {
+                "sp": float(self.z_sp),
+                "kb": float(self.z_kb),
+                "jockey": float(self.z_jockey),
+                "combined": float(self.z_combined),
+                "norm_method": norm_method,
+            },
+            "source": source,
+        }
+
+# =========================
+# 全頭のスコア入力（列指向ブロック）
+# - predict JSON の各レースに "field" として入れる（上位5頭以外の入力も残す）
+# - 欠損は null（= 欠損マスク）。これだけで compute_scores_new をオフライン再現できる
+# =========================
+FIELD_COLUMNS = ("umaban", "base_index", "sp_raw", "jockey_add")
+
+def field_block(rows) -> dict:
+    out = {
+        "umaban": [int(r.umaban) for r in rows],
+        "name": [r.name for r in rows],
+        "base_index": [r.base_index for r in rows],
+        "sp_raw": [r.sp_raw for r in rows],
+        "jockey_add": [float(r.jockey_add) for r in rows],
+    }
+    if any(r.sp_prev is not None for r in rows):
+        out["sp_prev"] = [r.sp_prev for r in rows]
+    return out
+
+def runners_from_field(field: dict):
+    cols = [field.get(c) or [] for c in FIELD_COLUMNS]
+    n = len(cols[0])
+    names = field.get("name") or [""] * n
+    prev = field.get("sp_prev") or [None] * n
+    return [
+        Runner(umaban=int(u), name=nm or "", base_index=kb, sp_raw=sp, sp_prev=sp0, jockey_add=float(ja))
+        for u, kb, sp, ja, nm, sp0 in zip(*cols, names, prev)
+    ]
+
 # ===== HTTP =====
 def fetch(url: str, debug=False, params=None) -> str:
     try:
@@ -251,17 +493,88 @@ def parse_kaisekisya_jockey_table(html: str):
             stats[name] = (win, quin, tri)
     return stats
 
-def norm_jockey3(s: str) -> str:
+def norm_jockey(s: str) -> str:
     s = re.sub(r"\s+", "", str(s))
     s = re.sub(r"[◀◁▶▷]+", "", s)
     s = re.sub(r"[()（）]", "", s)
-    return s[:3]
+    return s
 
-def match_jockey_by3(j3: str, stats: dict):
-    for full, rates in stats.items():
-        if full.startswith(j3):
-            return rates
-    return None
+def norm_jockey3(s: str) -> str:
+    return norm_jockey(s)[:3]
+
+class JockeyIndex:
+    """
+    騎手成績（name -> (win, quin, tri)）の 3文字キー索引
+    - 成績スナップショット1つにつき1回だけ作り、開催場内の全レース・騎手系の特徴量で共有する
+    - キーは正規化した氏名の先頭1〜3文字（NAR側の表記が2文字でも O(1) で引ける）
+    - 同じキーに複数候補 → ambiguous。tie-break：
+        1) 正規化した氏名が完全一致
+        2) NAR側の表記との共通接頭辞が長い
+        3) 成績表の上にある方（kaisekisya は成績順なので従来の「先に見つかった方」と同じ）
+    - ambiguous / 見つからない騎手は issues に貯めて report() で出す（黙って外さない）
+    """
+    __slots__ = ("stats", "by_key", "issues")
+
+    def __init__(self, stats: dict):
+        self.stats = stats or {}
+        self.by_key = {}
+        for full in self.stats:
+            nf = norm_jockey(full)
+            for k in range(1, min(3, len(nf)) + 1):
+                self.by_key.setdefault(nf[:k], []).append((full, nf))
+        self.issues = {"ambiguous": {}, "miss": set()}
+
+    def __len__(self):
+        return len(self.stats)
+
+    def match(self, jockey: str):
+        """return: (rates or None, status)  status は ok / ambiguous / miss"""
+        nj = norm_jockey(jockey)
+        cands = self.by_key.get(nj[:3]) if nj else None
+        if not cands:
+            self.issues["miss"].add(nj)
+            return None, "miss"
+        if len(cands) == 1:
+            return self.stats[cands[0][0]], "ok"
+
+        def common_len(nf):
+            n = 0
+            for a, b in zip(nf, nj):
+                if a != b:
+                    break
+                n += 1
+            return n
+
+        best = cands[0]
+        best_key = (best[1] == nj, common_len(best[1]))
+        for c in cands[1:]:
+            key = (c[1] == nj, common_len(c[1]))
+            if key > best_key:
+                best, best_key = c, key
+        self.issues["ambiguous"][nj] = (best[0], [c[0] for c in cands])
+        return self.stats[best[0]], "ambiguous"
+
+    def report(self, label: str):
+        for nj, (picked, cands) in sorted(self.issues["ambiguous"].items()):
+            print(f"[WARN] {label}: jockey '{nj}' ambiguous -> {cands} (picked {picked})")
+        if self.issues["miss"]:
+            print(f"[INFO] {label}: jockey not in stats ({len(self.issues['miss'])}): {sorted(self.issues['miss'])}")
+
+def match_jockey_rates(jockey: str, kai_index, own_index=None, own_w: float = JOCKEY_BLEND_W):
+    """
+    kaisekisya / 自前（jockey_stats）の両方から騎手を引く
+    return: (rates or None, status)  両方にあれば own_w で重み付き平均、片方だけならその値
+    """
+    rk, sk = kai_index.match(jockey) if kai_index else (None, "miss")
+    ro, so = own_index.match(jockey) if own_index else (None, "miss")
+    if rk and ro:
+        rates = tuple((1.0 - own_w) * a + own_w * b for a, b in zip(rk, ro))
+        return rates, ("ok" if sk == so == "ok" else "ambiguous")
+    if rk:
+        return rk, sk
+    if ro:
+        return ro, so
+    return None, "miss"
 
 def jockey_add_points(win: float, quin: float, tri: float) -> float:
     # 生値（0〜25くらい）想定：勝率/連対/三連対を合成
@@ -290,8 +603,8 @@ def parse_nar_race_name(html: str) -> str:
 
 def parse_nar_rows_text_fallback(html: str):
     """
-    返り値: [{umaban,name,jockey,avg_index(Noneありうる)}, ...]
-    avg_index が * の馬も “行は返す” → 後段で中央値補完する
+    返り値: [Runner(umaban,name,jockey,base_index(Noneありうる)), ...]
+    平均指数が * の馬も “行は返す” → 後段で中央値補完する
     """
     if not html:
         return []
@@ -312,25 +625,23 @@ def parse_nar_rows_text_fallback(html: str):
         if m:
             if cur:
                 rows.append(cur)
-            umaban = int(m.group(1))
-            name = clean_horse_name(m.group(2))
-            cur = {"umaban": umaban, "name": name, "jockey": "", "avg_index": None}
+            cur = Runner(umaban=int(m.group(1)), name=clean_horse_name(m.group(2)))
             continue
 
         if not cur:
             continue
 
-        if not cur["jockey"]:
+        if not cur.jockey:
             mj = re_jockey.search(ln)
             if mj:
-                cur["jockey"] = re.sub(r"[◀◁▶▷\s]+", "", mj.group(1))
+                cur.jockey = re.sub(r"[◀◁▶▷\s]+", "", mj.group(1))
 
         # 平均指数らしき数値が拾えたら入れる
-        if cur["avg_index"] is None:
+        if cur.base_index is None:
             nums = re_idx.findall(ln)
             if nums:
                 try:
-                    cur["avg_index"] = float(nums[-1])
+                    cur.base_index = float(nums[-1])
                 except Exception:
                     pass
 
@@ -338,7 +649,7 @@ def parse_nar_rows_text_fallback(html: str):
         rows.append(cur)
 
     # 最低限：馬名と馬番がある行だけ
-    rows = [r for r in rows if r.get("name") and isinstance(r.get("umaban"), int)]
+    rows = [r for r in rows if r.name]
     return rows
 
 def norm(s: str) -> str:
@@ -407,12 +718,7 @@ def parse_nar_tablephp_rows(html: str):
                 except Exception:
                     avg = None
 
-        rows.append({
-            "umaban": int(mban.group()),
-            "name": name,
-            "jockey": jockey,
-            "avg_index": avg,
-        })
+        rows.append(Runner(umaban=int(mban.group()), name=name, jockey=jockey, base_index=avg))
     return rows
 
 def fetch_nar_rows_best(date: str, track_id: int, rno: int, debug=False):
@@ -589,7 +895,8 @@ def _sig_score_from_gap(gap: float, mid: float) -> float:
     mid = max(1e-9, float(mid))
     return 1.0 / (1.0 + (gap / mid))
 
-def calc_konsen_gap(top5_scores_desc):
+def calc_konsen_gap(top5_scores_desc, cfg: ScoringConfig = None):
+    cfg = cfg or SCORING
     if not top5_scores_desc or len(top5_scores_desc) < 5:
         return {
             "name": KONSEN_NAME,
@@ -597,21 +904,21 @@ def calc_konsen_gap(top5_scores_desc):
             "is_focus": False,
             "gap12": None,
             "gap15": None,
-            "gap12_mid": KONSEN_GAP12_MID,
-            "gap15_mid": KONSEN_GAP15_MID,
-            "focus_th": KONSEN_FOCUS_TH,
+            "gap12_mid": cfg.konsen_gap12_mid,
+            "gap15_mid": cfg.konsen_gap15_mid,
+            "focus_th": cfg.konsen_focus_th,
         }
 
     s1, s2, s3, s4, s5 = [float(x) for x in top5_scores_desc[:5]]
     gap12 = max(0.0, s1 - s2)
     gap15 = max(0.0, s1 - s5)
 
-    sc12 = _sig_score_from_gap(gap12, KONSEN_GAP12_MID)
-    sc15 = _sig_score_from_gap(gap15, KONSEN_GAP15_MID)
+    sc12 = _sig_score_from_gap(gap12, cfg.konsen_gap12_mid)
+    sc15 = _sig_score_from_gap(gap15, cfg.konsen_gap15_mid)
 
-    konsen01 = 0.65 * sc12 + 0.35 * sc15
+    konsen01 = cfg.konsen_w12 * sc12 + cfg.konsen_w15 * sc15
     konsen = round(100.0 * _clamp(konsen01, 0.0, 1.0), 1)
-    is_focus = bool(konsen >= float(KONSEN_FOCUS_TH))
+    is_focus = bool(konsen >= float(cfg.konsen_focus_th))
 
     return {
         "name": KONSEN_NAME,
@@ -619,26 +926,22 @@ def calc_konsen_gap(top5_scores_desc):
         "is_focus": is_focus,
         "gap12": round(gap12, 3),
         "gap15": round(gap15, 3),
-        "gap12_mid": KONSEN_GAP12_MID,
-        "gap15_mid": KONSEN_GAP15_MID,
-        "focus_th": KONSEN_FOCUS_TH,
+        "gap12_mid": cfg.konsen_gap12_mid,
+        "gap15_mid": cfg.konsen_gap15_mid,
+        "focus_th": cfg.konsen_focus_th,
         "sc12": round(sc12, 4),
         "sc15": round(sc15, 4),
     }
 
 def should_skip_flat_index(rows) -> bool:
     """
-    rows: [{base_index: float or None, ...}, ...]
+    rows: [Runner(base_index: float or None), ...]
     指数（base_index）がほぼ横並び（最大-最小が小さい）なら True
     """
     if not SKIP_FLAT_INDEX:
         return False
 
-    vals = []
-    for r in rows:
-        v = r.get("base_index")
-        if isinstance(v, (int, float)):
-            vals.append(float(v))
+    vals = [float(r.base_index) for r in rows if r.base_index is not None]
 
     if len(vals) < FLAT_INDEX_MIN_COUNT:
         return False
@@ -651,6 +954,45 @@ def is_maiden_like(race_name: str) -> bool:
     s = _norm_text(race_name)
     return ("新馬" in s)
 
+def should_skip_low_signal_nar(rows, race_name: str) -> (bool, str):
+    """
+    should_skip_low_signal のうち NAR の行（平均指数）とレース名だけで決まる部分
+    → 吉馬を取りに行く前に判定できる。戻り値: (skip?, reason)
+    """
+    if not SKIP_LOW_SIGNAL:
+        return False, ""
+
+    n = len(rows)
+    if n <= 0:
+        return True, "no runners"
+
+    kb_valid = sum(1 for r in rows if r.base_index is not None)
+    kb_ratio = kb_valid / n
+
+    if is_maiden_like(race_name) and kb_valid < MIN_KB_COUNT:
+        return True, f"maiden kb too few (kb_valid={kb_valid}/{n})"
+
+    if kb_ratio < MIN_VALID_RATIO and kb_valid < MIN_KB_COUNT:
+        return True, f"kb missing too much (kb_valid={kb_valid}/{n}, ratio={kb_ratio:.2f})"
+
+    return False, ""
+
+def prefetch_skip_reason(rows, race_name: str) -> str:
+    """
+    吉馬SPの取得前ゲート：NAR だけで決まるスキップ理由（ログ用の文言）。スキップしないなら ""
+    判定順は取得後のチェックと同じ（低シグナル → 出走馬<5 → 指数横並び）
+    """
+    skip_low, reason_low = should_skip_low_signal_nar(rows, race_name)
+    if skip_low:
+        return f"低シグナル（{reason_low} / race='{race_name}'）"
+    if len(rows) < 5:
+        return "データ不足（出走馬<5）"
+    if should_skip_flat_index(rows):
+        vals = [float(r.base_index) for r in rows if r.base_index is not None]
+        rng = (max(vals) - min(vals)) if vals else 0.0
+        return f"指数が横並びっぽい（range={rng:.2f} <= {FLAT_INDEX_RANGE_MAX}）"
+    return ""
+
 def should_skip_low_signal(rows, race_name: str, sp_by_umaban: dict) -> (bool, str):
     """
     低シグナル（指数欠損だらけ/新馬で材料不足/全部同点）ならスキップ
@@ -663,7 +1005,7 @@ def should_skip_low_signal(rows, race_name: str, sp_by_umaban: dict) -> (bool, s
     if n <= 0:
         return True, "no runners"
 
-    kb_valid = sum(1 for r in rows if isinstance(r.get("base_index"), (int, float)))
+    kb_valid = sum(1 for r in rows if r.base_index is not None)
     sp_valid = len(sp_by_umaban or {})
     kb_ratio = kb_valid / n
 
@@ -689,141 +1031,8 @@ def should_skip_low_signal(rows, race_name: str, sp_by_umaban: dict) -> (bool, s
 
 # ====== HTML（表示） ======
 def render_html(title: str, preds) -> str:
-    import html as _html
-
-    def esc(s): return _html.escape(str(s))
-
-    def _clamp01(x: float) -> float:
-        return max(0.0, min(1.0, x))
-
-    def _mix(c1, c2, t: float):
-        t = _clamp01(t)
-        return (
-            int(round(c1[0] + (c2[0] - c1[0]) * t)),
-            int(round(c1[1] + (c2[1] - c1[1]) * t)),
-            int(round(c1[2] + (c2[2] - c1[2]) * t)),
-        )
-
-    def _rgb(rgb):
-        return f"rgb({rgb[0]},{rgb[1]},{rgb[2]})"
-
-    def _luma(rgb):
-        r, g, b = rgb
-        return 0.2126 * r + 0.7152 * g + 0.0722 * b
-
-    LO = (239, 246, 255)
-    HI = (29, 78, 216)
-
-    def score_style(sc: float, scores_in_race):
-        if not scores_in_race:
-            return "color:#111827;"
-        mn = min(scores_in_race)
-        mx = max(scores_in_race)
-        if mx == mn:
-            t = 0.55
-        else:
-            t = (float(sc) - mn) / (mx - mn)
-        t2 = _clamp01(t ** 0.75)
-
-        bg = _mix(LO, HI, t2)
-        fg = (255, 255, 255) if _luma(bg) < 140 else (17, 24, 39)
-
-        return (
-            f"background:{_rgb(bg)};"
-            f"color:{_rgb(fg)};"
-            "padding:2px 8px;border-radius:10px;display:inline-block;"
-            "min-width:72px;text-align:right;font-variant-numeric:tabular-nums;"
-            "font-weight:900;"
-        )
-
-    def badge(text: str, bg: str, fg: str = "#111827") -> str:
-        return (
-            "<span style='display:inline-block;padding:4px 10px;border-radius:999px;"
-            f"background:{bg};color:{fg};font-weight:900;font-size:12px;letter-spacing:.02em;"
-            "line-height:1;white-space:nowrap;'>"
-            f"{esc(text)}</span>"
-        )
-
-    def section_title(left: str, right_badge: str, bg: str) -> str:
-        return (
-            "<div style='display:flex;align-items:center;justify-content:space-between;"
-            f"padding:10px 12px;border-radius:12px;background:{bg};margin:10px 0 8px;'>"
-            f"<strong style='font-size:14px;'>{esc(left)}</strong>"
-            f"<div style='display:flex;gap:8px;align-items:center;justify-content:flex-end;flex-wrap:wrap;'>{right_badge}</div>"
-            "</div>"
-        )
-
-    parts = []
-    parts.append("<div class='fn-post' style='max-width:980px;margin:0 auto;line-height:1.7;color:#111827;'>")
-    parts.append(f"<h2 style='margin:12px 0 8px;font-size:20px;font-weight:900;'>{esc(title)}</h2>")
-
-    for race in preds:
-        rno = int(race["race_no"])
-        race_name = (race.get("race_name") or "").strip()
-        picks = race["picks"]
-
-        scores_in_race = [float(p.get("score", 0.0)) for p in picks if isinstance(p.get("score", None), (int, float))]
-
-        konsen_badge = ""
-        if KONSEN_ENABLE:
-            k = race.get("konsen") or {}
-            kval = k.get("value", None)
-            is_focus = bool(k.get("is_focus", False))
-            kname = k.get("name", KONSEN_NAME)
-            if isinstance(kval, (int, float)):
-                if is_focus:
-                    konsen_badge = badge(f"注目 {kname}{float(kval):.1f}", "#f59e0b", "#ffffff")
-                else:
-                    konsen_badge = badge(f"{kname}{float(kval):.1f}", "#6b7280", "#ffffff")
-
-        head = f"{rno}R" + (f" {race_name}" if race_name else "")
-
-        parts.append(
-            "<div style='margin:16px 0 18px;padding:12px 12px;"
-            "border:1px solid #e5e7eb;border-radius:14px;background:#ffffff;'>"
-        )
-
-        parts.append(
-            "<div style='display:flex;align-items:center;justify-content:space-between;gap:10px;flex-wrap:wrap;'>"
-            f"<div style='font-size:18px;font-weight:900;color:#111827;'>{esc(head)}</div>"
-            f"<div style='display:flex;gap:8px;align-items:center;justify-content:flex-end;flex-wrap:wrap;'>{konsen_badge}</div>"
-            "</div>"
-        )
-
-        parts.append(section_title("指数上位5頭", badge("PRED", "#bfdbfe"), "#eff6ff"))
-
-        parts.append("<div style='overflow-x:auto;'>")
-        parts.append("<table style='width:100%;border-collapse:collapse;'>")
-        parts.append(
-            "<thead><tr>"
-            "<th style='border-bottom:2px solid #1d4ed8;padding:8px;text-align:center;white-space:nowrap;'>印</th>"
-            "<th style='border-bottom:2px solid #1d4ed8;padding:8px;text-align:center;white-space:nowrap;'>馬番</th>"
-            "<th style='border-bottom:2px solid #1d4ed8;padding:8px;text-align:left;'>馬名</th>"
-            "<th style='border-bottom:2px solid #1d4ed8;padding:8px;text-align:right;white-space:nowrap;'>指数</th>"
-            "</tr></thead><tbody>"
-        )
-
-        for i, p in enumerate(picks):
-            bgrow = "#ffffff" if i % 2 == 0 else "#f8fafc"
-            sc = float(p.get("score", 0.0))
-            sc_style = score_style(sc, scores_in_race)
-
-            parts.append(
-                f"<tr style='background:{bgrow};'>"
-                f"<td style='padding:8px;border-bottom:1px solid #dbeafe;text-align:center;font-weight:900;'>{esc(p.get('mark',''))}</td>"
-                f"<td style='padding:8px;border-bottom:1px solid #dbeafe;text-align:center;font-variant-numeric:tabular-nums;'>{int(p.get('umaban',0))}</td>"
-                f"<td style='padding:8px;border-bottom:1px solid #dbeafe;text-align:left;font-weight:750;'>{esc(p.get('name',''))}</td>"
-                f"<td style='padding:8px;border-bottom:1px solid #dbeafe;text-align:right;'>"
-                f"<span style=\"{sc_style}\">{sc:.2f}</span>"
-                f"</td>"
-                f"</tr>"
-            )
-
-        parts.append("</tbody></table></div>")
-        parts.append("</div>")
-
-    parts.append("</div>")
-    return "\n".join(parts)
+    """描画は render.py（predict / result 共通）"""
+    return R.render_predict(title, preds, konsen_enable=KONSEN_ENABLE, konsen_name=KONSEN_NAME)
 
 # =========================
 # ここから：指数算出（新方式）
@@ -905,12 +1114,13 @@ def fit_linear(xs, ys):
     b = my - a * mx
     return a, b
 
-def estimate_sp_factory(rows, debug=False):
+def estimate_sp_factory(rows, debug=False, sp_pool: SpPool = None):
     """
-    rows: [{base_index(float or None), sp_raw(None可)}...]
+    rows: [Runner(base_index(float or None), sp_raw(None可))...]
+    sp_pool: 開催場のプール済みモデル（あればレース内推定とブレンド）
     """
-    pairs = [(r["base_index"], r["sp_raw"]) for r in rows if (r.get("sp_raw") is not None and isinstance(r.get("base_index"), (int, float)))]
-    kb_vals = [r["base_index"] for r in rows if isinstance(r.get("base_index"), (int,float))]
+    pairs = [(r.base_index, r.sp_raw) for r in rows if (r.sp_raw is not None and r.base_index is not None)]
+    kb_vals = [r.base_index for r in rows if r.base_index is not None]
 
     kb_min = min(kb_vals) if kb_vals else 0.0
     kb_max = max(kb_vals) if kb_vals else 1.0
@@ -925,7 +1135,7 @@ def estimate_sp_factory(rows, debug=False):
         ys = [y for _, y in pairs]
         a_b = fit_linear(xs, ys)
 
-    def est(base_index: float) -> float:
+    def est_in_race(base_index: float) -> float:
         if a_b is not None:
             a, b = a_b
             v = a * base_index + b
@@ -943,6 +1153,20 @@ def estimate_sp_factory(rows, debug=False):
         v = 55.0 + t * 15.0
         return clamp(v, 45.0, 78.0)
 
+    est = est_in_race
+    pool_w = None
+    if sp_pool is not None:
+        # レースの水準（クラス差）はペアの平均オフセットで合わせ、傾きは開催場の係数を使う
+        n = len(pairs)
+        off = (sum(y - sp_pool.a * x for x, y in pairs) / n) if n else sp_pool.b
+        pool_w = n / (n + sp_pool.k) if (n + sp_pool.k) > 0 else 1.0
+
+        def est(base_index: float) -> float:
+            v_pool = clamp(sp_pool.a * base_index + off, sp_pool.lo, sp_pool.hi)
+            if pool_w <= 0:
+                return v_pool
+            return pool_w * est_in_race(base_index) + (1.0 - pool_w) * v_pool
+
     info = {
         "pairs_n": len(pairs),
         "sp_min_obs": sp_min_obs,
@@ -951,88 +1175,130 @@ def estimate_sp_factory(rows, debug=False):
         "linear": a_b,
         "kb_min": kb_min,
         "kb_max": kb_max,
+        "in_race_weight": pool_w,
     }
     if debug:
         print(f"[DEBUG] SP-estimator info: {info}")
     return est, info
 
-def compute_scores_new(rows, debug=False):
+def compute_scores_new(rows, debug=False, cfg: ScoringConfig = None, sp_pool: SpPool = None):
     """
-    rows: [{umaban,name,jockey, base_index(None可), jockey_add, sp_raw(None可)}...]
+    rows: [Runner(umaban,name,jockey, base_index(None可), jockey_add, sp_raw(None可), sp_prev(None可))...]
+    cfg : ScoringConfig（None なら本番設定 SCORING）
+    sp_pool: 開催場の SP モデル（None ならレース内推定だけ）
 
-    return: horses_scored list (scoreはfloat 小数2桁)
+    return: rows そのもの（base_index_filled / sp_filled / z_* / score を埋めて返す。scoreは小数2桁）
     """
+    cfg = cfg or SCORING
+
     # 1) base_index の中央値（KB欠損補完）
-    kb_list = [r.get("base_index") for r in rows if isinstance(r.get("base_index"), (int, float))]
+    kb_list = [r.base_index for r in rows if r.base_index is not None]
     kb_med = _median(kb_list)
     if kb_med is None:
         kb_med = 0.0
 
     # 2) SP推定器（KBがある馬に対して）
-    est_sp, est_info = estimate_sp_factory(rows, debug=debug)
+    est_sp, est_info = estimate_sp_factory(rows, debug=debug, sp_pool=sp_pool)
 
-    # 3) SP（欠損は推定、推定不可は中央値）
-    sp_raw_list = [r.get("sp_raw") for r in rows if isinstance(r.get("sp_raw"), (int, float))]
+    # 3) SP（欠損は前走までの SP → 推定 → 中央値の順）
+    sp_raw_list = [r.sp_raw for r in rows if r.sp_raw is not None]
     sp_med = _median(sp_raw_list)
     if sp_med is None:
         sp_med = 60.0
 
     for r in rows:
-        if not isinstance(r.get("base_index"), (int, float)):
-            r["base_index_filled"] = float(kb_med)
+        if r.base_index is None:
+            r.base_index_filled = float(kb_med)
         else:
-            r["base_index_filled"] = float(r["base_index"])
+            r.base_index_filled = float(r.base_index)
 
-        if isinstance(r.get("sp_raw"), (int, float)):
-            r["sp_filled"] = float(r["sp_raw"])
+        if r.sp_raw is not None:
+            r.sp_filled = float(r.sp_raw)
+        elif r.sp_prev is not None:
+            r.sp_filled = float(r.sp_prev)
         else:
             # 推定：KBがある（filledにしてあるので常に推定可能）
             try:
-                r["sp_filled"] = float(est_sp(r["base_index_filled"]))
+                r.sp_filled = float(est_sp(r.base_index_filled))
             except Exception:
-                r["sp_filled"] = float(sp_med)
+                r.sp_filled = float(sp_med)
 
     # 4) Z化（SP / KB / 騎手）
-    sp_vals = [r["sp_filled"] for r in rows]
-    kb_vals = [r["base_index_filled"] for r in rows]
-    j_vals = [float(r.get("jockey_add", 0.0)) for r in rows]
+    sp_vals = [r.sp_filled for r in rows]
+    kb_vals = [r.base_index_filled for r in rows]
+    j_vals = [float(r.jockey_add) for r in rows]
 
-    z_sp, sp_norm = zscore_values(sp_vals, method=("robust" if NORM_METHOD == "robust" else "z"))
-    z_kb, kb_norm = zscore_values(kb_vals, method=("robust" if NORM_METHOD == "robust" else "z"))
-    z_j,  j_norm  = zscore_values(j_vals,  method=("robust" if NORM_METHOD == "robust" else "z"))
+    method = "robust" if cfg.norm_method == "robust" else "z"
+    z_sp, sp_norm = zscore_values(sp_vals, method=method)
+    z_kb, kb_norm = zscore_values(kb_vals, method=method)
+    z_j,  j_norm  = zscore_values(j_vals,  method=method)
 
     # 5) 合成 → 表示スケールへ
-    wsum = abs(SP_W) + abs(KB_W) + abs(JOCKEY_W)
+    wsum = abs(cfg.sp_w) + abs(cfg.kb_w) + abs(cfg.jockey_w)
     if wsum <= 1e-9:
         wsum = 1.0
 
-    horses = []
     for i, r in enumerate(rows):
-        comb_z = (SP_W * z_sp[i] + KB_W * z_kb[i] + JOCKEY_W * z_j[i]) / wsum
-        score = SCORE_BASE + SCORE_SCALE * comb_z
-
-        horses.append({
-            "umaban": int(r["umaban"]),
-            "name": clean_horse_name(r["name"]),
-            "jockey": r.get("jockey", ""),
-            "sp": float(r["sp_filled"]),
-            "base_index": float(r["base_index_filled"]),
-            "jockey_add": float(r.get("jockey_add", 0.0)),
-            "z": {
-                "sp": float(z_sp[i]),
-                "kb": float(z_kb[i]),
-                "jockey": float(z_j[i]),
-                "combined": float(comb_z),
-                "norm_method": NORM_METHOD,
-            },
-            "score": float(round(score, 2)),
-        })
+        comb_z = (cfg.sp_w * z_sp[i] + cfg.kb_w * z_kb[i] + cfg.jockey_w * z_j[i]) / wsum
+        score = cfg.score_base + cfg.score_scale * comb_z
+
+        r.z_sp = float(z_sp[i])
+        r.z_kb = float(z_kb[i])
+        r.z_jockey = float(z_j[i])
+        r.z_combined = float(comb_z)
+        r.score = float(round(score, 2))
 
     if debug:
         print(f"[DEBUG] norm info: sp={sp_norm} kb={kb_norm} j={j_norm}")
         print(f"[DEBUG] sp_est_info: {est_info}")
 
-    return horses
+    return rows
+
+def rank_rows(rows):
+    # スコアでソート（同点はSP→KB→馬番）
+    rows.sort(key=lambda x: (-x.score, -x.sp_filled, -x.base_index_filled, x.umaban))
+    return rows
+
+def race_prob_block(ranked, temp: float):
+    """
+    ranked: rank_rows 済みの全頭 / return: (picks 用の確率 list, レースの prob ブロック)
+    """
+    pr = PL.single_race([float(r.score) for r in ranked], temp=temp, top_trios=PL_TOP_TRIOS)
+    n = len(ranked)
+    per_pick = [
+        {"win": round(pr["win"][j], 4), "top2": round(pr["top2"][j], 4), "top3": round(pr["top3"][j], 4)}
+        for j in range(min(5, n))
+    ]
+    block = {
+        "model": "plackett_luce",
+        "temp": round(float(temp), 4),
+        "box5_trio": round(PL.box_trio_prob(pr["trio"], n, range(min(5, n))), 4),
+        "trio_top": [
+            {"umaban": sorted(int(ranked[i].umaban) for i in idx), "p": round(p, 4)}
+            for idx, p in pr["trio_top"]
+        ],
+    }
+    return per_pick, block
+
+def score_shadow_variant(field: dict, cfg: ScoringConfig, debug=False, sp_pool: SpPool = None) -> dict:
+    """
+    影モデル1つ分：field（全頭入力）から新しい Runner を作って cfg でスコア → 上位5だけ返す
+    （本番の rows には触らない）
+    """
+    rows = compute_scores_new(runners_from_field(field), debug=debug, cfg=cfg, sp_pool=sp_pool)
+    scs = [r.score for r in rows]
+    if scs and (max(scs) - min(scs) <= cfg.flat_score_range_max):
+        return {"skip": "flat_score"}
+
+    top5 = rank_rows(rows)[:5]
+    out = {
+        "umaban": [int(r.umaban) for r in top5],
+        "score": [float(r.score) for r in top5],
+    }
+    if KONSEN_ENABLE and len(top5) >= 5:
+        k = calc_konsen_gap([float(r.score) for r in top5], cfg)
+        out["konsen"] = {"value": k["value"], "is_focus": k["is_focus"]}
+    return out
 # ===== PART 4 / 4 =====
 # predict_all_today.py（改造反映版）
 # 範囲：main() 全部
@@ -1047,16 +1313,52 @@ def main():
     os.makedirs("output", exist_ok=True)
 
     print(f"[INFO] DATE={yyyymmdd}")
-    print(f"[INFO] WEIGHTS SP_W={SP_W} KB_W={KB_W} JOCKEY_W={JOCKEY_W}")
-    print(f"[INFO] NORM_METHOD={NORM_METHOD} SCORE_BASE={SCORE_BASE} SCORE_SCALE={SCORE_SCALE}")
+    print(f"[INFO] WEIGHTS SP_W={SCORING.sp_w} KB_W={SCORING.kb_w} JOCKEY_W={SCORING.jockey_w}")
+    print(f"[INFO] NORM_METHOD={SCORING.norm_method} SCORE_BASE={SCORING.score_base} SCORE_SCALE={SCORING.score_scale}")
     if KONSEN_ENABLE:
-        print(f"[INFO] KONSEN name={KONSEN_NAME} gap12_mid={KONSEN_GAP12_MID} gap15_mid={KONSEN_GAP15_MID} focus_th={KONSEN_FOCUS_TH}")
+        print(f"[INFO] KONSEN name={KONSEN_NAME} gap12_mid={SCORING.konsen_gap12_mid} gap15_mid={SCORING.konsen_gap15_mid} "
+              f"focus_th={SCORING.konsen_focus_th} w12={SCORING.konsen_w12} w15={SCORING.konsen_w15}")
     else:
         print("[INFO] KONSEN disabled")
 
+    shadow_variants = load_shadow_variants()
+    if shadow_variants:
+        print(f"[INFO] SHADOW variants = {[v.name for v in shadow_variants]}")
+
+    profiles = load_weight_profiles()
+    if profiles:
+        print(f"[INFO] WEIGHTS_PROFILE={WEIGHTS_PROFILE} profiles={sorted(profiles)}")
+
+    sp_models = load_sp_model()
+    if sp_models:
+        print(f"[INFO] SP_MODEL={SP_MODEL_FILE} tracks={len(sp_models)}")
+
+    if JOCKEY_SOURCE not in ("kaisekisya", "own", "blend"):
+        raise SystemExit(f"[FATAL] unknown JOCKEY_SOURCE: {JOCKEY_SOURCE}")
+    horse_store = HI.load_store() if HORSE_SP_FALLBACK else None
+    if horse_store is not None:
+        print(f"[INFO] HORSE_INDEX={HI.HORSE_INDEX_FILE} horses={len(horse_store['horses'])} sp_max_age={HI.HORSE_SP_MAX_AGE}d")
+
+    jockey_store = JS.load_store() if JOCKEY_SOURCE != "kaisekisya" else None
+    if jockey_store is not None:
+        print(f"[INFO] JOCKEY_SOURCE={JOCKEY_SOURCE} stats={JS.JOCKEY_STATS_FILE} window={JS.JOCKEY_WINDOW_DAYS}d"
+              + (f" own_w={JOCKEY_BLEND_W}" if JOCKEY_SOURCE == "blend" else ""))
+
+    pl_on = PL_ENABLE and PL is not None
+    pl_temp_all, pl_temp_by = load_pl_temps() if pl_on else (None, {})
+    if PL_ENABLE and PL is None:
+        print("[WARN] plackett_luce unavailable (numpy missing?) -> no probability columns")
+    elif pl_on:
+        print(f"[INFO] PL temp={pl_temp_all} tracks={len(pl_temp_by)}")
+
     active = detect_active_tracks(yyyymmdd, debug=debug)
     print(f"[INFO] active_tracks = {active}")
 
+    # 取得の集計（吉馬を取らずに済んだレース数など）：開催場ごと＋全体
+    run_stats = {"nar_races": 0, "kichiuma_fetch": 0, "kichiuma_saved": 0, "skip_postfetch": 0}
+    wrote_json = []
+    man = MF.Section(yyyymmdd, "predict")  # output/manifest_{date}.json（wp_post / ワークフローはこれを読む）
+
     for track in active:
         track_id = BABA_CODE.get(track)
         if not track_id:
@@ -1066,10 +1368,21 @@ def main():
             print(f"[SKIP] {track}: excluded")
             continue
 
-        jockey_url = KAISEKISYA_JOCKEY_URL.get(track, "")
+        jockey_url = KAISEKISYA_JOCKEY_URL.get(track, "") if JOCKEY_SOURCE != "own" else ""
         jockey_stats = parse_kaisekisya_jockey_table(fetch(jockey_url, debug=False)) if jockey_url else {}
+        jockey_index = JockeyIndex(jockey_stats)
+        own_index = JockeyIndex(JS.rates_for(jockey_store, track, yyyymmdd)) if jockey_store is not None else None
+        if own_index is not None:
+            print(f"[INFO] {track}: own jockey stats = {len(own_index)} jockeys")
+        sp_pool = sp_models.get(track)
+        cfg = profiles.get(track) or profiles.get("*") or SCORING
+        if cfg is not SCORING:
+            print(f"[INFO] {track}: weights {cfg.name} SP_W={cfg.sp_w} KB_W={cfg.kb_w} JOCKEY_W={cfg.jockey_w}")
+        pl_temp = pl_temp_by.get(track, pl_temp_all)
 
         preds = []
+        shadow_races = []
+        stats = dict.fromkeys(run_stats, 0)
         track_incomplete = False
         nar_missing_streak = 0
 
@@ -1090,11 +1403,21 @@ def main():
                 continue
             else:
                 nar_missing_streak = 0
+            stats["nar_races"] += 1
+
+            # --- 取得前ゲート：NAR だけで決まるスキップは吉馬を取りに行く前に判定 ---
+            gate = prefetch_skip_reason(nar_rows, clean_race_name(race_name_from_nar or ""))
+            if gate:
+                stats["kichiuma_saved"] += 1
+                print(f"[SKIP] {track} {rno}R: {gate} -> skip race (before kichiuma)")
+                continue
 
             fp_url = build_kichiuma_fp_url(yyyymmdd, track_id, int(rno))
             fp_html = fetch(fp_url, debug=False)
+            stats["kichiuma_fetch"] += 1
             if not fp_html:
                 print(f"[SKIP] {track} {rno}R: データ不足（吉馬SP取得失敗） -> skip race")
+                stats["skip_postfetch"] += 1
                 continue
 
             sp_by_umaban, race_name_kichiuma = parse_kichiuma_sp(fp_html)
@@ -1103,156 +1426,228 @@ def main():
             if not race_name:
                 race_name = clean_race_name(race_name_from_nar) if race_name_from_nar else ""
 
-            # rows（欠損avg_indexも保持して後段で中央値補完）
-            rows = []
-            for h in nar_rows:
-                try:
-                    u = int(h.get("umaban"))
-                except Exception:
-                    continue
-
-                base = h.get("avg_index", None)
-                if isinstance(base, (int, float)):
-                    base_val = float(base)
-                else:
-                    base_val = None  # 欠損
-
-                j = h.get("jockey", "") or ""
-                rates = match_jockey_by3(norm_jockey3(j), jockey_stats) if (j and jockey_stats) else None
-                add = jockey_add_points(*rates) if rates else 0.0
-
-                sp = sp_by_umaban.get(u)  # Noneあり
-                rows.append({
-                    "umaban": u,
-                    "name": clean_horse_name(h.get("name", "")),
-                    "jockey": j,
-                    "base_index": base_val,          # Noneあり
-                    "jockey_add": float(add),
-                    "sp_raw": (float(sp) if sp is not None else None),
-                })
+            # rows = NAR の Runner をそのまま使う（欠損 base_index も保持して後段で中央値補完）
+            rows = nar_rows
+            for h in rows:
+                rates = None
+                if h.jockey and (jockey_index or own_index):
+                    rates, h.jockey_match = match_jockey_rates(h.jockey, jockey_index, own_index)
+                h.jockey_add = float(jockey_add_points(*rates)) if rates else 0.0
+
+                sp = sp_by_umaban.get(h.umaban)  # Noneあり
+                h.sp_raw = float(sp) if sp is not None else None
+                if h.sp_raw is None and horse_store is not None:
+                    h.sp_prev = HI.last_sp(horse_store, h.name, yyyymmdd)
 
             # --- 低シグナル（新馬/欠損過多）をスキップ ---
+            # 取得前ゲートを通ったレースでも、SP 不足や吉馬側のレース名（新馬）でここで落ちることがある
             race_name_for_judge = race_name or race_name_from_nar or race_name_kichiuma or ""
             skip_low, reason_low = should_skip_low_signal(rows, race_name_for_judge, sp_by_umaban)
             if skip_low:
                 print(f"[SKIP] {track} {rno}R: 低シグナル（{reason_low} / race='{race_name_for_judge}'） -> skip race")
+                stats["skip_postfetch"] += 1
                 continue
 
             # 最低限：馬が少なすぎるレースはやめる
             if len(rows) < 5:
                 print(f"[SKIP] {track} {rno}R: データ不足（出走馬<5） -> skip race")
+                stats["skip_postfetch"] += 1
                 continue
 
             # 新馬戦っぽい（指数が横並び）レースはスキップ
             if should_skip_flat_index(rows):
-                vals = [float(r["base_index"]) for r in rows if isinstance(r.get("base_index"), (int, float))]
+                vals = [float(r.base_index) for r in rows if r.base_index is not None]
                 rng = (max(vals) - min(vals)) if vals else 0.0
                 print(f"[SKIP] {track} {rno}R: 指数が横並びっぽい（range={rng:.2f} <= {FLAT_INDEX_RANGE_MAX}） -> skip race")
+                stats["skip_postfetch"] += 1
                 continue
 
-            horses_scored = compute_scores_new(rows, debug=debug)
+            field = field_block(rows)
+            horses_scored = compute_scores_new(rows, debug=debug, cfg=cfg, sp_pool=sp_pool)
+
+            # --- 影モデル（同じ field から再計算：取得・解析は共有）---
+            shadow = None
+            if shadow_variants:
+                shadow = {
+                    "race_no": int(rno),
+                    "race_name": race_name,
+                    "published": False,
+                    "variants": {v.name: score_shadow_variant(field, v, sp_pool=sp_pool) for v in shadow_variants},
+                }
+                shadow_races.append(shadow)
 
             # --- スコアが横並び（ほぼ同点）ならスキップ ---
-            scs = [h["score"] for h in horses_scored if isinstance(h.get("score"), (int, float))]
-            if scs and (max(scs) - min(scs) <= FLAT_SCORE_RANGE_MAX):
-                print(f"[SKIP] {track} {rno}R: スコア横並び（range={max(scs)-min(scs):.2f} <= {FLAT_SCORE_RANGE_MAX}） -> skip race")
+            scs = [h.score for h in horses_scored]
+            if scs and (max(scs) - min(scs) <= cfg.flat_score_range_max):
+                print(f"[SKIP] {track} {rno}R: スコア横並び（range={max(scs)-min(scs):.2f} <= {cfg.flat_score_range_max}） -> skip race")
+                stats["skip_postfetch"] += 1
                 continue
 
             # スコアでソート（同点はSP→KB→馬番）
-            horses_scored.sort(key=lambda x: (-x["score"], -x["sp"], -x["base_index"], x["umaban"]))
-            top5 = horses_scored[:5]
+            top5 = rank_rows(horses_scored)[:5]
 
             konsen = None
             if KONSEN_ENABLE and len(top5) >= 5:
-                top5_scores = [float(h["score"]) for h in top5]
-                konsen = calc_konsen_gap(top5_scores)
+                top5_scores = [float(h.score) for h in top5]
+                konsen = calc_konsen_gap(top5_scores, cfg)
                 if KONSEN_DEBUG:
                     print(f"[KONSEN] {track} {rno}R top5_scores={top5_scores} konsen={konsen}")
 
-            picks = []
-            for j, hh in enumerate(top5):
-                picks.append({
-                    "mark": MARKS5[j],
-                    "umaban": int(hh["umaban"]),
-                    "name": clean_horse_name(hh["name"]),
-                    "score": float(hh["score"]),               # ★小数2桁
-                    "sp": float(hh["sp"]),
-                    "base_index": float(hh["base_index"]),
-                    "jockey": hh.get("jockey", ""),
-                    "jockey_add": float(hh["jockey_add"]),
-                    "z": hh.get("z", {}),
-                    "source": {
-                        "kichiuma_fp_url": fp_url,
-                        "nar_table_url": nar_src,
-                        "nar_condition": used_cond,
-                    },
-                })
+            source = {
+                "kichiuma_fp_url": fp_url,
+                "nar_table_url": nar_src,
+                "nar_condition": used_cond,
+            }
+            picks = [hh.to_pick(MARKS5[j], cfg.norm_method, source) for j, hh in enumerate(top5)]
+            if horse_store is not None:
+                for pk in picks:
+                    ranks = HI.form(horse_store, pk["name"], yyyymmdd)
+                    if any(x is not None for x in ranks):
+                        pk["form"] = HI.form_line(ranks)
+            prob = None
+            if pl_on:
+                per_pick, prob = race_prob_block(horses_scored, pl_temp)
+                for pk, pp in zip(picks, per_pick):
+                    pk["prob"] = pp
 
             payload = {
                 "race_no": int(rno),
                 "race_name": race_name,
                 "picks": picks,
+                "field": field,
             }
+            if prob is not None:
+                payload["prob"] = prob
             if KONSEN_ENABLE:
                 payload["konsen"] = (konsen or {
                     "name": KONSEN_NAME, "value": 0.0, "is_focus": False,
-                    "gap12": None, "gap15": None, "gap12_mid": KONSEN_GAP12_MID, "gap15_mid": KONSEN_GAP15_MID, "focus_th": KONSEN_FOCUS_TH
+                    "gap12": None, "gap15": None, "gap12_mid": cfg.konsen_gap12_mid,
+                    "gap15_mid": cfg.konsen_gap15_mid, "focus_th": cfg.konsen_focus_th
                 })
 
             preds.append(payload)
+            if shadow is not None:
+                shadow["published"] = True
             time.sleep(0.05)
 
+        jockey_index.report(track)
+        if own_index is not None:
+            own_index.report(f"{track}(own)")
+        for k, v in stats.items():
+            run_stats[k] += v
+        print(f"[INFO] {track} fetch stats: nar_races={stats['nar_races']} kichiuma_fetch={stats['kichiuma_fetch']} "
+              f"kichiuma_saved={stats['kichiuma_saved']}")
+
         if track_incomplete:
+            man.add(MF.track_entry(T.get(track), "skipped", reason="nar_rows_missing", races=0, skips=stats))
             continue
         if not preds:
             print(f"[SKIP] {track}: preds empty -> NO OUTPUT")
+            man.add(MF.track_entry(T.get(track), "skipped", reason="no_races", races=0, skips=stats))
             continue
 
         title = f"{yyyymmdd[0:4]}.{yyyymmdd[4:6]}.{yyyymmdd[6:8]} {track}競馬 予想"
 
         out = {
+            "schema_version": SC.SCHEMA_VERSION,
             "date": yyyymmdd,
             "place": track,
             "place_code": str(track_id),
             "title": title,
             "predictions": preds,
             "generated_at": datetime.now().isoformat(timespec="seconds"),
-            "weights": {"SP_W": SP_W, "KB_W": KB_W, "JOCKEY_W": JOCKEY_W},
+            "weights": cfg.weights(),
             "scoring": {
                 "method": "zscore_composite",
-                "norm_method": NORM_METHOD,
-                "score_base": SCORE_BASE,
-                "score_scale": SCORE_SCALE,
+                "norm_method": SCORING.norm_method,
+                "score_base": SCORING.score_base,
+                "score_scale": SCORING.score_scale,
                 "notes": "SP/KB/騎手をレース内で標準化（Z化）し、欠損は推定 or レース中央値で補完して合成",
             },
             "konsen_config": {
                 "enabled": KONSEN_ENABLE,
                 "name": KONSEN_NAME,
-                "gap12_mid": KONSEN_GAP12_MID,
-                "gap15_mid": KONSEN_GAP15_MID,
-                "focus_th": KONSEN_FOCUS_TH,
+                "gap12_mid": SCORING.konsen_gap12_mid,
+                "gap15_mid": SCORING.konsen_gap15_mid,
+                "focus_th": SCORING.konsen_focus_th,
+                "w12": SCORING.konsen_w12,
+                "w15": SCORING.konsen_w15,
             },
             "source": {
                 "kaisekisya_url": jockey_url,
                 "nar_base": "https://nar.k-ba.net/",
-            }
+            },
+            "run_stats": stats,
         }
 
+        if sp_pool is not None:
+            out["scoring"]["sp_model"] = sp_pool.to_dict()
+        if cfg is not SCORING:
+            out["scoring"]["weights_profile"] = {"name": cfg.name, "file": WEIGHTS_PROFILE}
+        if jockey_store is not None:
+            out["scoring"]["jockey_source"] = {
+                "source": JOCKEY_SOURCE,
+                "window_days": JS.JOCKEY_WINDOW_DAYS,
+                "min_rides": JS.JOCKEY_MIN_RIDES,
+                "own_jockeys": len(own_index),
+            }
+            if JOCKEY_SOURCE == "blend":
+                out["scoring"]["jockey_source"]["own_w"] = JOCKEY_BLEND_W
+
         code = str(track_id)
-        json_path = Path("output") / f"predict_{yyyymmdd}_{code}.json"
-        html_path = Path("output") / f"predict_{yyyymmdd}_{code}.html"
+        json_path = T.output_path("predict", yyyymmdd, track)
+        html_path = T.output_path("predict", yyyymmdd, track, "html")
+
+        # 中身（generated_at を除く）が前回と同じなら書かない
+        changed = {
+            "json": OW.write_text(json_path, SC.dumps_predict_json(out)),
+            "html": OW.write_text(html_path, render_html(title, preds)),
+        }
+        if changed["json"]:
+            wrote_json.append(json_path)
+        man.add(MF.track_entry(T.get(track), "ok", json_path, html_path, races=len(preds), skips=stats, changed=changed))
+
+        note = "" if any(changed.values()) else "  unchanged"
+        print(f"[OK] {track} -> {json_path.name} / {html_path.name}  (track={track_id}){note}")
+
+        # 影モデル（非公開）：result_all_today が同じ結果で採点する
+        if shadow_variants and shadow_races:
+            shadow_path = T.output_path("shadow", yyyymmdd, track)
+            shadow_out = {
+                "type": "fieldnote_shadow",
+                "date": yyyymmdd,
+                "place": track,
+                "place_code": code,
+                "production": cfg.to_dict(),
+                "variants": {v.name: v.to_dict() for v in shadow_variants},
+                "races": shadow_races,
+                "generated_at": out["generated_at"],
+            }
+            OW.write_text(shadow_path, json.dumps(shadow_out, ensure_ascii=False, indent=2))
+            print(f"[OK] {track} -> {shadow_path.name}  (shadow variants={len(shadow_variants)})")
+
+    print(f"[INFO] run stats: nar_races={run_stats['nar_races']} kichiuma_fetch={run_stats['kichiuma_fetch']} "
+          f"kichiuma_saved={run_stats['kichiuma_saved']} skip_postfetch={run_stats['skip_postfetch']}")
+
+    # 1日分（全開催場）をまとめた feed_{date}.json（etag はマニフェストと latest にも載せる）
+    feed = FD.update(yyyymmdd)
 
-        json_path.write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
-        html_path.write_text(render_html(title, preds), encoding="utf-8")
+    man.done(**run_stats, **({"feed": feed} if feed else {}))
+    print(f"[OK] wrote {MF.manifest_path(yyyymmdd).as_posix()} (tracks={len(man.tracks)})")
 
-        print(f"[OK] {track} -> {json_path.name} / {html_path.name}  (track={track_id})")
+    if HISTORY_STORE_ENABLE and wrote_json:
+        HS.update_after_write(wrote_json)
+        print(f"[OK] {HS.HISTORY_DB} updated (predict files={len(wrote_json)})")
 
     # =========================
     # latest（地方 予想）を書き出し
     # =========================
     try:
+        latest = {"date": yyyymmdd}
+        if feed:
+            latest.update(feed=feed["json"], etag=feed["etag"])
         Path("output/latest_local_predict.json").write_text(
-            json.dumps({"date": yyyymmdd}, ensure_ascii=False),
+            json.dumps(latest, ensure_ascii=False),
             encoding="utf-8"
         )
         if debug:
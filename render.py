@@ -0,0 +1,454 @@
+# render.py  (fieldnote-lab-bot)
+# 目的：
+# - predict / result の HTML をここ1か所で描く（render_predict / render_result）
+#   ・部品（バッジ、見出し、表の行）のテンプレートは import 時にモードごとに1回だけ組み立てる。描画中は .format と連結だけ
+#   ・指数セルの色は「指数の位置 t -> style」の表を先に作っておき、bisect で引く（境目のすぐ近くだけ計算し直す）
+#   ・レースごとの指数の min / max はレースにつき1回（馬ごとに数え直さない）
+#   ・inline の出力は以前の render_html / render_result_html とバイト単位で同じ
+# - スタイルの出し方（HTML_STYLE）
+#   ・inline（既定）：今まで通り、要素ごとに style='…' を書く
+#   ・class        ：同じ宣言をクラスにまとめ、ページ先頭の <style> 1つに入れる（div.fn-post の中だけに効く）
+#     表のセルは素の <td> にして「表のクラス＋列番号」（td:nth-child(k)）で当てる
+#     → 見た目は同じまま（要素ごとの宣言は inline と同じ）、ページが数分の1になる（git / WP へのアップロード / 読者の転送量）
+#   ・指数セルの色は馬ごとに違うので、そこだけは class でも style に残す（#rrggbb に縮めて）
+#
+# ※ WP で <style> を使うには投稿ユーザーに unfiltered_html の権限が要る（無いと <style> が消えて素の表になる）
+# ※ 速さは bench_render.py で測る
+
+import os, re
+from bisect import bisect_right
+from html import escape as _escape
+from types import SimpleNamespace
+
+HTML_STYLE = os.environ.get("HTML_STYLE", "inline").strip().lower()  # inline | class
+MODES = ("inline", "class")
+
+ROOT_CLASS = "fn-post"
+MARK_NONE = "—"
+INK = "#111827"
+WHITE = "#ffffff"
+
+_ESC_RE = re.compile(r"[&<>\"']")
+_CLASS_ATTR_RE = re.compile(r"class='([^']*)'")
+
+
+def esc(s) -> str:
+    s = str(s)
+    # 馬名・印などはほぼ素通し（html.escape は replace を5回するので、要る時だけ呼ぶ）
+    return _escape(s) if _ESC_RE.search(s) else s
+
+
+# =========================
+# class モードの規則（規則の本文 -> それが効くのに要るクラス名）
+# =========================
+_RULES = {}
+
+def _rule(needs: tuple, selector: str, decl: str):
+    _RULES[f"div.{ROOT_CLASS}{selector}{{{decl}}}"] = needs
+
+def _css(html: str) -> str:
+    """ページで使っているクラスの規則だけを <style> にする（並びは規則の名前順：何度描いても同じ）"""
+    used = {c for m in _CLASS_ATTR_RE.findall(html) for c in m.split()}
+    return "<style>" + "".join(sorted(r for r, needs in _RULES.items() if used.issuperset(needs))) + "</style>"
+
+# バッジの色（class モードのクラス名。知らない色は色コードから）
+_PALETTE = {"#f59e0b": "amber", "#6b7280": "gray", "#10b981": "green", "#ef4444": "red", "#bfdbfe": "sky", "#fecaca": "rose"}
+_BADGE_CLASS = {}
+
+def _badge_class(bg: str, fg: str) -> str:
+    name = _BADGE_CLASS.get((bg, fg))
+    if name is None:
+        suffix = {INK: "", WHITE: "-w"}.get(fg, "-" + fg.lstrip("#"))
+        name = _BADGE_CLASS[(bg, fg)] = f"fn-{_PALETTE.get(bg, bg.lstrip('#'))}{suffix}"
+        _rule((name,), f" .{name}", f"background:{bg};color:{fg};")
+    return name
+
+
+class _Style:
+    """style='…'（inline）か class='…'＋規則（class）かを1か所で決める"""
+
+    def __init__(self, mode: str):
+        self.cls = mode == "class"
+
+    def attr(self, name: str, decl: str) -> str:
+        if self.cls:
+            _rule((name,), f" .{name}", decl)
+            return f" class='{name}'"
+        return f" style='{decl}'"
+
+    def table(self, name: str, cols: str, decl: str) -> str:
+        """表の開きタグ。class では name（表の宣言）と cols（列の規則用）の2つを付ける"""
+        if self.cls:
+            _rule((name,), f" .{name}", decl)
+            return f"<table class='{name} {cols}'>"
+        return f"<table style='{decl}'>"
+
+    def cell(self, tag: str, cols: str, k: int, decl: str) -> str:
+        """表のセルの開きタグ。class では素のタグにして、表の cols＋列番号に規則を付ける（colspan のセルは除く）"""
+        if self.cls:
+            _rule((cols,), f" .{cols} {tag}:nth-child({k}):not([colspan])", decl)
+            return f"<{tag}>"
+        return f"<{tag} style='{decl}'>"
+
+
+# =========================
+# 指数セルの色（位置 t -> style の表）
+# =========================
+SCORE_LO = (239, 246, 255)
+SCORE_HI = (29, 78, 216)
+_SCORE_FIXED = ("padding:2px 8px;border-radius:10px;display:inline-block;"
+                "min-width:72px;text-align:right;font-variant-numeric:tabular-nums;"
+                "font-weight:900;")
+_NO_SCALE = "color:#111827;"
+
+def _score_style_at(t2: float, cls: bool = False) -> str:
+    """t2（0〜1）-> style（表を作る時と、境目のすぐ近くの時だけ呼ぶ）。class は色だけ（残りは .fn-sc）"""
+    bg = tuple(int(round(c1 + (c2 - c1) * t2)) for c1, c2 in zip(SCORE_LO, SCORE_HI))
+    luma = 0.2126 * bg[0] + 0.7152 * bg[1] + 0.0722 * bg[2]
+    fg = (255, 255, 255) if luma < 140 else (17, 24, 39)
+    if cls:
+        return "background:#%02x%02x%02x;color:#%02x%02x%02x;" % (bg + fg)
+    return f"background:rgb({bg[0]},{bg[1]},{bg[2]});color:rgb({fg[0]},{fg[1]},{fg[2]});" + _SCORE_FIXED
+
+# どれかの色成分の丸めが変わる t の位置（境目）。境目の間は同じ色なので、間の真ん中で1回だけ計算しておく
+_CUTS = sorted({
+    c for lo, hi in zip(SCORE_LO, SCORE_HI) if hi != lo
+    for k in range(min(lo, hi), max(lo, hi))
+    for c in [(k + 0.5 - lo) / (hi - lo)] if 0.0 < c < 1.0
+})
+_CUT_MIDS = [0.0] + [(a + b) / 2 for a, b in zip(_CUTS, _CUTS[1:])] + [1.0]
+_CUT_EPS = 1e-9
+
+def race_scale(picks):
+    """レースの指数の (min, max)。数値の指数が無ければ None"""
+    scores = [float(p.get("score", 0.0)) for p in picks if isinstance(p.get("score", None), (int, float))]
+    return (min(scores), max(scores)) if scores else None
+
+
+# =========================
+# テンプレート（モードごとに import 時に1回だけ組み立てる）
+# =========================
+def _build(mode: str):
+    s = _Style(mode)
+    t = SimpleNamespace(mode=mode, cls=s.cls)
+
+    root_decl = "max-width:980px;margin:0 auto;line-height:1.7;color:#111827;"
+    if s.cls:
+        _rule((ROOT_CLASS,), "", root_decl)
+        t.ROOT_OPEN = f"<div class='{ROOT_CLASS}'>"
+    else:
+        t.ROOT_OPEN = f"<div class='{ROOT_CLASS}' style='{root_decl}'>"
+    t.CARD_OPEN = f"<div{s.attr('fn-card', 'margin:16px 0 18px;padding:12px 12px;border:1px solid #e5e7eb;border-radius:14px;background:#ffffff;')}>"
+    t.TABLE_WRAP = f"<div{s.attr('fn-scroll', 'overflow-x:auto;')}>"
+    t.TABLE_END = "</tbody></table></div>"
+    t.H2 = (f"<h2{s.attr('fn-h2', 'margin:12px 0 8px;font-size:20px;font-weight:900;')}>" + "{}</h2>").format
+    badges_open = f"<div{s.attr('fn-badges', 'display:flex;gap:8px;align-items:center;justify-content:flex-end;flex-wrap:wrap;')}>"
+    head_open = f"<div{s.attr('fn-head', 'display:flex;align-items:center;justify-content:space-between;gap:10px;flex-wrap:wrap;')}>"
+
+    # バッジ（class は形を .fn-badge、色を色ごとのクラスに）
+    if s.cls:
+        _rule(("fn-badge",), " .fn-badge", "display:inline-block;padding:4px 10px;border-radius:999px;"
+              "font-weight:900;font-size:12px;letter-spacing:.02em;line-height:1;white-space:nowrap;")
+        badge_tpl = "<span class='fn-badge {}'>{}</span>".format
+
+        def badge(text: str, bg: str, fg: str = INK) -> str:
+            return badge_tpl(_badge_class(bg, fg), esc(text))
+    else:
+        badge_tpl = ("<span style='display:inline-block;padding:4px 10px;border-radius:999px;"
+                     "background:{};color:{};font-weight:900;font-size:12px;letter-spacing:.02em;"
+                     "line-height:1;white-space:nowrap;'>{}</span>").format
+
+        def badge(text: str, bg: str, fg: str = INK) -> str:
+            return badge_tpl(bg, fg, esc(text))
+    t.badge = badge
+
+    def section_title(name: str, bg: str, left: str, right: str) -> str:
+        decl = ("display:flex;align-items:center;justify-content:space-between;"
+                f"padding:10px 12px;border-radius:12px;background:{bg};margin:10px 0 8px;")
+        return (f"<div{s.attr(name, decl)}><strong{s.attr('fn-sec-t', 'font-size:14px;')}>{esc(left)}</strong>"
+                + badges_open + right + "</div></div>")
+
+    t.RACE_HEAD = (head_open + f"<div{s.attr('fn-race', 'font-size:18px;font-weight:900;color:#111827;')}>"
+                   + "{}</div>" + badges_open + "{}</div></div>").format
+
+    def th(cols: str, k: int, text: str, line: str, align: str, nowrap: bool = True) -> str:
+        decl = f"border-bottom:2px solid {line};padding:8px;text-align:{align};{'white-space:nowrap;' if nowrap else ''}"
+        return s.cell("th", cols, k, decl) + text + "</th>"
+
+    def td(cols: str, k: int, line: str, decl: str) -> str:
+        """開きタグだけ（中身と </td> はテンプレート側）"""
+        return s.cell("td", cols, k, f"padding:8px;border-bottom:1px solid {line};{decl}")
+
+    # 指数上位5頭の表（列の並びが predict と result で違うので、列の規則は fn-tp / fn-tq に分ける）
+    t.PRED_TITLE = section_title("fn-sec-p", "#eff6ff", "指数上位5頭", badge("PRED", "#bfdbfe"))
+    t.PRED_TABLE = {c: s.table("fn-tbl", c, "width:100%;border-collapse:collapse;") for c in ("fn-tp", "fn-tq")}
+
+    def pred_th(cols: str) -> str:
+        return (th(cols, 1, "印", "#1d4ed8", "center") + th(cols, 2, "馬番", "#1d4ed8", "center")
+                + th(cols, 3, "馬名", "#1d4ed8", "left", False) + th(cols, 4, "指数", "#1d4ed8", "right"))
+
+    t.PRED_THEAD = "<thead><tr>" + pred_th("fn-tp") + "</tr></thead><tbody>"
+    t.PRED_THEAD_PROB = ("<thead><tr>" + pred_th("fn-tp") + th("fn-tp", 5, "勝率", "#1d4ed8", "right")
+                         + th("fn-tp", 6, "3着内", "#1d4ed8", "right") + "</tr></thead><tbody>")
+    t.PRED_THEAD_RESULT = "<thead><tr>" + pred_th("fn-tq") + th("fn-tq", 5, "結果", "#1d4ed8", "center") + "</tr></thead><tbody>"
+
+    # 行の背景（1行おき）。class は tbody tr:nth-child(odd / even)
+    row_bg = ("#ffffff", "#f8fafc")
+    if s.cls:
+        for cols in ("fn-tp", "fn-tq"):
+            _rule((cols,), f" .{cols} tbody tr:nth-child(odd)", f"background:{row_bg[0]};")
+            _rule((cols,), f" .{cols} tbody tr:nth-child(even)", f"background:{row_bg[1]};")
+        t.ROW_OPEN = ("<tr>", "<tr>")
+    else:
+        t.ROW_OPEN = tuple(f"<tr style='background:{bg};'>" for bg in row_bg)
+
+    # 行：(行の開きタグ, 印, 馬番, 馬名, 指数, 後ろの列)
+    t.PICK_ROW = {
+        cols: ("{}"
+               + td(cols, 1, "#dbeafe", "text-align:center;font-weight:900;") + "{}</td>"
+               + td(cols, 2, "#dbeafe", "text-align:center;font-variant-numeric:tabular-nums;") + "{}</td>"
+               + td(cols, 3, "#dbeafe", "text-align:left;font-weight:750;") + "{}</td>"
+               + td(cols, 4, "#dbeafe", "text-align:right;") + "{}</td>"
+               + "{}</tr>").format
+        for cols in ("fn-tp", "fn-tq")
+    }
+    t.PROB_TDS = tuple((td("fn-tp", k, "#dbeafe", "text-align:right;font-variant-numeric:tabular-nums;white-space:nowrap;")
+                        + "{}</td>").format for k in (5, 6))
+    t.POS_TD = (td("fn-tq", 5, "#dbeafe", "text-align:center;font-weight:900;") + "{}</td>").format
+    t.FORM = (f"<div{s.attr('fn-form', 'font-size:11px;font-weight:500;color:#6b7280;font-variant-numeric:tabular-nums;')}>"
+              + "近走 {}</div>").format
+
+    # 指数セル（色だけ style に残す）
+    if s.cls:
+        _rule(("fn-sc",), " .fn-sc", _SCORE_FIXED)
+        t.SCORE = "<span class='fn-sc' style=\"{}\">{:.2f}</span>".format
+    else:
+        t.SCORE = '<span style="{}">{:.2f}</span>'.format
+    t.SCORE_LUT = [_score_style_at(x, s.cls) for x in _CUT_MIDS]
+    t.SCORE_PLAIN = ('<span style="' + _NO_SCALE + '">{:.2f}</span>').format
+
+    # 結果（1〜3着）の表（result）
+    t.RESULT_TITLE = section_title("fn-sec-r", "#fff1f2", "結果（1〜3着）", badge("RESULT", "#fecaca"))
+    t.RESULT_TABLE = s.table("fn-tbl3", "fn-t3", "width:100%;border-collapse:collapse;margin-bottom:10px;")
+    t.RESULT_THEAD = ("<thead><tr>" + th("fn-t3", 1, "着", "#991b1b", "center") + th("fn-t3", 2, "馬番", "#991b1b", "center")
+                      + th("fn-t3", 3, "馬名", "#991b1b", "left", False) + th("fn-t3", 4, "予想印", "#991b1b", "center")
+                      + th("fn-t3", 5, "予想指数", "#991b1b", "right") + "</tr></thead><tbody>")
+    t.TOP3_ROW = ("<tr>"
+                  + td("fn-t3", 1, "#fee2e2", "text-align:center;font-weight:900;") + "{}</td>"
+                  + td("fn-t3", 2, "#fee2e2", "text-align:center;") + "{}</td>"
+                  + td("fn-t3", 3, "#fee2e2", "text-align:left;font-weight:750;") + "{}</td>"
+                  + td("fn-t3", 4, "#fee2e2", "text-align:center;font-weight:900;") + "{}</td>"
+                  + td("fn-t3", 5, "#fee2e2", "text-align:right;") + "{}</td>"
+                  + "</tr>").format
+    t.NO_SCORE = f"<span{s.attr('fn-muted', 'color:#6b7280;')}>—</span>"
+    t.NO_RESULT_ROW = f"<tr><td colspan='5'{s.attr('fn-none', 'padding:10px;color:#6b7280;')}>結果取得できませんでした</td></tr>"
+    t.BET_ROW = (f"<div{s.attr('fn-bet', 'margin-top:10px;display:flex;gap:8px;flex-wrap:wrap;')}>" + "{}</div>").format
+
+    # 収支サマリ（result の先頭）
+    t.SUMMARY = (f"<div{s.attr('fn-sum', 'margin:14px 0 18px;padding:12px 12px;border:1px solid #e5e7eb;border-radius:14px;background:#ffffff;')}>"
+                 + head_open
+                 + f"<div{s.attr('fn-sum-t', 'font-size:16px;font-weight:900;color:#111827;')}>注目レース（三連複BOX） 収支サマリ</div>"
+                 + badges_open + "{}</div>"
+                 + "</div>"
+                 + f"<div{s.attr('fn-sum-b', 'margin-top:10px;display:flex;gap:10px;flex-wrap:wrap;')}>"
+                 + "{}"
+                 + "</div>"
+                 + f"<div{s.attr('fn-note', 'margin-top:8px;color:#6b7280;font-size:12px;')}>※注目レースのみ指数上位5頭三連複BOX集計</div>"
+                 + "</div>").format
+    return t
+
+_TPL = {m: _build(m) for m in MODES}
+
+def _tpl(mode: str = None):
+    return _TPL["class" if (mode or HTML_STYLE) == "class" else "inline"]
+
+def _finish(t, parts) -> str:
+    html = "\n".join(parts)
+    if not t.cls:
+        return html
+    # <style> はルートの div の中（WP の本文に貼っても一緒に動く）
+    return t.ROOT_OPEN + "\n" + _css(html) + html[len(t.ROOT_OPEN):]
+
+
+# =========================
+# 共通の部品
+# =========================
+def score_html(t, sc: float, scale) -> str:
+    if scale is None:
+        return t.SCORE_PLAIN(sc)
+    mn, mx = scale
+    x = 0.55 if mx == mn else (float(sc) - mn) / (mx - mn)
+    t2 = max(0.0, min(1.0, x ** 0.75))
+    i = bisect_right(_CUTS, t2)
+    if (i and t2 - _CUTS[i - 1] < _CUT_EPS) or (i < len(_CUTS) and _CUTS[i] - t2 < _CUT_EPS):
+        return t.SCORE(_score_style_at(t2, t.cls), sc)
+    return t.SCORE(t.SCORE_LUT[i], sc)
+
+def konsen_badge(t, k: dict, default_name: str) -> str:
+    kval = k.get("value", None)
+    if not isinstance(kval, (int, float)):
+        return ""
+    kname = k.get("name", default_name)
+    if bool(k.get("is_focus", False)):
+        return t.badge(f"注目 {kname}{float(kval):.1f}", "#f59e0b", WHITE)
+    return t.badge(f"{kname}{float(kval):.1f}", "#6b7280", WHITE)
+
+def race_head(t, rno: int, race_name: str, badges: str) -> str:
+    head = f"{rno}R" + (f" {race_name}" if race_name else "")
+    return t.RACE_HEAD(esc(head), badges)
+
+
+# =========================
+# predict
+# =========================
+def render_predict(title: str, preds, konsen_enable: bool = True, konsen_name: str = "混戦度", mode: str = None) -> str:
+    t = _tpl(mode)
+    row = t.PICK_ROW["fn-tp"]
+    parts = [t.ROOT_OPEN, t.H2(esc(title))]
+
+    for race in preds:
+        rno = int(race["race_no"])
+        picks = race["picks"]
+        scale = race_scale(picks)
+
+        badges = konsen_badge(t, race.get("konsen") or {}, konsen_name) if konsen_enable else ""
+        prob = race.get("prob") or {}
+        has_prob = any(isinstance(p.get("prob"), dict) for p in picks)
+        if isinstance(prob.get("box5_trio"), (int, float)):
+            badges += t.badge(f"BOX的中 {float(prob['box5_trio']) * 100.0:.0f}%", "#10b981", WHITE)
+
+        parts.append(t.CARD_OPEN)
+        parts.append(race_head(t, rno, (race.get("race_name") or "").strip(), badges))
+        parts.append(t.PRED_TITLE)
+        parts.append(t.TABLE_WRAP)
+        parts.append(t.PRED_TABLE["fn-tp"])
+        parts.append(t.PRED_THEAD_PROB if has_prob else t.PRED_THEAD)
+
+        for i, p in enumerate(picks):
+            prob_cells = ""
+            if has_prob:
+                pp = p.get("prob") or {}
+                for cell, key in zip(t.PROB_TDS, ("win", "top3")):
+                    v = pp.get(key)
+                    prob_cells += cell(f"{float(v) * 100.0:.1f}%" if isinstance(v, (int, float)) else "-")
+
+            # 近走（horse_index がある時だけ）
+            name = esc(p.get("name", ""))
+            if p.get("form"):
+                name += t.FORM(esc(p["form"]))
+
+            sc = float(p.get("score", 0.0))
+            parts.append(row(t.ROW_OPEN[i % 2], esc(p.get("mark", "")), int(p.get("umaban", 0)), name,
+                             score_html(t, sc, scale), prob_cells))
+
+        parts.append(t.TABLE_END)
+        parts.append("</div>")
+
+    parts.append("</div>")
+    return _finish(t, parts)
+
+
+# =========================
+# result
+# =========================
+def _comb3(n: int) -> int:
+    return (n * (n - 1) * (n - 2)) // 6 if n >= 3 else 0
+
+def _summary_card(t, pnl_summary: dict, bet_unit: int, box_n: int) -> str:
+    invest = int(pnl_summary.get("invest", 0) or 0)
+    payout = int(pnl_summary.get("payout", 0) or 0)
+    profit = int(pnl_summary.get("profit", 0) or 0)
+    races = int(pnl_summary.get("focus_races", 0) or 0)
+    hits = int(pnl_summary.get("hits", 0) or 0)
+    unit = int(pnl_summary.get("bet_unit", bet_unit) or bet_unit)
+    nbox = int(pnl_summary.get("box_n", box_n) or box_n)
+    pts = int(pnl_summary.get("bet_points_per_race", _comb3(nbox)) or _comb3(nbox))
+
+    roi = round((payout / invest) * 100.0, 1) if invest > 0 else 0.0
+    hit_rate = round((hits / races) * 100.0, 1) if races > 0 else 0.0
+
+    head = (t.badge(f"収支 {profit:+,}円", "#f59e0b" if profit >= 0 else "#ef4444", WHITE)
+            + t.badge(f"回収率 {roi:.1f}%", "#6b7280", WHITE)
+            + t.badge(f"的中率 {hit_rate:.1f}%（{hits}/{races}）", "#6b7280", WHITE))
+    body = (t.badge(f"注目レース {races}本", "#bfdbfe")
+            + t.badge(f"買い目 {nbox}頭BOX（{pts}点）", "#bfdbfe")
+            + t.badge(f"1点 {unit}円", "#bfdbfe")
+            + t.badge(f"投資 {invest:,}円", "#6b7280", WHITE)
+            + t.badge(f"払戻 {payout:,}円", "#6b7280", WHITE))
+    return t.SUMMARY(head, body)
+
+def _bet_row(t, bet: dict) -> str:
+    hit = bool(bet.get("hit"))
+    payout = int(bet.get("payout", 0) or 0)
+    invest = int(bet.get("invest", 0) or 0)
+    profit = int(bet.get("profit", 0) or 0)
+    return t.BET_ROW(
+        t.badge("注目BOX", "#f59e0b", WHITE)
+        + t.badge(("的中" if hit else "不的中"), "#f59e0b" if hit else "#6b7280", WHITE)
+        + t.badge(f"払戻 {payout:,}円", "#6b7280", WHITE)
+        + t.badge(f"投資 {invest:,}円", "#6b7280", WHITE)
+        + t.badge(f"収支 {profit:+,}円", "#f59e0b" if profit >= 0 else "#ef4444", WHITE)
+    )
+
+def render_result(title: str, races_out, pnl_summary: dict, konsen_name: str = "混戦度",
+                  bet_unit: int = 100, box_n: int = 5, race_name_fn=None, mode: str = None) -> str:
+    """race_name_fn：レース名の掃除（result_all_today.clean_race_name）"""
+    t = _tpl(mode)
+    row = t.PICK_ROW["fn-tq"]
+    parts = [t.ROOT_OPEN]
+    if pnl_summary:
+        parts.append(_summary_card(t, pnl_summary, bet_unit, box_n))
+
+    for r in races_out:
+        rno = int(r["race_no"])
+        race_name = (r.get("race_name") or "").strip()
+        if race_name_fn is not None:
+            race_name = race_name_fn(race_name)
+
+        pred = r.get("pred_top5", [])
+        top3 = r.get("result_top3", [])
+        pred_by_umaban = {int(x["umaban"]): x for x in pred}
+        scale = race_scale(pred)
+
+        # 全体的中バッジ（上位5で1-3着）
+        pred_hit = bool(r.get("pred_hit", False))
+        badges = (konsen_badge(t, r.get("konsen") or {}, konsen_name)
+                  + t.badge(("的中" if pred_hit else "不的中"), "#10b981" if pred_hit else "#6b7280", WHITE))
+
+        parts.append(t.CARD_OPEN)
+        parts.append(race_head(t, rno, race_name, badges))
+
+        parts.append(t.RESULT_TITLE)
+        parts.append(t.TABLE_WRAP)
+        parts.append(t.RESULT_TABLE)
+        parts.append(t.RESULT_THEAD)
+        if top3:
+            for x in top3:
+                u = int(x["umaban"])
+                p = pred_by_umaban.get(u)
+                idx = p.get("score") if p else None
+                idx_html = score_html(t, float(idx), scale) if isinstance(idx, (int, float)) else t.NO_SCORE
+                parts.append(t.TOP3_ROW(x["rank"], u, esc(x["name"]), esc(p["mark"] if p else MARK_NONE), idx_html))
+        else:
+            parts.append(t.NO_RESULT_ROW)
+        parts.append(t.TABLE_END)
+
+        parts.append(t.PRED_TITLE)
+        parts.append(t.TABLE_WRAP)
+        parts.append(t.PRED_TABLE["fn-tq"])
+        parts.append(t.PRED_THEAD_RESULT)
+        pos_by_umaban = {int(x["umaban"]): int(x["rank"]) for x in top3}
+        for i, p in enumerate(pred):
+            pos = pos_by_umaban.get(int(p["umaban"]))
+            parts.append(row(t.ROW_OPEN[i % 2], esc(p["mark"]), int(p["umaban"]), esc(p["name"]),
+                             score_html(t, float(p["score"]), scale), t.POS_TD(esc(f"{pos}着" if pos else MARK_NONE))))
+        parts.append(t.TABLE_END)
+
+        bet = r.get("bet_box") or {}
+        if bet.get("is_focus"):
+            parts.append(_bet_row(t, bet))
+
+        parts.append("</div>")
+
+    parts.append("</div>")
+    return _finish(t, parts)
@@ -8,15 +8,26 @@
 # これで「predict と result の上位5頭・指数・混戦度」がズレなくなります。
 # ★追加：output/latest_local_result.json を「その日に1つでも結果を書けた時だけ」生成
 
-import os, re, json, time, glob
+import os, re, json, time
 from datetime import datetime
 from pathlib import Path
 
 import requests
 from bs4 import BeautifulSoup
 
+import jockey_stats as JS
+import horse_index as HI
+import history_store as HS
+import tracks as T
+import pnl_ledger as PL
+import manifest as MF
+import archive
+import schema as SC
+import outwrite as OW
+import render as R
+import feed as FD
+
 UA = {"User-Agent": "Mozilla/5.0", "Accept-Language": "ja,en;q=0.8"}
-MARKS5 = ["◎", "〇", "▲", "△", "☆"]
 
 # ===== 混戦度の名前（表示用：predictからも来るけど保険）=====
 KONSEN_NAME = os.environ.get("KONSEN_NAME", "混戦度")
@@ -30,63 +41,17 @@ BET_BOX_N = int(os.environ.get("BET_BOX_N", "5"))  # 上位何頭BOX（デフォ
 DEBUG = os.environ.get("DEBUG", "").strip() == "1"
 REFUND_DEBUG = os.environ.get("REFUND_DEBUG", "").strip() == "1"
 
-# ===== 累計PnLファイル =====
-PNL_FILE = os.environ.get("PNL_FILE", "output/pnl_total.json")
+# ===== 累計PnL（pnl_ledger.py）：台帳 output/pnl_ledger.jsonl に upsert、pnl_total.json はそこからの集計 =====
+PNL_FILE = PL.PNL_FILE
 
+# ===== 自前の騎手成績（jockey_stats.py）：RaceMarkTable の全着順＋騎手をその日の分だけ畳み込む =====
+JOCKEY_STATS_ENABLE = os.environ.get("JOCKEY_STATS", "1").strip() != "0"
 
-# =========================
-# PNL（累計収支）保存用
-# =========================
-def load_pnl_total(path: str):
-    p = Path(path)
-    if not p.exists():
-        return {
-            "invest": 0, "payout": 0, "profit": 0,
-            "races": 0, "hits": 0,
-            "last_updated": None,
-
-            # ★追加：全体予想（上位5で1-3着）累計
-            "pred_races": 0,
-            "pred_hits": 0,
-            "pred_hit_rate": None,
-            "pred_by_place": {},  # { "船橋": {"races":..,"hits":..,"hit_rate":..}, ... }
-        }
-    try:
-        d = json.loads(p.read_text(encoding="utf-8"))
-        if not isinstance(d, dict):
-            raise ValueError("invalid pnl_total.json")
-        d.setdefault("invest", 0)
-        d.setdefault("payout", 0)
-        d.setdefault("profit", 0)
-        d.setdefault("races", 0)
-        d.setdefault("hits", 0)
-        d.setdefault("last_updated", None)
-
-        # ★追加キー（既存ファイル互換）
-        d.setdefault("pred_races", 0)
-        d.setdefault("pred_hits", 0)
-        d.setdefault("pred_hit_rate", None)
-        d.setdefault("pred_by_place", {})
-
-        if not isinstance(d.get("pred_by_place"), dict):
-            d["pred_by_place"] = {}
-
-        return d
-    except Exception:
-        return {
-            "invest": 0, "payout": 0, "profit": 0,
-            "races": 0, "hits": 0,
-            "last_updated": None,
-
-            "pred_races": 0,
-            "pred_hits": 0,
-            "pred_hit_rate": None,
-            "pred_by_place": {},
-        }
+# ===== 馬ごとの履歴（horse_index.py）：その日の predict（全頭）＋着順を畳み込む =====
+HORSE_INDEX_ENABLE = os.environ.get("HORSE_INDEX", "1").strip() != "0"
 
-def save_pnl_total(path: str, total: dict):
-    Path(path).parent.mkdir(parents=True, exist_ok=True)
-    Path(path).write_text(json.dumps(total, ensure_ascii=False, indent=2), encoding="utf-8")
+# ===== 履歴 DB（history_store.py）：書いた result JSON をその場で取り込む =====
+HISTORY_STORE_ENABLE = os.environ.get("HISTORY_STORE", "1").strip() != "0"
 
 
 def fetch(url: str, debug=False) -> str:
@@ -105,17 +70,11 @@ def fetch(url: str, debug=False) -> str:
     return r.text
 
 
-# keiba.go.jp babaCode（開催判定用）※帯広除外
-BABA_CODE = {
-  "門別": 36, "盛岡": 10, "水沢": 11, "浦和": 18, "船橋": 19, "大井": 20, "川崎": 21,
-  "金沢": 22, "笠松": 23, "名古屋": 24, "園田": 27, "姫路": 28, "高知": 31, "佐賀": 32,
-}
-
-# ★出力ファイル名用（従来どおり keibabloodコードを維持）
-KEIBABLOOD_CODE = {
-  "門別": "30","盛岡": "35","水沢": "36","浦和": "42","船橋": "43","大井": "44","川崎": "45",
-  "金沢": "46","笠松": "47","名古屋": "48","園田": "50","姫路": "51","高知": "54","佐賀": "55",
-}
+# 開催場の台帳（tracks.py）
+# - BABA_CODE：keiba.go.jp babaCode（開催判定・ファイル名）※帯広除外
+# - KEIBABLOOD_CODE：result JSON の place_code（従来どおり keibablood コード）
+BABA_CODE = T.BABA_CODE
+KEIBABLOOD_CODE = T.KEIBABLOOD_CODE
 
 def detect_active_tracks_keibago(yyyymmdd: str, debug=False):
     active = []
@@ -133,160 +92,39 @@ def detect_active_tracks_keibago(yyyymmdd: str, debug=False):
 
 
 # =========================
-# ★predict JSON を探す（これが“完全一致”のキモ）
+# ★predict JSON を読む（これが“完全一致”のキモ）
 # =========================
-def _find_predict_json(yyyymmdd: str, code: str):
-    # code は「baba（19とか）」または「place_code（43とか）」のどっちでもOK
-    code = str(code)
-    cand = []
-    cand += glob.glob(f"output/predict_{yyyymmdd}_{code}.json")
-    cand += glob.glob(f"predict_{yyyymmdd}_{code}.json")
-    cand += glob.glob(f"out/predict_{yyyymmdd}_{code}.json")
-    cand += glob.glob(f"**/predict_{yyyymmdd}_{code}.json", recursive=True)
-
-    cand = [c for c in cand if Path(c).is_file()]
-    return cand[0] if cand else None
+PICK_KEYS = ("mark", "umaban", "name", "score", "sp", "base_index", "jockey", "jockey_add", "source")
 
 def _norm_pred_races(pred_json: dict):
-    """predict JSON を result 用に正規化する。
-    対応フォーマット：
-      - newer: { predictions: [ {race_no, race_name, picks:[...], konsen:{...}} ] }
-      - older: { races: [ {race_no, race_name, pred_top5:[...], konsen:{...}} ] }
+    """predict JSON -> result 用のレース一覧（race_no, race_name, pred_top5, konsen）
+    今の版（schema.SCHEMA_VERSION）はそのまま使う。別名キー・型の直しは旧版だけ schema.upgrade_predict で
     """
-    # --- 新フォーマット（あなたの実データ）---
-    preds = pred_json.get("predictions")
-    if isinstance(preds, list):
-        out = []
-        for r in preds:
-            if not isinstance(r, dict):
-                continue
-            rno = r.get("race_no")
-            try:
-                rno = int(rno)
-            except Exception:
-                continue
-
-            race_name = r.get("race_name") or r.get("name") or ""
-            konsen = r.get("konsen") if isinstance(r.get("konsen"), dict) else {}
-
-            picks = r.get("picks") or []
-            if not isinstance(picks, list):
-                picks = []
-
-            pred_top5 = []
-            for i, p in enumerate(picks[:5]):
-                if not isinstance(p, dict):
-                    continue
-                umaban = p.get("umaban") or p.get("umaban_no") or p.get("horse_no") or p.get("num")
-                try:
-                    umaban = int(umaban)
-                except Exception:
-                    continue
-
-                name = p.get("name") or p.get("horse_name") or ""
-                score = p.get("score")
-                try:
-                    score = float(score)
-                except Exception:
-                    continue
-
-                mark = p.get("mark") or (MARKS5[i] if i < len(MARKS5) else "—")
-
-                pred_top5.append({
-                    "mark": str(mark),
-                    "umaban": int(umaban),
-                    "name": str(name),
-                    "score": float(score),
-                    # 互換：predictが持ってるなら残す
-                    "sp": p.get("sp"),
-                    "base_index": p.get("base_index"),
-                    "jockey": p.get("jockey", ""),
-                    "jockey_add": p.get("jockey_add", 0.0),
-                    "source": p.get("source", {}),
-                })
-
-            if pred_top5:
-                out.append({
-                    "race_no": rno,
-                    "race_name": str(race_name or ""),
-                    "pred_top5": pred_top5,
-                    "konsen": konsen,
-                })
-        return out
-
-    # --- 旧フォーマット ---
-    races = pred_json.get("races") or pred_json.get("RACES") or []
-    if not isinstance(races, list):
-        return []
+    if not SC.is_current(pred_json):
+        pred_json = SC.upgrade_predict(pred_json)
     out = []
-    for r in races:
-        if not isinstance(r, dict):
+    for r in pred_json.get("predictions") or []:
+        picks = r.get("picks") or []
+        if not picks:
             continue
-        rno = r.get("race_no") or r.get("raceNo") or r.get("no")
-        try:
-            rno = int(rno)
-        except Exception:
-            continue
-
-        top5 = r.get("pred_top5") or r.get("top5") or r.get("predict_top5") or []
-        if not isinstance(top5, list):
-            top5 = []
-
-        pred_top5 = []
-        for i, p in enumerate(top5[:5]):
-            if not isinstance(p, dict):
-                continue
-            umaban = p.get("umaban") or p.get("umaban_no") or p.get("horse_no") or p.get("num")
-            try:
-                umaban = int(umaban)
-            except Exception:
-                continue
-            name = p.get("name") or p.get("horse_name") or ""
-            score = p.get("score") if "score" in p else (p.get("sp") or p.get("index"))
-            try:
-                score = float(score)
-            except Exception:
-                continue
-
-            mark = p.get("mark") or (MARKS5[i] if i < len(MARKS5) else "—")
-            pred_top5.append({
-                "mark": mark,
-                "umaban": int(umaban),
-                "name": str(name),
-                "score": float(score),
-                "sp": p.get("sp"),
-                "base_index": p.get("base_index"),
-                "jockey": p.get("jockey", ""),
-                "jockey_add": p.get("jockey_add", 0.0),
-                "source": p.get("source", {}),
-            })
-
-        konsen = r.get("konsen") if isinstance(r.get("konsen"), dict) else {}
-        race_name = r.get("race_name") or r.get("name") or ""
-        if pred_top5:
-            out.append({
-                "race_no": rno,
-                "race_name": str(race_name or ""),
-                "pred_top5": pred_top5,
-                "konsen": konsen,
-            })
+        out.append({
+            "race_no": r["race_no"],
+            "race_name": r.get("race_name") or "",
+            "pred_top5": [{k: p.get(k) for k in PICK_KEYS} for p in picks[:5]],
+            "konsen": r.get("konsen") or {},
+        })
     return out
 
-def load_predict_for_track(yyyymmdd: str, baba: int, place_code: str):
+def load_predict_for_track(yyyymmdd: str, track: str):
     """predict JSON を読み込んで race_no -> dict を返す。
-    探し方：
-      - まず baba（例: 19）で探す（あなたの現状のpredict出力はこれ）
-      - 見つからなければ place_code（例: 43）でも探す（将来の保険）
+    場所は tracks.output_path で決まる（output/predict_{date}_{baba}.json。探し回らない。月の zip に入っていてもよい）
     """
-    path = _find_predict_json(yyyymmdd, str(baba))
-    if not path:
-        path = _find_predict_json(yyyymmdd, str(place_code))
-
-    if not path:
+    path = T.output_path("predict", yyyymmdd, track).as_posix()
+    if not archive.exists(path):
         return None, None
 
     try:
-        d = json.loads(Path(path).read_text(encoding="utf-8"))
+        d = json.loads(archive.read_text(path))
     except Exception as e:
         print(f"[WARN] predict json read failed: {path} err={e}")
         return None, path
@@ -334,11 +172,19 @@ def clean_race_name(raw: str) -> str:
 
     return s
 
-def parse_top3_from_racemark(html_text: str):
+def parse_finishers_from_racemark(html_text: str, limit: int = None):
+    """
+    RaceMarkTable の着順表 → [{"rank","umaban","name","jockey"}, ...]（着順どおり、全頭）
+    - 騎手列はヘッダの「騎手」の位置（枠番列が無い行は1つ左にずらす）。見つからなければ jockey=""
+    """
     soup = BeautifulSoup(html_text, "lxml")
     top = []
+    c_jockey = None
     for tr in soup.find_all("tr"):
         tds = [td.get_text(" ", strip=True) for td in tr.find_all(["th","td"])]
+        if c_jockey is None and "騎手" in tds and "馬番" in tds:
+            c_jockey = tds.index("騎手")
+            continue
         if len(tds) < 4:
             continue
         pos = tds[0]
@@ -347,20 +193,30 @@ def parse_top3_from_racemark(html_text: str):
 
         umaban = None
         name = None
+        shift = 0
         if len(tds) >= 4 and re.fullmatch(r"\d+", tds[2]):
             umaban = int(tds[2]); name = clean_horse_name(tds[3])
         elif len(tds) >= 3 and re.fullmatch(r"\d+", tds[1]):
-            umaban = int(tds[1]); name = clean_horse_name(tds[2])
+            umaban = int(tds[1]); name = clean_horse_name(tds[2]); shift = -1
         else:
             continue
 
         if not name:
             continue
-        top.append({"rank": int(pos), "umaban": umaban, "name": name})
-        if len(top) >= 3:
+        jockey = ""
+        if c_jockey is not None and 0 <= c_jockey + shift < len(tds):
+            jockey = JS.clean_jockey_name(tds[c_jockey + shift])
+        top.append({"rank": int(pos), "umaban": umaban, "name": name, "jockey": jockey})
+        if limit and len(top) >= limit:
             break
     return top
 
+def top3_from_finishers(finishers):
+    return [{k: f[k] for k in ("rank", "umaban", "name")} for f in finishers[:3]]
+
+def parse_top3_from_racemark(html_text: str):
+    return top3_from_finishers(parse_finishers_from_racemark(html_text, limit=3))
+
 
 # =========================
 # ★追加：全体的中判定（上位5に1-3着が全部入ってたら的中）
@@ -561,6 +417,103 @@ def box_hit_payout(top_umaban_list, sanrenpuku_rows):
     return (payout_total > 0), payout_total, hit_combos
 
 
+# =========================
+# 影モデル（predict の SHADOW_VARIANTS）の採点
+# - output/shadow_{date}_{baba}.json があれば、本番と同じ結果・払戻で採点して side file に書く
+# - 本番（prod）も同じ物差しで並べる。取得は本番分だけ（影モデル専用の取得はしない）
+# =========================
+def _shadow_score_one(top_umaban, konsen, result_top3, san):
+    top3_nums = [int(x["umaban"]) for x in (result_top3 or [])[:3]]
+    s5 = set(top_umaban[:5])
+    hit, payout100, _ = box_hit_payout(top_umaban[:BET_BOX_N], san)
+    return {
+        "pred_hit": bool(len(top3_nums) >= 3 and set(top3_nums).issubset(s5)),
+        "win": bool(top3_nums and top_umaban and top_umaban[0] == top3_nums[0]),
+        "is_focus": bool((konsen or {}).get("is_focus", False)),
+        "box_payout": int(payout100 * (BET_UNIT / 100.0)),
+    }
+
+def score_shadow_variants(yyyymmdd: str, baba: int, place_code: str, outcomes: dict, pred_map: dict):
+    """
+    outcomes: race_no -> (result_top3, sanrenpuku_rows)  ※結果が取れたレースだけ
+    return: 書いたファイルパス（影ファイルがなければ None）
+    """
+    sp = T.output_path("shadow", yyyymmdd, baba)
+    if not archive.exists(sp):
+        return None
+    try:
+        sh = json.loads(archive.read_text(sp))
+    except Exception as e:
+        print(f"[WARN] shadow json read failed: {sp} err={e}")
+        return None
+
+    pts = comb3_count(BET_BOX_N)
+    names = ["prod"] + list((sh.get("variants") or {}).keys())
+    summary = {n: {"races": 0, "pred_hits": 0, "wins": 0, "skipped": 0, "box_invest": 0, "box_payout": 0,
+                   "focus_races": 0, "focus_hits": 0, "focus_invest": 0, "focus_payout": 0} for n in names}
+    races = []
+
+    for sr in sh.get("races") or []:
+        rno = int(sr.get("race_no", 0) or 0)
+        if rno not in outcomes:
+            continue
+        result_top3, san = outcomes[rno]
+        pr = pred_map.get(rno) or {}
+        cand = {"prod": {"umaban": [int(p["umaban"]) for p in pr.get("pred_top5", [])], "konsen": pr.get("konsen")}}
+        cand.update(sr.get("variants") or {})
+
+        row = {"race_no": rno}
+        for n in names:
+            v = cand.get(n) or {}
+            acc = summary[n]
+            if v.get("skip") or len(v.get("umaban") or []) < 5:
+                acc["skipped"] += 1
+                row[n] = {"skip": v.get("skip") or "missing"}
+                continue
+            r = _shadow_score_one(v["umaban"], v.get("konsen"), result_top3, san)
+            acc["races"] += 1
+            acc["pred_hits"] += int(r["pred_hit"])
+            acc["wins"] += int(r["win"])
+            acc["box_invest"] += pts * BET_UNIT
+            acc["box_payout"] += r["box_payout"]
+            if r["is_focus"]:
+                acc["focus_races"] += 1
+                acc["focus_hits"] += int(r["box_payout"] > 0)
+                acc["focus_invest"] += pts * BET_UNIT
+                acc["focus_payout"] += r["box_payout"]
+            row[n] = r
+        races.append(row)
+
+    for acc in summary.values():
+        n = acc["races"]
+        acc["pred_hit_rate"] = round(acc["pred_hits"] / n * 100.0, 1) if n else None
+        acc["win_rate"] = round(acc["wins"] / n * 100.0, 1) if n else None
+        acc["box_roi"] = round(acc["box_payout"] / acc["box_invest"] * 100.0, 1) if acc["box_invest"] else None
+        acc["focus_roi"] = round(acc["focus_payout"] / acc["focus_invest"] * 100.0, 1) if acc["focus_invest"] else None
+
+    out = {
+        "type": "fieldnote_shadow_result",
+        "date": yyyymmdd,
+        "place": sh.get("place"),
+        "place_code": place_code,
+        "baba_code": baba,
+        "box_n": BET_BOX_N,
+        "bet_unit": BET_UNIT,
+        "variants": {"prod": sh.get("production") or {}, **(sh.get("variants") or {})},
+        "summary": summary,
+        "races": races,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "source": {"shadow_json": str(sp).replace("\\", "/")},
+    }
+    path = T.output_path("shadow_result", yyyymmdd, baba)
+    OW.write_text(path, json.dumps(out, ensure_ascii=False, indent=2))
+    for n in names:
+        a = summary[n]
+        print(f"[SHADOW] {n:12s} races={a['races']} hit={a['pred_hit_rate']} win={a['win_rate']} "
+              f"box_roi={a['box_roi']} focus={a['focus_races']} focus_roi={a['focus_roi']}")
+    return path
+
+
 def build_racemark_url(baba: int, yyyymmdd: str, rno: int):
     date_slash = f"{yyyymmdd[0:4]}/{yyyymmdd[4:6]}/{yyyymmdd[6:8]}"
     return (
@@ -571,242 +524,9 @@ def build_racemark_url(baba: int, yyyymmdd: str, rno: int):
 
 # ====== HTML（あなたの現行デザイン維持） ======
 def render_result_html(title: str, races_out, pnl_summary: dict) -> str:
-    import html as _html
-
-    def esc(s): return _html.escape(str(s))
-
-    def _clamp01(x: float) -> float:
-        return max(0.0, min(1.0, x))
-
-    def _mix(c1, c2, t: float):
-        t = _clamp01(t)
-        return (
-            int(round(c1[0] + (c2[0] - c1[0]) * t)),
-            int(round(c1[1] + (c2[1] - c1[1]) * t)),
-            int(round(c1[2] + (c2[2] - c1[2]) * t)),
-        )
-
-    def _rgb(rgb):
-        return f"rgb({rgb[0]},{rgb[1]},{rgb[2]})"
-
-    def _luma(rgb):
-        r, g, b = rgb
-        return 0.2126 * r + 0.7152 * g + 0.0722 * b
-
-    LO = (239, 246, 255)
-    HI = (29, 78, 216)
-
-    def score_style(sc: float, scores_in_race):
-        if not scores_in_race:
-            return "color:#111827;"
-        mn = min(scores_in_race)
-        mx = max(scores_in_race)
-        if mx == mn:
-            t = 0.55
-        else:
-            t = (float(sc) - mn) / (mx - mn)
-
-        t2 = _clamp01(t ** 0.75)
-        bg = _mix(LO, HI, t2)
-        fg = (255, 255, 255) if _luma(bg) < 140 else (17, 24, 39)
-
-        return (
-            f"background:{_rgb(bg)};"
-            f"color:{_rgb(fg)};"
-            "padding:2px 8px;border-radius:10px;display:inline-block;"
-            "min-width:72px;text-align:right;font-variant-numeric:tabular-nums;"
-            "font-weight:900;"
-        )
-
-    def badge(text: str, bg: str, fg: str="#111827") -> str:
-        return (f"<span style='display:inline-block;padding:4px 10px;border-radius:999px;"
-                f"background:{bg};color:{fg};font-weight:900;font-size:12px;letter-spacing:.02em;line-height:1;white-space:nowrap;'>"
-                f"{esc(text)}</span>")
-
-    def section_title(left: str, right_badge: str, bg: str) -> str:
-        return (f"<div style='display:flex;align-items:center;justify-content:space-between;"
-                f"padding:10px 12px;border-radius:12px;background:{bg};margin:10px 0 8px;'>"
-                f"<strong style='font-size:14px;'>{esc(left)}</strong>"
-                f"<div style='display:flex;gap:8px;align-items:center;justify-content:flex-end;flex-wrap:wrap;'>{right_badge}</div>"
-                f"</div>")
-
-    parts = []
-    parts.append("<div class='fn-post' style='max-width:980px;margin:0 auto;line-height:1.7;color:#111827;'>")
-
-    if pnl_summary:
-        invest = int(pnl_summary.get("invest", 0) or 0)
-        payout = int(pnl_summary.get("payout", 0) or 0)
-        profit = int(pnl_summary.get("profit", 0) or 0)
-        races = int(pnl_summary.get("focus_races", 0) or 0)
-        hits = int(pnl_summary.get("hits", 0) or 0)
-        unit = int(pnl_summary.get("bet_unit", BET_UNIT) or BET_UNIT)
-        nbox = int(pnl_summary.get("box_n", BET_BOX_N) or BET_BOX_N)
-        pts = int(pnl_summary.get("bet_points_per_race", comb3_count(nbox)) or comb3_count(nbox))
-
-        roi = round((payout / invest) * 100.0, 1) if invest > 0 else 0.0
-        hit_rate = round((hits / races) * 100.0, 1) if races > 0 else 0.0
-
-        profit_badge = badge(f"収支 {profit:+,}円", "#f59e0b" if profit >= 0 else "#ef4444", "#ffffff")
-        roi_badge = badge(f"回収率 {roi:.1f}%", "#6b7280", "#ffffff")
-        hit_badge = badge(f"的中率 {hit_rate:.1f}%（{hits}/{races}）", "#6b7280", "#ffffff")
-
-        parts.append(
-            "<div style='margin:14px 0 18px;padding:12px 12px;"
-            "border:1px solid #e5e7eb;border-radius:14px;background:#ffffff;'>"
-            "<div style='display:flex;align-items:center;justify-content:space-between;gap:10px;flex-wrap:wrap;'>"
-            f"<div style='font-size:16px;font-weight:900;color:#111827;'>注目レース（三連複BOX） 収支サマリ</div>"
-            f"<div style='display:flex;gap:8px;align-items:center;justify-content:flex-end;flex-wrap:wrap;'>{profit_badge}{roi_badge}{hit_badge}</div>"
-            "</div>"
-            "<div style='margin-top:10px;display:flex;gap:10px;flex-wrap:wrap;'>"
-            f"{badge(f'注目レース {races}本', '#bfdbfe')}"
-            f"{badge(f'買い目 {nbox}頭BOX（{pts}点）', '#bfdbfe')}"
-            f"{badge(f'1点 {unit}円', '#bfdbfe')}"
-            f"{badge(f'投資 {invest:,}円', '#6b7280', '#ffffff')}"
-            f"{badge(f'払戻 {payout:,}円', '#6b7280', '#ffffff')}"
-            "</div>"
-            "<div style='margin-top:8px;color:#6b7280;font-size:12px;'>※注目レースのみ指数上位5頭三連複BOX集計</div>"
-            "</div>"
-        )
-
-    for r in races_out:
-        rno = int(r["race_no"])
-        race_name = clean_race_name((r.get("race_name") or "").strip())
-
-        pred = r.get("pred_top5", [])
-        top3 = r.get("result_top3", [])
-        pred_by_umaban = {int(x["umaban"]): x for x in pred}
-
-        scores_in_race = [float(p.get("score", 0.0)) for p in pred if isinstance(p.get("score", None), (int, float))]
-
-        k = r.get("konsen") or {}
-        kval = k.get("value", None)
-        is_focus = bool(k.get("is_focus", False))
-        kname = k.get("name", KONSEN_NAME)
-
-        konsen_badge = ""
-        if isinstance(kval, (int, float)):
-            if is_focus:
-                konsen_badge = badge(f"注目 {kname}{float(kval):.1f}", "#f59e0b", "#ffffff")
-            else:
-                konsen_badge = badge(f"{kname}{float(kval):.1f}", "#6b7280", "#ffffff")
-
-        # ★追加：全体的中バッジ（上位5で1-3着）
-        pred_hit = bool(r.get("pred_hit", False))
-        pred_hit_badge = badge(("的中" if pred_hit else "不的中"), "#10b981" if pred_hit else "#6b7280", "#ffffff")
-
-        parts.append(
-            "<div style='margin:16px 0 18px;padding:12px 12px;"
-            "border:1px solid #e5e7eb;border-radius:14px;background:#ffffff;'>"
-        )
-
-        head = f"{rno}R" + (f" {race_name}" if race_name else "")
-        parts.append(
-            "<div style='display:flex;align-items:center;justify-content:space-between;gap:10px;flex-wrap:wrap;'>"
-            f"<div style='font-size:18px;font-weight:900;color:#111827;'>{esc(head)}</div>"
-            f"<div style='display:flex;gap:8px;align-items:center;justify-content:flex-end;flex-wrap:wrap;'>{konsen_badge}{pred_hit_badge}</div>"
-            "</div>"
-        )
-
-        parts.append(section_title("結果（1〜3着）", badge("RESULT", "#fecaca"), "#fff1f2"))
-        parts.append("<div style='overflow-x:auto;'>")
-        parts.append("<table style='width:100%;border-collapse:collapse;margin-bottom:10px;'>")
-        parts.append(
-            "<thead><tr>"
-            "<th style='border-bottom:2px solid #991b1b;padding:8px;text-align:center;white-space:nowrap;'>着</th>"
-            "<th style='border-bottom:2px solid #991b1b;padding:8px;text-align:center;white-space:nowrap;'>馬番</th>"
-            "<th style='border-bottom:2px solid #991b1b;padding:8px;text-align:left;'>馬名</th>"
-            "<th style='border-bottom:2px solid #991b1b;padding:8px;text-align:center;white-space:nowrap;'>予想印</th>"
-            "<th style='border-bottom:2px solid #991b1b;padding:8px;text-align:right;white-space:nowrap;'>予想指数</th>"
-            "</tr></thead><tbody>"
-        )
-
-        if top3:
-            for x in top3:
-                u = int(x["umaban"])
-                nm = x["name"]
-                p = pred_by_umaban.get(u)
-                mark = p["mark"] if p else "—"
-                idx = p.get("score") if p else None
-
-                if isinstance(idx, (int, float)):
-                    sc = float(idx)
-                    sc_style = score_style(sc, scores_in_race)
-                    idx_html = f"<span style=\"{sc_style}\">{sc:.2f}</span>"
-                else:
-                    idx_html = "<span style='color:#6b7280;'>—</span>"
-
-                parts.append(
-                    "<tr>"
-                    f"<td style='padding:8px;border-bottom:1px solid #fee2e2;text-align:center;font-weight:900;'>{x['rank']}</td>"
-                    f"<td style='padding:8px;border-bottom:1px solid #fee2e2;text-align:center;'>{u}</td>"
-                    f"<td style='padding:8px;border-bottom:1px solid #fee2e2;text-align:left;font-weight:750;'>{esc(nm)}</td>"
-                    f"<td style='padding:8px;border-bottom:1px solid #fee2e2;text-align:center;font-weight:900;'>{esc(mark)}</td>"
-                    f"<td style='padding:8px;border-bottom:1px solid #fee2e2;text-align:right;'>{idx_html}</td>"
-                    "</tr>"
-                )
-        else:
-            parts.append("<tr><td colspan='5' style='padding:10px;color:#6b7280;'>結果取得できませんでした</td></tr>")
-
-        parts.append("</tbody></table></div>")
-
-        parts.append(section_title("指数上位5頭", badge("PRED", "#bfdbfe"), "#eff6ff"))
-        parts.append("<div style='overflow-x:auto;'>")
-        parts.append("<table style='width:100%;border-collapse:collapse;'>")
-        parts.append(
-            "<thead><tr>"
-            "<th style='border-bottom:2px solid #1d4ed8;padding:8px;text-align:center;white-space:nowrap;'>印</th>"
-            "<th style='border-bottom:2px solid #1d4ed8;padding:8px;text-align:center;white-space:nowrap;'>馬番</th>"
-            "<th style='border-bottom:2px solid #1d4ed8;padding:8px;text-align:left;'>馬名</th>"
-            "<th style='border-bottom:2px solid #1d4ed8;padding:8px;text-align:right;white-space:nowrap;'>指数</th>"
-            "<th style='border-bottom:2px solid #1d4ed8;padding:8px;text-align:center;white-space:nowrap;'>結果</th>"
-            "</tr></thead><tbody>"
-        )
-
-        pos_by_umaban = {}
-        for x in top3:
-            pos_by_umaban[int(x["umaban"])] = int(x["rank"])
-
-        for i, p in enumerate(pred):
-            bgrow = "#ffffff" if i % 2 == 0 else "#f8fafc"
-            pos = pos_by_umaban.get(int(p["umaban"]))
-            pos_txt = f"{pos}着" if pos else "—"
-            sc = float(p["score"])
-            sc_style = score_style(sc, scores_in_race)
-
-            parts.append(
-                f"<tr style='background:{bgrow};'>"
-                f"<td style='padding:8px;border-bottom:1px solid #dbeafe;text-align:center;font-weight:900;'>{esc(p['mark'])}</td>"
-                f"<td style='padding:8px;border-bottom:1px solid #dbeafe;text-align:center;font-variant-numeric:tabular-nums;'>{int(p['umaban'])}</td>"
-                f"<td style='padding:8px;border-bottom:1px solid #dbeafe;text-align:left;font-weight:750;'>{esc(p['name'])}</td>"
-                f"<td style='padding:8px;border-bottom:1px solid #dbeafe;text-align:right;'>"
-                f"<span style=\"{sc_style}\">{sc:.2f}</span>"
-                f"</td>"
-                f"<td style='padding:8px;border-bottom:1px solid #dbeafe;text-align:center;font-weight:900;'>{esc(pos_txt)}</td>"
-                f"</tr>"
-            )
-
-        parts.append("</tbody></table></div>")
-
-        bet = r.get("bet_box") or {}
-        if bet.get("is_focus"):
-            hit = bool(bet.get("hit"))
-            payout = int(bet.get("payout", 0) or 0)
-            invest = int(bet.get("invest", 0) or 0)
-            profit = int(bet.get("profit", 0) or 0)
-
-            b1 = badge("注目BOX", "#f59e0b", "#ffffff")
-            b2 = badge(("的中" if hit else "不的中"), "#f59e0b" if hit else "#6b7280", "#ffffff")
-            b3 = badge(f"払戻 {payout:,}円", "#6b7280", "#ffffff")
-            b4 = badge(f"投資 {invest:,}円", "#6b7280", "#ffffff")
-            b5 = badge(f"収支 {profit:+,}円", "#f59e0b" if profit >= 0 else "#ef4444", "#ffffff")
-
-            parts.append("<div style='margin-top:10px;display:flex;gap:8px;flex-wrap:wrap;'>"
-                         f"{b1}{b2}{b3}{b4}{b5}</div>")
-
-        parts.append("</div>")
-
-    parts.append("</div>")
-    return "\n".join(parts)
+    """描画は render.py（predict / result 共通）"""
+    return R.render_result(title, races_out, pnl_summary, konsen_name=KONSEN_NAME,
+                           bet_unit=BET_UNIT, box_n=BET_BOX_N, race_name_fn=clean_race_name)
 
 
 def main():
@@ -820,8 +540,13 @@ def main():
     active = detect_active_tracks_keibago(yyyymmdd, debug=DEBUG)
     print(f"[INFO] active_tracks = {active}")
 
-    # ===== 累計PnL（1回だけ読み込む）=====
-    pnl_total = load_pnl_total(PNL_FILE)
+    # ===== 累計PnL（1回だけ読み込む。更新は開催場ごとに差分だけ）=====
+    pnl = PL.load_snapshot()
+
+    jockey_store = JS.load_store() if JOCKEY_STATS_ENABLE else None
+    jockey_updated = False
+    horse_store = (HI.load_store() or HI.empty_store()) if HORSE_INDEX_ENABLE else None
+    horse_updated = False
 
     # =========================
     # ★LATEST 用（追加）
@@ -829,18 +554,20 @@ def main():
     wrote_any = False
     wrote_places = []
     wrote_files = []
+    man = MF.Section(yyyymmdd, "result")  # output/manifest_{date}.json（wp_post / ワークフローはこれを読む）
 
     for track in active:
         baba = BABA_CODE.get(track)
-        place_code = KEIBABLOOD_CODE.get(track)  # ★ファイル名（従来どおり）
+        place_code = KEIBABLOOD_CODE.get(track)  # result JSON の place_code（ファイル名は baba）
         if not baba or not place_code:
             print(f"[SKIP] {track}: code missing")
             continue
 
         # ★predict読み込み（ここが最重要）
-        pred_map, pred_path = load_predict_for_track(yyyymmdd, baba, place_code)
+        pred_map, pred_path = load_predict_for_track(yyyymmdd, track)
         if not pred_map:
             print(f"[SKIP] {track}: predict json not found. (need predict run first) baba={baba} place_code={place_code}")
+            man.add(MF.track_entry(T.get(track), "skipped", reason="no_predict", place_code=place_code, races=0))
             continue
 
         if DEBUG:
@@ -854,6 +581,9 @@ def main():
             print(f"[REFUND_DEBUG] {track} refundmoney_url={ref_url} races_with_sanrenpuku={len(sanrenpuku_map)}")
 
         races_out = []
+        outcomes = {}  # 影モデル採点用：race_no -> (result_top3, 三連複rows)
+        finishers_all = []  # 騎手成績用：レースごとの全着順
+        ledger_recs = []  # 収支台帳用：レースごとの1行
 
         # track内の注目BOX収支（記事サマリ用）
         focus_races = 0
@@ -861,10 +591,6 @@ def main():
         payout_sum = 0
         hits_sum = 0
 
-        # ★追加：開催場ごとの全体的中（当日分の集計）
-        track_pred_races = 0
-        track_pred_hits = 0
-
         # ★地方は最大12R想定（predictにあるレースだけ処理）
         for rno in range(1, 13):
             pr = pred_map.get(int(rno))
@@ -881,7 +607,9 @@ def main():
             # ---- 結果（上位3）----
             rm_url = build_racemark_url(baba, yyyymmdd, rno)
             rm_html = fetch(rm_url, debug=False)
-            result_top3 = parse_top3_from_racemark(rm_html) if rm_html else []
+            finishers = parse_finishers_from_racemark(rm_html) if rm_html else []
+            result_top3 = top3_from_finishers(finishers)
+            finishers = [{"rank": f["rank"], "umaban": f["umaban"], "jockey": f["jockey"]} for f in finishers if f["jockey"]]
 
             # ---- 払戻（三連複）RefundMoneyList優先 ----
             san = sanrenpuku_map.get(int(rno), [])
@@ -899,8 +627,9 @@ def main():
             # ★追加：全体的中判定（結果が取れてる時だけ累計）
             pred_hit = is_pred_hit(pred_top5, result_top3)
             if result_top3 and len(result_top3) >= 3:
-                track_pred_races += 1
-                track_pred_hits += (1 if pred_hit else 0)
+                outcomes[int(rno)] = (result_top3, san)
+                if finishers:
+                    finishers_all.append(finishers)
 
             # ★追加（最小変更）：表示用 sanrenpuku を 1つ作る（JS用）
             san_disp_rows = pick_sanrenpuku_for_display(result_top3, san)
@@ -930,11 +659,6 @@ def main():
                 payout_sum += int(payout)
                 hits_sum += (1 if hit else 0)
 
-                pnl_total["races"] = int(pnl_total.get("races", 0) or 0) + 1
-                pnl_total["hits"]  = int(pnl_total.get("hits", 0) or 0) + (1 if hit else 0)
-                pnl_total["invest"] = int(pnl_total.get("invest", 0) or 0) + int(invest)
-                pnl_total["payout"] = int(pnl_total.get("payout", 0) or 0) + int(payout)
-
                 bet_box = {
                     "is_focus": True,
                     "box_n": int(nbox),
@@ -948,7 +672,7 @@ def main():
                     "sanrenpuku_rows": san,
                 }
 
-            races_out.append({
+            race_out = {
                 "race_no": int(rno),
                 "race_name": race_name,
                 "konsen": konsen,
@@ -967,33 +691,19 @@ def main():
                     "racemark_url": rm_url,
                     "refundmoney_url": ref_url,
                 }
-            })
+            }
+            if finishers:
+                race_out["result_finishers"] = finishers
+            races_out.append(race_out)
+            ledger_recs.append(PL.race_record(yyyymmdd, track, rno, len(result_top3 or []) >= 3, pred_hit, bet_box))
 
             time.sleep(0.08)
 
         if not races_out:
             print(f"[SKIP] {track}: no races built (maybe predict json empty)")
+            man.add(MF.track_entry(T.get(track), "skipped", reason="no_races", place_code=place_code, races=0))
             continue
 
-        # ★追加：開催場ごとの全体的中を累計に反映（結果が取れてるレースのみ）
-        if track_pred_races > 0:
-            pnl_total["pred_races"] = int(pnl_total.get("pred_races", 0) or 0) + int(track_pred_races)
-            pnl_total["pred_hits"]  = int(pnl_total.get("pred_hits", 0) or 0) + int(track_pred_hits)
-
-            byp = pnl_total.get("pred_by_place", {})
-            if not isinstance(byp, dict):
-                byp = {}
-            rec = byp.get(track, {})
-            if not isinstance(rec, dict):
-                rec = {}
-            rec["races"] = int(rec.get("races", 0) or 0) + int(track_pred_races)
-            rec["hits"]  = int(rec.get("hits", 0) or 0) + int(track_pred_hits)
-            rrr = int(rec.get("races", 0) or 0)
-            hhh = int(rec.get("hits", 0) or 0)
-            rec["hit_rate"] = round((hhh / rrr) * 100.0, 1) if rrr > 0 else None
-            byp[track] = rec
-            pnl_total["pred_by_place"] = byp
-
         title = f"{yyyymmdd[0:4]}.{yyyymmdd[4:6]}.{yyyymmdd[6:8]} {track}競馬 結果"
 
         profit_sum = int(payout_sum) - int(invest_sum)
@@ -1009,6 +719,7 @@ def main():
         }
 
         out = {
+            "schema_version": SC.SCHEMA_VERSION,
             "type": "fieldnote_result",
             "date": yyyymmdd,
             "place": track,
@@ -1017,7 +728,6 @@ def main():
             "title": title,
             "races": races_out,
             "pnl_summary": pnl_summary,
-            "pnl_total": pnl_total,
             "generated_at": datetime.now().isoformat(timespec="seconds"),
             "source": {
                 "predict_json": pred_path,
@@ -1025,13 +735,40 @@ def main():
             }
         }
 
-        json_path = Path("output") / f"result_{yyyymmdd}_{place_code}.json"
-        html_path = Path("output") / f"result_{yyyymmdd}_{place_code}.html"
+        json_path = T.output_path("result", yyyymmdd, track)
+        html_path = T.output_path("result", yyyymmdd, track, "html")
+
+        # 中身（generated_at を除く）が前回と同じなら書かない
+        changed = {
+            "json": OW.write_text(json_path, SC.dumps_result_json(out)),
+            "html": OW.write_text(html_path, render_result_html(title, races_out, pnl_summary)),
+        }
+
+        note = "" if any(changed.values()) else "  unchanged"
+        print(f"[OK] {track} -> {json_path.name} / {html_path.name}  focus={focus_races} hits={hits_sum} profit={profit_sum:+,}円{note}")
+
+        wrote = PL.upsert_day(pnl, yyyymmdd, track, ledger_recs)
+        print(f"[OK] {track} pnl ledger: races={len(ledger_recs)} written={wrote}")
 
-        json_path.write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
-        html_path.write_text(render_result_html(title, races_out, pnl_summary), encoding="utf-8")
+        shadow_path = score_shadow_variants(yyyymmdd, baba, place_code, outcomes, pred_map)
+        if shadow_path:
+            print(f"[OK] {track} -> {shadow_path.name}")
 
-        print(f"[OK] {track} -> {json_path.name} / {html_path.name}  focus={focus_races} hits={hits_sum} profit={profit_sum:+,}円")
+        if jockey_store is not None and finishers_all:
+            rides = JS.update_day(jockey_store, track, yyyymmdd, finishers_all)
+            jockey_updated = True
+            print(f"[OK] {track} jockey stats: races={len(finishers_all)} rides={rides}")
+
+        if horse_store is not None and pred_path:
+            try:
+                pred_raw = json.loads(archive.read_text(pred_path))
+            except Exception as e:
+                print(f"[WARN] {track}: horse index skipped (predict json read failed: {e})")
+                pred_raw = None
+            if pred_raw:
+                runs = HI.ingest_day(horse_store, pred_raw, out)
+                horse_updated = True
+                print(f"[OK] {track} horse index: runs={runs}")
 
         # =========================
         # ★LATEST 用（追加）：この開催場で出力できた印
@@ -1044,35 +781,42 @@ def main():
             "json": str(json_path).replace("\\", "/"),
             "html": str(html_path).replace("\\", "/"),
         })
+        man.add(MF.track_entry(
+            T.get(track), "ok", json_path, html_path, place_code=place_code, races=len(races_out),
+            settled=len(outcomes), pnl=pnl_summary, changed=changed,
+        ))
 
-    # ===== 最後に累計を整形して保存 =====
-    invest = int(pnl_total.get("invest", 0) or 0)
-    payout = int(pnl_total.get("payout", 0) or 0)
-    races  = int(pnl_total.get("races", 0) or 0)
-    hits   = int(pnl_total.get("hits", 0) or 0)
-
-    pnl_total["profit"] = int(payout - invest)
-    pnl_total["roi"] = round((payout / invest) * 100.0, 1) if invest > 0 else None
-    pnl_total["hit_rate"] = round((hits / races) * 100.0, 1) if races > 0 else None
+    # 1日分（全開催場の予想＋結果＋収支）をまとめた feed_{date}.json
+    feed = FD.update(yyyymmdd) if wrote_any else None
 
-    # ★追加：全体予想（上位5で1-3着）累計の率
-    pr = int(pnl_total.get("pred_races", 0) or 0)
-    ph = int(pnl_total.get("pred_hits", 0) or 0)
-    pnl_total["pred_hit_rate"] = round((ph / pr) * 100.0, 1) if pr > 0 else None
+    man.done(tracks_ok=len(wrote_files), **({"feed": feed} if feed else {}))
+    print(f"[OK] wrote {MF.manifest_path(yyyymmdd).as_posix()} (tracks={len(man.tracks)})")
 
-    pnl_total["last_updated"] = datetime.now().isoformat(timespec="seconds")
-
-    save_pnl_total(PNL_FILE, pnl_total)
+    # ===== 最後に累計（台帳からの集計）を保存 =====
+    PL.save_snapshot(pnl)
     print(f"[OK] wrote {PNL_FILE}")
 
+    if jockey_updated:
+        JS.save_store(jockey_store)
+        print(f"[OK] wrote {JS.JOCKEY_STATS_FILE}")
+    if horse_updated:
+        HI.save_store(horse_store)
+        print(f"[OK] wrote {HI.HORSE_INDEX_FILE}")
+    if HISTORY_STORE_ENABLE and wrote_files:
+        HS.update_after_write([w["json"] for w in wrote_files])
+        print(f"[OK] {HS.HISTORY_DB} updated (result files={len(wrote_files)})")
+
     # =========================
     # ★LATEST 地方結果（追加）
     # - その日に1つでも result を書けた時だけ更新
     # =========================
     if wrote_any:
         latest_path = Path("output/latest_local_result.json")
+        latest = {"date": yyyymmdd}
+        if feed:
+            latest.update(feed=feed["json"], etag=feed["etag"])
         latest_path.write_text(
-            json.dumps({"date": yyyymmdd}, ensure_ascii=False),
+            json.dumps(latest, ensure_ascii=False),
             encoding="utf-8"
         )
         print(f"[OK] wrote {latest_path.as_posix()} ({yyyymmdd})")
@@ -0,0 +1,205 @@
+# schema.py  (fieldnote-lab-bot)
+# 目的：
+# - predict / result JSON に schema_version を持たせる（今の形 = SCHEMA_VERSION。無いものは 0 = 旧形式）
+#   ・今の版のファイルは読む側が別名キーを探したり型を直したりしない（そのまま使う）
+#   ・旧版・不明な版だけ upgrade_* を通す（遅い互換経路はここ1か所）
+# - 書き出しの整形（predict の "field" を1行に詰める等）もここ。移行で書き直しても同じ見た目になる
+#
+# 今の形（版 1）：
+#   predict: {"schema_version", "date", "place", ..., "predictions": [{"race_no": int, "race_name": str,
+#             "picks": [{"mark", "umaban": int, "name", "score": float, "sp", "base_index", "jockey",
+#                        "jockey_add", "source", "z"?}], "konsen": {...}, "field"?, "prob"?}]}
+#   result : {"schema_version", ..., "races": [{"race_no", "pred_top5": [pick], "result_top3", "bet_box", ...}]}
+#
+# 使い方：
+#   python schema.py                  # 旧版のファイルを数えるだけ（dry run）
+#   MIGRATE_APPLY=1 python schema.py  # output/ と output/archive/*.zip の旧版をその場で今の版に書き換える
+
+import os, json
+from pathlib import Path
+
+import archive
+
+SCHEMA_VERSION = 1
+KINDS = ("predict", "result")
+MARKS5 = ["◎", "〇", "▲", "△", "☆"]
+
+OUTPUT_DIR = os.environ.get("OUTPUT_DIR", "output")
+MIGRATE_APPLY = os.environ.get("MIGRATE_APPLY", "").strip() == "1"
+
+
+def is_current(d) -> bool:
+    return isinstance(d, dict) and d.get("schema_version") == SCHEMA_VERSION
+
+def kind_of_name(name: str):
+    for k in KINDS:
+        if name.startswith(f"{k}_") and name.endswith(".json"):
+            return k
+    return None
+
+
+# =========================
+# 書き出し
+# =========================
+def dumps_predict_json(out: dict) -> str:
+    """indent=2 で書きつつ、"field" の配列だけは1行に詰める（1レース数百バイトに収める）"""
+    compact = {}
+    for i, race in enumerate(out.get("predictions") or []):
+        if isinstance(race.get("field"), dict):
+            token = f"@@FIELD_{i}@@"
+            compact[token] = json.dumps(race["field"], ensure_ascii=False, separators=(",", ":"))
+            race["field"] = token
+    try:
+        text = json.dumps(out, ensure_ascii=False, indent=2)
+    finally:
+        for i, race in enumerate(out.get("predictions") or []):
+            token = f"@@FIELD_{i}@@"
+            if race.get("field") == token:
+                race["field"] = json.loads(compact[token])
+    for token, js in compact.items():
+        text = text.replace(f'"{token}"', js, 1)
+    return text
+
+def dumps_result_json(out: dict) -> str:
+    return json.dumps(out, ensure_ascii=False, indent=2)
+
+def dumps(kind: str, d: dict) -> str:
+    return dumps_predict_json(d) if kind == "predict" else dumps_result_json(d)
+
+
+# =========================
+# 旧版 -> 今の版（互換経路）
+# =========================
+def _upgrade_pick(p, i: int, legacy: bool):
+    """別名キーを探して型をそろえる。使えない印は None"""
+    if not isinstance(p, dict):
+        return None
+    umaban = p.get("umaban") or p.get("umaban_no") or p.get("horse_no") or p.get("num")
+    if legacy:
+        score = p.get("score") if "score" in p else (p.get("sp") or p.get("index"))
+    else:
+        score = p.get("score")
+    try:
+        umaban, score = int(umaban), float(score)
+    except Exception:
+        return None
+    # 元のキーの並びはそのまま（書き直しても差分が型の直しだけになるように）
+    out = {k: v for k, v in p.items() if k not in ("umaban_no", "horse_no", "num", "horse_name", "index")}
+    out.update({
+        "mark": str(p.get("mark") or (MARKS5[i] if i < len(MARKS5) else "—")),
+        "umaban": umaban,
+        "name": str(p.get("name") or p.get("horse_name") or ""),
+        "score": score,
+    })
+    for k, default in (("sp", None), ("base_index", None), ("jockey", ""), ("jockey_add", 0.0), ("source", {})):
+        out.setdefault(k, default)
+    return out
+
+def _upgrade_race(r, picks_key: str, legacy: bool):
+    if not isinstance(r, dict):
+        return None
+    try:
+        rno = int(r.get("race_no") or r.get("raceNo") or r.get("no"))
+    except Exception:
+        return None
+    src = r.get(picks_key)
+    if legacy and not src:
+        src = r.get("pred_top5") or r.get("top5") or r.get("predict_top5")
+    picks = []
+    for i, p in enumerate((src if isinstance(src, list) else [])[:5]):
+        q = _upgrade_pick(p, i, legacy)
+        if q is not None:
+            picks.append(q)
+    out = {k: v for k, v in r.items() if k not in ("raceNo", "no", "name", "top5", "predict_top5")}
+    out.update({
+        "race_no": rno,
+        "race_name": str(r.get("race_name") or r.get("name") or ""),
+        picks_key: picks,
+        "konsen": r.get("konsen") if isinstance(r.get("konsen"), dict) else {},
+    })
+    if legacy:
+        out.pop("pred_top5" if picks_key == "picks" else "picks", None)
+    return out
+
+def upgrade_predict(d: dict) -> dict:
+    """predict JSON（どの版でも）-> 今の版"""
+    if is_current(d):
+        return d
+    preds = d.get("predictions")
+    legacy = not isinstance(preds, list)
+    if legacy:
+        preds = d.get("races") or d.get("RACES") or []
+    races = [x for x in (_upgrade_race(r, "picks", legacy) for r in (preds if isinstance(preds, list) else [])) if x]
+    out = {"schema_version": SCHEMA_VERSION}
+    out.update({k: v for k, v in d.items() if k not in ("schema_version", "races", "RACES")})
+    out["predictions"] = races
+    return out
+
+def upgrade_result(d: dict) -> dict:
+    """result JSON（どの版でも）-> 今の版"""
+    if is_current(d):
+        return d
+    races = [x for x in (_upgrade_race(r, "pred_top5", False) for r in d.get("races") or []) if x]
+    out = {"schema_version": SCHEMA_VERSION}
+    out.update(d)
+    out["schema_version"] = SCHEMA_VERSION
+    out["races"] = races
+    return out
+
+def upgrade(kind: str, d: dict) -> dict:
+    return upgrade_predict(d) if kind == "predict" else upgrade_result(d)
+
+
+# =========================
+# 移行（一度だけ。何度流しても同じ）
+# =========================
+def _migrate_bytes(name: str, raw: bytes):
+    """return: 書き換え後の bytes（今の版なら None）"""
+    kind = kind_of_name(name)
+    if not kind:
+        return None
+    d = json.loads(raw.decode("utf-8"))
+    if not isinstance(d, dict) or is_current(d):
+        return None
+    text = dumps(kind, upgrade(kind, d))
+    # 末尾の改行は元のまま（古い書き出しの一部は改行つき）
+    return (text + ("\n" if raw.endswith(b"\n") else "")).encode("utf-8")
+
+def migrate(out_dir: str = None, apply: bool = False) -> dict:
+    out_dir = out_dir or OUTPUT_DIR
+    st = {"files": 0, "upgraded": 0, "bundles": 0}
+    for p in sorted(Path(out_dir).glob("*.json")):
+        new = _migrate_bytes(p.name, p.read_bytes())
+        st["files"] += int(kind_of_name(p.name) is not None)
+        if new is None:
+            continue
+        st["upgraded"] += 1
+        if apply:
+            tmp = p.with_name(p.name + ".tmp")
+            tmp.write_bytes(new)
+            os.replace(tmp, p)
+
+    ad = archive.archive_dir(out_dir)
+    for zp in sorted(ad.glob("*.zip")) if ad.is_dir() else []:
+        changed = {}
+        for name in archive.member_names(zp):
+            new = _migrate_bytes(name, archive.read_member(zp, name))
+            st["files"] += int(kind_of_name(name) is not None)
+            if new is not None:
+                changed[name] = new
+        st["upgraded"] += len(changed)
+        if changed and apply:
+            archive.replace_members(zp, changed)
+            st["bundles"] += 1
+    return st
+
+
+def main():
+    st = migrate(apply=MIGRATE_APPLY)
+    if MIGRATE_APPLY:
+        print(f"[OK] schema v{SCHEMA_VERSION}: files={st['files']} upgraded={st['upgraded']} bundles rewritten={st['bundles']}")
+    else:
+        print(f"[INFO] dry run: files={st['files']} to upgrade={st['upgraded']} (MIGRATE_APPLY=1 to apply)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# sp_model.py  (fieldnote-lab-bot)
+# 目的：
+# - 開催場ごとに「SP ≒ a × KB(NAR平均指数) + b」を履歴からプールして当てはめ、output/sp_model.json に保存
+# - predict はこれをレース内の回帰とブレンドして、SP 欠損馬を O(1) で推定する（predict_all_today.SpPool）
+#
+# データ：
+# - predict JSON の field（全頭の sp_raw / base_index。欠損は null）→ 観測ペアをそのまま使う
+# - field が無い古いファイル → 上位5頭の sp / base_index のうち「SP が小数1桁」のものを観測値とみなす
+#   （推定値は長い小数になるため。クランプ端に当たった推定値だけは紛れ込むので近似）
+# - 距離別は未対応（predict JSON に距離が残っていない）
+#
+# 当てはめ：
+# - 傾き a：レース内で中心化したペア（レース平均との差）から求める → クラス差（レースの水準）に引っ張られない
+# - 切片 b：全ペアの平均から / lo・hi：SP の 1% / 99% 分位点（推定値のクランプ）
+# - k（事前の強さ）：日付で前後に分け、後ろ側で観測 SP を1頭ずつ隠して推定 → 誤差が最小の k を採用
+#
+# 使い方：
+#   python sp_model.py                      # output/ の履歴全部から作る
+#   DATE_TO=20260630 python sp_model.py     # 期間を区切る（未来の情報を混ぜない検証用）
+
+import os, json
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+import predict_all_today as P
+import history
+
+SP_MODEL_OUT = os.environ.get("SP_MODEL_OUT", P.SP_MODEL_FILE)
+SP_MODEL_MIN_RACES = int(os.environ.get("SP_MODEL_MIN_RACES", "30"))   # 傾きに使えるレース数がこれ未満の場は作らない
+SP_MODEL_LEGACY = os.environ.get("SP_MODEL_LEGACY", "1").strip() != "0"  # field なしの古いファイルも使う
+SP_MODEL_K_GRID = [float(x) for x in os.environ.get("SP_MODEL_K_GRID", "0,1,2,3,5,8,13,21").split(",") if x.strip()]
+SP_MODEL_HOLDOUT = float(os.environ.get("SP_MODEL_HOLDOUT", "0.2"))      # 後ろ何割の日付で k を選ぶか
+DATE_FROM = os.environ.get("DATE_FROM", "").strip() or None
+DATE_TO = os.environ.get("DATE_TO", "").strip() or None
+
+
+# =========================
+# 履歴 → レースごとの (kb, sp) 列
+# =========================
+def _looks_observed(sp) -> bool:
+    # 吉馬の SP は小数1桁。推定値は長い小数になる
+    return isinstance(sp, (int, float)) and abs(sp * 10.0 - round(sp * 10.0)) < 1e-6
+
+def races_from_predict(pred: dict):
+    """
+    return: list[(kb_list, sp_list)]  sp の None = 欠損（field がある場合）/ 観測値とみなせない（古いファイル）
+    """
+    out = []
+    for r in pred.get("predictions") or []:
+        f = r.get("field")
+        if isinstance(f, dict):
+            out.append((list(f.get("base_index") or []), list(f.get("sp_raw") or [])))
+            continue
+        if not SP_MODEL_LEGACY:
+            continue
+        kb, sp = [], []
+        for p in r.get("picks") or []:
+            kb.append(p.get("base_index"))
+            v = p.get("sp")
+            sp.append(float(v) if _looks_observed(v) else None)
+        out.append((kb, sp))
+    return out
+
+def collect(out_dir=history.OUTPUT_DIR, date_from=None, date_to=None):
+    """return: 開催場名 -> list[(date, kb_list, sp_list)]"""
+    by_place = {}
+    for path in history.predict_files(out_dir, date_from, date_to):
+        pred = history._read_json(path)
+        if not isinstance(pred, dict) or not pred.get("place"):
+            continue
+        date = str(pred.get("date") or "")
+        for kb, sp in races_from_predict(pred):
+            by_place.setdefault(pred["place"], []).append((date, kb, sp))
+    return by_place
+
+def _pairs(kb, sp):
+    return [(float(x), float(y)) for x, y in zip(kb, sp) if x is not None and y is not None]
+
+
+# =========================
+# 当てはめ
+# =========================
+def fit_track(races):
+    """races: list[(date, kb_list, sp_list)] -> dict or None"""
+    xs, ys, dxs, dys = [], [], [], []
+    n_races = 0
+    for _, kb, sp in races:
+        pr = _pairs(kb, sp)
+        xs += [x for x, _ in pr]
+        ys += [y for _, y in pr]
+        if len(pr) < 2:
+            continue
+        mx = sum(x for x, _ in pr) / len(pr)
+        my = sum(y for _, y in pr) / len(pr)
+        dxs += [x - mx for x, _ in pr]
+        dys += [y - my for _, y in pr]
+        n_races += 1
+
+    if n_races < SP_MODEL_MIN_RACES:
+        return None
+
+    dx, dy = np.asarray(dxs), np.asarray(dys)
+    sxx = float(np.dot(dx, dx))
+    if sxx <= 1e-9:
+        return None
+    a = float(np.dot(dx, dy)) / sxx
+    x, y = np.asarray(xs), np.asarray(ys)
+    b = float(y.mean() - a * x.mean())
+    resid = dy - a * dx
+    return {
+        "a": round(a, 6),
+        "b": round(b, 4),
+        "lo": round(float(np.percentile(y, 1)), 1),
+        "hi": round(float(np.percentile(y, 99)), 1),
+        "n_pairs": int(len(xs)),
+        "n_races": int(n_races),
+        "resid_sd": round(float(np.sqrt(np.mean(resid ** 2))), 4),
+    }
+
+
+# =========================
+# k の選択（観測 SP を1頭ずつ隠して、predict と同じ推定器で当てる）
+# =========================
+def holdout_errors(races, pool):
+    """return: 絶対誤差の list（pool=None ならレース内推定だけ）"""
+    errs = []
+    for _, kb, sp in races:
+        obs = [j for j, (x, y) in enumerate(zip(kb, sp)) if x is not None and y is not None]
+        if len(obs) < 2:
+            continue
+        for j in obs:
+            rows = [P.Runner(umaban=i + 1, name="", base_index=x, sp_raw=(None if i == j else y))
+                    for i, (x, y) in enumerate(zip(kb, sp))]
+            est, _ = P.estimate_sp_factory(rows, sp_pool=pool)
+            errs.append(abs(est(float(kb[j])) - float(sp[j])))
+    return errs
+
+def _split(races, frac):
+    dates = sorted({d for d, _, _ in races})
+    if len(dates) < 2 or frac <= 0:
+        return races, []
+    cut = dates[min(len(dates) - 1, max(1, int(len(dates) * (1.0 - frac))))]
+    return [r for r in races if r[0] < cut], [r for r in races if r[0] >= cut]
+
+def choose_k(by_place):
+    """
+    日付で前後に分けて、前側で当てはめ → 後ろ側で k ごとの誤差を測る（全開催場合算で1つの k）
+    return: (best_k, report)
+    """
+    tot = {k: [] for k in SP_MODEL_K_GRID}
+    base = []
+    for place, races in by_place.items():
+        train, test = _split(races, SP_MODEL_HOLDOUT)
+        m = fit_track(train)
+        if not m or not test:
+            continue
+        base += holdout_errors(test, None)
+        for k in SP_MODEL_K_GRID:
+            pool = P.SpPool(a=m["a"], b=m["b"], lo=m["lo"], hi=m["hi"], k=k)
+            tot[k] += holdout_errors(test, pool)
+
+    report = {"n": len(base), "mae_in_race": round(float(np.mean(base)), 4) if base else None, "mae_by_k": {}}
+    best_k, best = 5.0, None
+    for k, errs in tot.items():
+        if not errs:
+            continue
+        mae = float(np.mean(errs))
+        report["mae_by_k"][str(k)] = round(mae, 4)
+        if best is None or mae < best:
+            best_k, best = k, mae
+    return best_k, report
+
+
+def main():
+    t0 = datetime.now()
+    by_place = collect(date_from=DATE_FROM, date_to=DATE_TO)
+    n_races = sum(len(v) for v in by_place.values())
+    print(f"[INFO] races={n_races} tracks={len(by_place)} legacy={SP_MODEL_LEGACY}")
+    if not by_place:
+        raise SystemExit("[FATAL] no predict history")
+
+    best_k, report = choose_k(by_place)
+    print(f"[INFO] holdout n={report['n']} mae_in_race={report['mae_in_race']} mae_by_k={report['mae_by_k']} -> k={best_k}")
+
+    tracks = {}
+    for place in sorted(by_place):
+        m = fit_track(by_place[place])
+        if not m:
+            print(f"[SKIP] {place}: not enough races with SP pairs")
+            continue
+        m["k"] = best_k
+        tracks[place] = m
+        print(f"[OK] {place:4s} SP = {m['a']:.4f} * KB + {m['b']:.2f}  clamp=[{m['lo']}, {m['hi']}]  "
+              f"pairs={m['n_pairs']} races={m['n_races']} resid_sd={m['resid_sd']}")
+
+    out = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "date_from": DATE_FROM,
+        "date_to": DATE_TO,
+        "k": best_k,
+        "holdout": report,
+        "tracks": tracks,
+    }
+    Path(SP_MODEL_OUT).parent.mkdir(parents=True, exist_ok=True)
+    Path(SP_MODEL_OUT).write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"[OK] wrote {SP_MODEL_OUT}  tracks={len(tracks)}  ({(datetime.now() - t0).total_seconds():.1f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# tracks.py  (fieldnote-lab-bot)
+# 目的：
+# - 開催場の台帳を1か所に（predict / result / wp_post / 分析スクリプトで共有）
+#   ・baba       ：keiba.go.jp の k_babaCode（= nar.k-ba.net の track code）。開催判定・取得 URL に使う
+#   ・keibablood ：keibablood の開催場コード（result JSON の place_code。昔は result のファイル名にも使っていた）
+#   ・slug       ：WordPress の投稿スラッグ用
+#   ・kaisekisya ：騎手成績ページ
+# - 出力ファイル名は1つの規則だけ：output/{kind}_{yyyymmdd}_{baba}.{ext}
+#   （predict / result / shadow / shadow_result 全部 baba。以前の result は keibablood コードだったので
+#     migrate_filenames.py で一度だけ付け替える。水沢(keibablood 36) と 門別(baba 36) がぶつかるので
+#     旧ファイルは JSON の "place" で開催場を決める）
+# - パスは組み立てるだけ（glob で探さない）
+
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass(frozen=True, slots=True)
+class Track:
+    name: str
+    baba: int
+    keibablood: str
+    slug: str
+    kaisekisya: str
+
+    @property
+    def code(self) -> str:
+        """出力ファイル名のコード"""
+        return str(self.baba)
+
+
+_KAISEKISYA = "https://www.kaisekisya.net/local/jockey/{}.html"
+
+# 帯広（ばんえい, baba 3）は対象外
+TRACKS = (
+    Track("門別", 36, "30", "monbetsu", _KAISEKISYA.format("monbetsu")),
+    Track("盛岡", 10, "35", "morioka", _KAISEKISYA.format("morioka")),
+    Track("水沢", 11, "36", "mizusawa", _KAISEKISYA.format("mizusawa")),
+    Track("浦和", 18, "42", "urawa", _KAISEKISYA.format("urawa")),
+    Track("船橋", 19, "43", "funabashi", _KAISEKISYA.format("funabashi")),
+    Track("大井", 20, "44", "ooi", _KAISEKISYA.format("ooi")),
+    Track("川崎", 21, "45", "kawasaki", _KAISEKISYA.format("kawasaki")),
+    Track("金沢", 22, "46", "kanazawa", _KAISEKISYA.format("kanazawa")),
+    Track("笠松", 23, "47", "kasamatsu", _KAISEKISYA.format("kasamatsu")),
+    Track("名古屋", 24, "48", "nagoya", _KAISEKISYA.format("nagoya")),
+    Track("園田", 27, "50", "sonoda", _KAISEKISYA.format("sonoda")),
+    Track("姫路", 28, "51", "himeji", _KAISEKISYA.format("himeji")),
+    Track("高知", 31, "54", "kochi", _KAISEKISYA.format("kochi")),
+    Track("佐賀", 32, "55", "saga", _KAISEKISYA.format("saga")),
+)
+EXCLUDE_BABA = {3}  # 帯広ばんえい
+
+BY_NAME = {t.name: t for t in TRACKS}
+BY_BABA = {t.baba: t for t in TRACKS}
+
+# 旧来の dict（各スクリプトの BABA_CODE / KEIBABLOOD_CODE / KAISEKISYA_JOCKEY_URL / TRACK_SLUG）
+BABA_CODE = {t.name: t.baba for t in TRACKS}
+KEIBABLOOD_CODE = {t.name: t.keibablood for t in TRACKS}
+KAISEKISYA_JOCKEY_URL = {t.name: t.kaisekisya for t in TRACKS}
+TRACK_SLUG = {t.name: t.slug for t in TRACKS}
+
+
+def get(name: str):
+    """開催場名 -> Track（無ければ None）"""
+    return BY_NAME.get(str(name or "").strip())
+
+def output_path(kind: str, yyyymmdd: str, track, ext: str = "json", out_dir: str = "output") -> Path:
+    """
+    kind: predict / result / shadow / shadow_result
+    track: Track / 開催場名 / baba コード
+    """
+    if isinstance(track, Track):
+        t = track
+    elif isinstance(track, int) or str(track).isdigit():
+        t = BY_BABA.get(int(track))
+    else:
+        t = get(track)
+    if t is None:
+        raise KeyError(f"unknown track: {track!r}")
+    return Path(out_dir) / f"{kind}_{yyyymmdd}_{t.code}.{ext}"
@@ -0,0 +1,299 @@
+# train_weights.py  (fieldnote-lab-bot)
+# 目的：
+# - 合成指数の重み（SP_W / KB_W / JOCKEY_W）を、グリッドではなく着順から直接当てはめる
+#   ・モデル：条件付きロジット（着順を 1着 → 2着 → 3着 と順に選ぶ exploded logit = Plackett–Luce）
+#       効用 u_i = β_sp·z_sp_i + β_kb·z_kb_i + β_j·z_jockey_i（z はレース内で標準化済みの特徴量）
+#   ・最適化：ニュートン法（勾配とヘッセ行列を (R, N, 3) の配列で一度に計算。3変数なので数回で収束）
+# - 日付で前後に分けて（開催場ごとに後ろ側を検証）、学習 / 検証の対数尤度と的中率を出す
+# - 出力：output/weights_profile.json（全体 "*" ＋ 開催場別）→ predict は WEIGHTS_PROFILE で読む
+#
+# 重みへの換算：
+# - score = BASE + SCALE × (w·z) / Σ|w| なので、PL で見ると β = SCALE × w / (Σ|w| × T)
+#   → 向き（w の比）は β の比、温度は T = SCALE / Σ|β|（plackett_luce.py の T と同じ意味）
+# - 表示は SP_W = 1.0 にそろえる（SP の係数が正でない時は Σ|w| = 1 にそろえる）
+#
+# データ：
+# - predict に全頭ブロック field があるレース → 全頭を再計算した z（exact）
+# - field が無い古いレース → 上位5頭の picks の z だけ（5頭の中での相対順位。plackett_luce.py と同じ扱い）
+#
+# 使い方：
+#   python train_weights.py                      # 学習して output/weights_profile.json へ
+#   TRAIN_HOLDOUT=0.2 python train_weights.py    # 後ろ2割の日付で検証
+#   WEIGHTS_PROFILE=output/weights_profile.json python predict_all_today.py   # 本番で使う
+
+import os, json
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+import predict_all_today as P
+import batch_scoring as B
+import history
+
+TRAIN_OUT = os.environ.get("TRAIN_OUT", "output/weights_profile.json")
+TRAIN_HOLDOUT = float(os.environ.get("TRAIN_HOLDOUT", "0.3"))        # 開催場ごとに後ろ何割の日付を検証に回すか
+TRAIN_MIN_RACES = int(os.environ.get("TRAIN_MIN_RACES", "300"))      # 開催場別の重みを作る最低レース数（学習側）
+TRAIN_L2 = float(os.environ.get("TRAIN_L2", "0.001"))                # β の L2（1レースあたり）
+TRAIN_ITERS = int(os.environ.get("TRAIN_ITERS", "50"))
+TRAIN_TOP = int(os.environ.get("TRAIN_TOP", "3"))                    # 何着までの順序を使うか
+DATE_FROM = os.environ.get("DATE_FROM", "").strip() or None
+DATE_TO = os.environ.get("DATE_TO", "").strip() or None
+
+
+# =========================
+# 履歴 → (X, M, O)
+# =========================
+def build_data(races, top=TRAIN_TOP):
+    """
+    return: dict
+      X (R, N, 3) 特徴量 / M (R, N) 有効枠 / O (R, top) 着順の位置（-1 = 観測なし）
+      place / date (R,) / exact (R,) 全頭か
+    """
+    exact = [h for h in races if h.field]
+    legacy = [h for h in races if not h.field and len(h.pick_umaban) >= 5 and len(h.pick_z) >= 5]
+    N = max([len(h.field.get("umaban") or []) for h in exact] + [5])
+    R = len(exact) + len(legacy)
+    X = np.zeros((R, N, 3))
+    M = np.zeros((R, N), dtype=bool)
+    O = np.full((R, top), -1, dtype=np.int16)
+
+    if exact:
+        rows = [P.runners_from_field(h.field) for h in exact]
+        pools = [P.SpPool(**h.sp_pool) if h.sp_pool else None for h in exact]
+        feat = B.prepare_batch(rows, norm_method=P.SCORING.norm_method, pools=pools)
+        n0 = feat["mask"].shape[1]
+        X[:len(exact), :n0, 0] = feat["z_sp"]
+        X[:len(exact), :n0, 1] = feat["z_kb"]
+        X[:len(exact), :n0, 2] = feat["z_j"]
+        M[:len(exact), :n0] = feat["mask"]
+    for i, h in enumerate(exact):
+        pos = {int(u): j for j, u in enumerate(h.field.get("umaban") or [])}
+        for t, u in enumerate(h.top3[:top]):
+            if int(u) not in pos:
+                break
+            O[i, t] = pos[int(u)]
+
+    for k, h in enumerate(legacy):
+        i = len(exact) + k
+        X[i, :5] = np.asarray(h.pick_z[:5], dtype=np.float64)
+        M[i, :5] = True
+        pos = {int(u): j for j, u in enumerate(h.pick_umaban[:5])}
+        t = 0
+        for u in h.top3[:top]:
+            if int(u) in pos:   # 5頭に入らなかった馬は「5頭の後ろ」なので飛ばして詰める
+                O[i, t] = pos[int(u)]
+                t += 1
+
+    hs = exact + legacy
+    return {
+        "X": X, "M": M, "O": O,
+        "place": np.asarray([h.place for h in hs]),
+        "date": np.asarray([h.date for h in hs]),
+        "exact": np.arange(R) < len(exact),
+    }
+
+def subset(D, sel):
+    return {k: v[sel] for k, v in D.items()}
+
+def split_by_track(D, frac):
+    """開催場ごとに日付で前後に分ける -> (train の bool, test の bool)"""
+    test = np.zeros(len(D["date"]), dtype=bool)
+    if frac > 0:
+        for place in set(D["place"].tolist()):
+            sel = D["place"] == place
+            dates = sorted(set(D["date"][sel].tolist()))
+            if len(dates) < 2:
+                continue
+            cut = dates[min(len(dates) - 1, max(1, int(len(dates) * (1.0 - frac))))]
+            test |= sel & (D["date"] >= cut)
+    return ~test, test
+
+
+# =========================
+# 条件付きロジット（exploded）
+# =========================
+def nll_grad_hess(beta, X, M, O):
+    """return: (負の対数尤度の合計, 勾配 (3,), ヘッセ行列 (3,3))"""
+    R, N, K = X.shape
+    u = X @ beta                                           # (R, N)
+    u = np.where(M, u, -np.inf)
+    avail = M.copy()
+    rows = np.arange(R)
+    nll, g, H = 0.0, np.zeros(K), np.zeros((K, K))
+    for t in range(O.shape[1]):
+        o = O[:, t]
+        ok = o >= 0
+        if not ok.any():
+            break
+        uu = np.where(avail, u, -np.inf)
+        mx = np.max(uu, axis=1, keepdims=True, initial=-np.inf)
+        mx = np.where(np.isfinite(mx), mx, 0.0)
+        e = np.where(avail, np.exp(uu - mx), 0.0)
+        tot = e.sum(axis=1, keepdims=True)
+        p = e / np.where(tot > 0, tot, 1.0)                # (R, N)
+        oo = np.where(ok, o, 0)
+        lse = (np.log(np.where(tot > 0, tot, 1.0)) + mx)[:, 0]
+        nll += float(np.sum(np.where(ok, lse - u[rows, oo], 0.0)))
+
+        ex = np.einsum("rn,rnk->rk", p, X)                 # E_p[x]
+        xo = X[rows, oo]                                    # 選ばれた馬の x
+        w = ok[:, None]
+        g += np.sum(np.where(w, ex - xo, 0.0), axis=0)
+        exx = np.einsum("rn,rnk,rnl->rkl", p, X, X)
+        cov = exx - ex[:, :, None] * ex[:, None, :]
+        H += np.sum(np.where(ok[:, None, None], cov, 0.0), axis=0)
+
+        avail[rows[ok], oo[ok]] = False                    # 選ばれた馬は次の着から外す
+    return nll, g, H
+
+def fit_beta(X, M, O, l2=TRAIN_L2, iters=TRAIN_ITERS, beta0=None):
+    """ニュートン法（ステップ半減つき）。return: (β, 1レースあたり NLL)"""
+    R = max(1, X.shape[0])
+    lam = l2 * R
+    beta = np.zeros(X.shape[2]) if beta0 is None else np.asarray(beta0, dtype=np.float64).copy()
+
+    def obj(b):
+        f, g, H = nll_grad_hess(b, X, M, O)
+        return f + 0.5 * lam * float(b @ b), g + lam * b, H + lam * np.eye(len(b))
+
+    f, g, H = obj(beta)
+    for _ in range(iters):
+        step = np.linalg.solve(H, g)
+        s = 1.0
+        while s > 1e-4:
+            nb = beta - s * step
+            nf, ng, nH = obj(nb)
+            if nf <= f + 1e-12:
+                break
+            s *= 0.5
+        if s <= 1e-4:
+            break
+        beta, f, g, H = nb, nf, ng, nH
+        if float(np.max(np.abs(s * step))) < 1e-8:
+            break
+    return beta, nll_grad_hess(beta, X, M, O)[0] / R
+
+def fit_scale(direction, X, M, O, iters=TRAIN_ITERS):
+    """向き（今の重み）を固定して、強さ（= 温度）だけ当てる → 比較用の基準"""
+    d = np.asarray(direction, dtype=np.float64)
+    Z = (X @ d)[:, :, None]
+    c, _ = fit_beta(Z, M, O, l2=0.0, iters=iters)
+    return c[0] * d
+
+
+# =========================
+# 診断
+# =========================
+def diagnostics(beta, D):
+    """
+    NLL/レース・1着的中（効用1位が枠内で最先着。全頭レースなら = 1着）
+    BOX5的中（全頭レースのみ：効用上位5頭に1-3着が全部）
+    """
+    X, M, O = D["X"], D["M"], D["O"]
+    R = X.shape[0]
+    if R == 0:
+        return {"races": 0}
+    nll = nll_grad_hess(beta, X, M, O)[0] / R
+    u = np.where(M, X @ beta, -np.inf)
+    order = np.argsort(-u, axis=1, kind="stable")
+    has1 = O[:, 0] >= 0
+    win_hit = (order[:, 0] == O[:, 0]) & has1
+    out = {
+        "races": int(R),
+        "nll": round(float(nll), 4),
+        "win_hit_rate": round(100.0 * float(win_hit.sum()) / max(1, int(has1.sum())), 1),
+    }
+    ex = D["exact"] & (O[:, :3] >= 0).all(axis=1)
+    if ex.any():
+        top5 = order[ex, :5]
+        hit = np.all([(top5 == O[ex, t][:, None]).any(axis=1) for t in range(3)], axis=0)
+        out["box5_hit_rate"] = round(100.0 * float(hit.mean()), 1)
+        out["box5_races"] = int(ex.sum())
+    return out
+
+def beta_to_weights(beta):
+    b = np.asarray(beta, dtype=np.float64)
+    s = float(np.sum(np.abs(b)))
+    if s <= 1e-12:
+        return {"SP_W": 1.0, "KB_W": 0.0, "JOCKEY_W": 0.0}, None
+    w = b / b[0] if b[0] > 1e-9 else b / s
+    temp = P.SCORING.score_scale / s
+    return {"SP_W": round(float(w[0]), 4), "KB_W": round(float(w[1]), 4), "JOCKEY_W": round(float(w[2]), 4)}, round(temp, 4)
+
+def current_direction():
+    w = np.array([P.SCORING.sp_w, P.SCORING.kb_w, P.SCORING.jockey_w], dtype=np.float64)
+    s = float(np.sum(np.abs(w)))
+    return w / (s if s > 0 else 1.0)
+
+
+def fit_one(label, train, test):
+    beta, _ = fit_beta(train["X"], train["M"], train["O"])
+    base = fit_scale(current_direction(), train["X"], train["M"], train["O"])
+    weights, temp = beta_to_weights(beta)
+    rec = {
+        "weights": weights,
+        "temp": temp,
+        "beta": [round(float(x), 6) for x in beta],
+        "train": diagnostics(beta, train),
+        "test": diagnostics(beta, test),
+        "current_train": diagnostics(base, train),
+        "current_test": diagnostics(base, test),
+    }
+    tr, te, ct = rec["train"], rec["test"], rec["current_test"]
+    print(f"[OK] {label:4s} SP_W={weights['SP_W']} KB_W={weights['KB_W']} JOCKEY_W={weights['JOCKEY_W']} T={temp}  "
+          f"train n={tr['races']} nll={tr.get('nll')}  test n={te['races']} nll={te.get('nll')} "
+          f"win={te.get('win_hit_rate')}%  (current: nll={ct.get('nll')} win={ct.get('win_hit_rate')}%)")
+    return rec
+
+
+def main():
+    t0 = datetime.now()
+    races = history.load_history(date_from=DATE_FROM, date_to=DATE_TO)
+    D = build_data(races)
+    R = len(D["date"])
+    print(f"[INFO] races={R} exact={int(D['exact'].sum())} legacy(top5)={int((~D['exact']).sum())}")
+    if R == 0:
+        raise SystemExit("[FATAL] no history")
+    if not D["exact"].any():
+        print("[WARN] no full-field races yet: fitting on top-5 picks only (box5 hit rate not available)")
+
+    is_train, is_test = split_by_track(D, TRAIN_HOLDOUT)
+    out_all = fit_one("*", subset(D, is_train), subset(D, is_test))
+
+    tracks = {}
+    for place in sorted(set(D["place"].tolist())):
+        sel = D["place"] == place
+        n_train = int((sel & is_train).sum())
+        if n_train < TRAIN_MIN_RACES:
+            print(f"[SKIP] {place}: train races={n_train} < {TRAIN_MIN_RACES}")
+            continue
+        rec = fit_one(place, subset(D, sel & is_train), subset(D, sel & is_test))
+        # 検証側で全体の重みより悪ければ開催場別は作らない（全体にまかせる）
+        glob = diagnostics(np.asarray(out_all["beta"]), subset(D, sel & is_test))
+        rec["global_test"] = glob
+        if rec["test"].get("nll") is not None and glob.get("nll") is not None and rec["test"]["nll"] > glob["nll"]:
+            print(f"[SKIP] {place}: track weights worse than global on test ({rec['test']['nll']} > {glob['nll']})")
+            continue
+        tracks[place] = rec
+
+    out = {
+        "type": "fieldnote_weights_profile",
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "date_from": DATE_FROM,
+        "date_to": DATE_TO,
+        "model": "exploded_logit",
+        "top": TRAIN_TOP,
+        "l2": TRAIN_L2,
+        "holdout": TRAIN_HOLDOUT,
+        "norm_method": P.SCORING.norm_method,
+        "races": R,
+        "races_exact": int(D["exact"].sum()),
+        "profiles": {"*": out_all, **tracks},
+    }
+    Path(TRAIN_OUT).parent.mkdir(parents=True, exist_ok=True)
+    Path(TRAIN_OUT).write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"[OK] wrote {TRAIN_OUT}  profiles={1 + len(tracks)}  ({(datetime.now() - t0).total_seconds():.1f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
-import os, json, glob, re
+import os, json, re
 import requests
 
+import tracks as T
+import manifest as MF
+
 WP_BASE = os.environ["WP_BASE"].rstrip("/")
 WP_USER = os.environ["WP_USER"]
 WP_APP_PASSWORD = os.environ["WP_APP_PASSWORD"]
@@ -91,12 +94,7 @@ def create_post_if_not_exists(slug: str, title: str, html: str, status: str, cat
 # ==========================
 # 追加：slug/title 安定化（最低限）
 # ==========================
-TRACK_SLUG = {
-    "門別": "monbetsu", "盛岡": "morioka", "水沢": "mizusawa", "浦和": "urawa",
-    "船橋": "funabashi", "大井": "ooi", "川崎": "kawasaki", "金沢": "kanazawa",
-    "笠松": "kasamatsu", "名古屋": "nagoya", "園田": "sonoda", "姫路": "himeji",
-    "高知": "kochi", "佐賀": "saga",
-}
+TRACK_SLUG = T.TRACK_SLUG
 
 def ymd_dot(yyyymmdd: str) -> str:
     s = re.sub(r"\D", "", str(yyyymmdd or ""))
@@ -121,29 +119,35 @@ def safe_track_slug(place: str, place_code: str = "") -> str:
 def main():
     # MODEで対象ファイルを決める
     if MODE == "predict":
-        prefix = "predict_"
         slug_prefix = "predict"
         category_slug = "keiba-predict"
         category_name = "地方競馬予想"
         mode_label = "予想"
+        kind = "predict"
     else:
-        prefix = "result_"
         slug_prefix = "result"
         category_slug = "keiba-result"
         category_name = "地方競馬結果"
         mode_label = "結果"
+        kind = "result"
 
-    # ★DATEが指定されている場合は、その日付のファイルだけ投稿する
+    # ★対象は output/manifest_{DATE}.json に載っている開催場だけ（output/ は glob しない・JSON も開かない）
+    # DATE が空なら latest_local_{predict|result}.json の日付
     DATE = re.sub(r"\D", "", os.environ.get("DATE", "").strip())
-    pattern = f"output/{prefix}{DATE}_*.json" if DATE else f"output/{prefix}*.json"
-    files = sorted(glob.glob(pattern))
-    print(f"[DEBUG] DATE={DATE!r} pattern={pattern}")
-
-    if not files:
-        print(f"[SKIP] output に {pattern} が見つかりません（まだデータが出てないので終了）")
+    if not DATE:
+        try:
+            with open(f"output/latest_local_{kind}.json", encoding="utf-8") as f:
+                DATE = re.sub(r"\D", "", str(json.load(f).get("date") or ""))
+        except (OSError, ValueError):
+            DATE = ""
+    entries = MF.ok_tracks(DATE, kind) if DATE else []
+    print(f"[DEBUG] DATE={DATE!r} manifest={MF.manifest_path(DATE).as_posix() if DATE else None}")
+
+    if not entries:
+        print(f"[SKIP] manifest に {kind} の開催場がありません（まだデータが出てないので終了） DATE={DATE!r}")
         return
 
-    print(f"[DEBUG] files = {files}")
+    print(f"[DEBUG] tracks = {[e['place'] for e in entries]}")
 
     category_id = get_category_id(category_slug, category_name)
     print(f"[DEBUG] category_slug={category_slug} category_name={category_name} category_id={category_id}")
@@ -153,21 +157,22 @@ def main():
         raise SystemExit(f"[FATAL] category not found: slug={category_slug} name={category_name}")
 
     # 全部投稿（開催場ぶん）
-    for json_path in files:
-        with open(json_path, encoding="utf-8") as f:
-            data = json.load(f)
-
-        date = data.get("date")              # yyyymmdd
-        place = data.get("place") or data.get("track") or data.get("venue")
-        place_code = data.get("place_code") or data.get("track_code") or ""
+    for e in entries:
+        json_path = e["json"]
+        date = DATE
+        place = e["place"]
+        place_code = e.get("place_code") or ""
 
-        html_path = json_path.replace(".json", ".html")
+        html_path = e.get("html") or ""
         try:
             with open(html_path, encoding="utf-8") as f:
                 html = f.read()
         except FileNotFoundError:
-            print(f"[SKIP] html not found: {html_path} (jsonだけあるので投稿せずスキップ)")
+            print(f"[SKIP] html not found: {html_path} (manifest にあるが html が無いので投稿せずスキップ)")
             continue
+        want = (e.get("sha1") or {}).get("html")
+        if want and want != MF.sha1_file(html_path):
+            print(f"[WARN] html changed after manifest was written: {html_path}")
 
         track_slug = safe_track_slug(place, place_code)
         date_num = re.sub(r"\D", "", str(date or ""))